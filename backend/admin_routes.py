@@ -0,0 +1,89 @@
+from flask import Blueprint, Response, current_app, request, jsonify
+from functools import wraps
+import os
+import secrets
+
+import profiling
+from db import services
+
+# Initialize Blueprint
+admin_bp = Blueprint('admin_bp', __name__)
+
+MAX_PROFILE_SECONDS = 3600
+
+def admin_required(view):
+    """Operator endpoints: X-Admin-Token must match SHAKUNI_ADMIN_TOKEN; disabled when it is unset."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = os.environ.get("SHAKUNI_ADMIN_TOKEN")
+        if not token:
+            return jsonify({"error": "Admin API is disabled (SHAKUNI_ADMIN_TOKEN is not set)"}), 404
+        if not secrets.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+            return jsonify({"error": "Invalid admin token"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route('/slow-requests', methods=['GET'])
+@admin_required
+def get_slow_requests():
+    """This worker's slowest requests with their timing breakdowns, slowest first."""
+    return jsonify({"worker": os.getpid(), "requests": profiling.slow_requests.entries()}), 200
+
+@admin_bp.route('/slow-requests', methods=['DELETE'])
+@admin_required
+def clear_slow_requests():
+    profiling.slow_requests.clear()
+    return jsonify({"message": "Slow request log cleared", "worker": os.getpid()}), 200
+
+@admin_bp.route('/pipeline', methods=['GET'])
+@admin_required
+def get_pipeline_status():
+    """Throughput, lag, per-stage timings and checkpoints of this worker's enrichment pipeline, for all users."""
+    return jsonify(services.enrichment_pipeline.status()), 200
+
+@admin_bp.route('/profiler', methods=['GET'])
+@admin_required
+def get_profiler():
+    return jsonify(services.profiler.status()), 200
+
+@admin_bp.route('/profiler', methods=['POST'])
+@admin_required
+def enable_profiler():
+    """
+    Sample a fraction of requests to some routes for a while.
+
+    Body: routes (route patterns as in /metrics, e.g. "/api/logs/ingest"; empty for all),
+    sample_rate (0-1, default 0.1), duration_seconds (default 300, at most 3600) and
+    interval_ms (stack sampling period, default 5).
+    """
+    data = request.get_json() or {}
+    routes = data.get('routes') or []
+    known = {rule.rule for rule in current_app.url_map.iter_rules()}
+    unknown = [route for route in routes if route not in known]
+    if unknown:
+        return jsonify({"error": f"Unknown routes: {', '.join(map(str, unknown))}"}), 400
+    try:
+        sample_rate = float(data.get('sample_rate', 0.1))
+        duration = int(data.get('duration_seconds', 300))
+        interval_ms = int(data.get('interval_ms', profiling.DEFAULT_SAMPLE_INTERVAL_MS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "sample_rate, duration_seconds and interval_ms must be numbers"}), 400
+    if not 0 < sample_rate <= 1 or not 0 < duration <= MAX_PROFILE_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({"error": f"Need 0 < sample_rate <= 1, 0 < duration_seconds <= {MAX_PROFILE_SECONDS} "
+                                 "and 1 <= interval_ms <= 1000"}), 400
+
+    config = services.profiler.enable(routes, sample_rate, duration, interval_ms)
+    # Other workers pick the configuration up within PROFILER_POLL_SECONDS
+    return jsonify({"message": "Profiler enabled", "config": config}), 200
+
+@admin_bp.route('/profiler', methods=['DELETE'])
+@admin_required
+def disable_profiler():
+    services.profiler.disable()
+    return jsonify({"message": "Profiler disabled"}), 200
+
+@admin_bp.route('/profiler/stacks', methods=['GET'])
+@admin_required
+def get_profiler_stacks():
+    """Collapsed stacks of a session (default: the current one), for flamegraph.pl or speedscope."""
+    return Response(services.profiler.collapsed(request.args.get('session')), mimetype='text/plain')
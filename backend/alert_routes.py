@@ -0,0 +1,310 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import CursorNotFound, AutoReconnect, OperationFailure
+from datetime import datetime
+import csv
+import io
+import json
+import logging
+import zlib
+
+from db import services
+
+log = logging.getLogger(__name__)
+
+# Initialize Blueprint
+alert_bp = Blueprint('alert_bp', __name__)
+
+# Rows are buffered up to this many bytes before a chunk is yielded to the client
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Documents fetched from Mongo per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+# How many times an export re-opens its cursor after losing it mid-stream
+EXPORT_MAX_CURSOR_RETRIES = 5
+
+# Columns written when exporting as CSV; raw_message and any nested data is JSON encoded
+EXPORT_CSV_FIELDS = [
+    "_id", "received_at", "user_id", "type", "source",
+    "ip_address", "x_forwarded_for", "user_agent", "raw_message"
+]
+
+# Page size limits for the search endpoint
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+
+# --- Helper functions ---
+def resolve_alert_kind(name):
+    """Map the public collection name used by the API onto an alert store kind."""
+    kinds = {
+        "cloud": "cloud_alerts",
+        "cloud_alerts": "cloud_alerts",
+        "generic": "generic_alerts",
+        "generic_alerts": "generic_alerts",
+    }
+    return kinds.get(name)
+
+def parse_iso_datetime(value):
+    if not value:
+        return None
+    # Accept the trailing 'Z' the frontend and most SIEMs emit
+    if value.endswith('Z'):
+        value = value[:-1]
+    return datetime.fromisoformat(value)
+
+def parse_export_cursor(value):
+    """A resume cursor is '<received_at ISO>|<_id>' taken from the last row a client received."""
+    if not value:
+        return None
+    received_at, _, alert_id = value.partition('|')
+    return parse_iso_datetime(received_at), ObjectId(alert_id)
+
+def format_cursor(alert):
+    return f"{json_default(alert.get('received_at'))}|{alert['_id']}"
+
+def keyset_clause(after, descending=False):
+    """Build the filter that continues a (received_at, _id) ordered scan past the given key."""
+    after_time, after_id = after
+    op = "$lt" if descending else "$gt"
+    return [
+        {"received_at": {op: after_time}},
+        {"received_at": after_time, "_id": {op: after_id}},
+    ]
+
+def json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+def add_time_range(query, start, end):
+    if start or end:
+        query["received_at"] = {}
+        if start:
+            query["received_at"]["$gte"] = start
+        if end:
+            query["received_at"]["$lt"] = end
+    return query
+
+def serialize_alert(alert):
+    alert['_id'] = str(alert['_id'])
+    for field in ('received_at', 'event_time'):
+        if isinstance(alert.get(field), datetime):
+            alert[field] = alert[field].isoformat()
+    return alert
+
+def alert_to_csv_row(alert):
+    client_info = alert.get('client_info') or {}
+    raw_message = alert.get('raw_message')
+    return [
+        str(alert.get('_id', '')),
+        json_default(alert['received_at']) if alert.get('received_at') else '',
+        alert.get('user_id', ''),
+        alert.get('type', ''),
+        alert.get('source', ''),
+        client_info.get('ip_address', ''),
+        client_info.get('x_forwarded_for', ''),
+        client_info.get('user_agent', ''),
+        json.dumps(raw_message, default=json_default) if raw_message is not None else '',
+    ]
+
+def iter_alerts_keyset(alert_store, kind, base_query, after=None, limit=None):
+    """
+    Yield alerts ordered by (received_at, _id), re-opening the cursor from the last
+    yielded key if the server drops it so long exports survive cursor timeouts.
+    """
+    retries = 0
+    yielded = 0
+    while True:
+        query = dict(base_query)
+        if after:
+            query["$or"] = keyset_clause(after)
+        cursor = alert_store.find(kind, query).sort([("received_at", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit - yielded)
+        try:
+            for alert in cursor:
+                after = (alert.get('received_at'), alert['_id'])
+                yielded += 1
+                yield alert
+            return
+        except (CursorNotFound, AutoReconnect) as e:
+            retries += 1
+            if retries > EXPORT_MAX_CURSOR_RETRIES:
+                raise
+            log.warning("Export cursor lost after %s rows (%s); resuming from last key", yielded, e)
+        finally:
+            cursor.close()
+
+def encode_export(alerts, export_format):
+    """Serialize alerts into buffered text chunks of roughly EXPORT_CHUNK_SIZE bytes."""
+    buffer = io.StringIO()
+    if export_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_CSV_FIELDS)
+        for alert in alerts:
+            writer.writerow(alert_to_csv_row(alert))
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    else:
+        for alert in alerts:
+            buffer.write(json.dumps(alert, default=json_default))
+            buffer.write('\n')
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    # wbits=31 produces a gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+# --- Alert Routes ---
+
+@alert_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_alerts():
+    """
+    Stream alerts for the current user as NDJSON or CSV, optionally gzip compressed.
+
+    Query parameters: collection (cloud|generic), start/end (ISO 8601, on received_at),
+    format (ndjson|csv), gzip (true|false), limit, and cursor. Rows are ordered by
+    (received_at, _id); to resume an interrupted export pass cursor=<received_at>|<_id>
+    of the last row received.
+    """
+    current_user_id = get_jwt_identity()
+
+    collection_name = request.args.get('collection', 'cloud')
+    kind = resolve_alert_kind(collection_name)
+    if kind is None:
+        return jsonify({"error": f"Unknown collection '{collection_name}'. Use 'cloud' or 'generic'."}), 400
+
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "Format must be 'ndjson' or 'csv'."}), 400
+    use_gzip = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+
+    try:
+        start = parse_iso_datetime(request.args.get('start'))
+        end = parse_iso_datetime(request.args.get('end'))
+        after = parse_export_cursor(request.args.get('cursor'))
+        limit = int(request.args.get('limit', 0)) or None
+        if limit is not None and limit < 0:
+            raise ValueError("limit must not be negative")
+    except (ValueError, InvalidId):
+        return jsonify({"error": "Invalid start, end, cursor or limit parameter."}), 400
+
+    query = {"user_id": current_user_id}
+    add_time_range(query, start, end)
+
+    log.info("Starting %s export of %s alerts for user %s", export_format, collection_name, current_user_id)
+
+    chunks = encode_export(iter_alerts_keyset(services.alert_store, kind, query, after=after, limit=limit), export_format)
+    filename = f"{kind}.{export_format}"
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    else:
+        mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Keep reverse proxies from buffering the whole export in memory
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@alert_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_alerts():
+    """
+    Search the current user's alerts with the filters pushed down to Mongo.
+
+    Query parameters: collection (cloud|generic), type, source, ip, event_name,
+    user_arn, bucket, ua_class, exclude_ua_class (comma separated), start/end
+    (ISO 8601, on received_at), q (text term), limit and cursor. Results are
+    newest first; pass the returned next_cursor to fetch the following page.
+    In debug mode, explain=true adds the query plan and execution stats.
+    """
+    current_user_id = get_jwt_identity()
+
+    collection_name = request.args.get('collection', 'cloud')
+    kind = resolve_alert_kind(collection_name)
+    if kind is None:
+        return jsonify({"error": f"Unknown collection '{collection_name}'. Use 'cloud' or 'generic'."}), 400
+
+    try:
+        start = parse_iso_datetime(request.args.get('start'))
+        end = parse_iso_datetime(request.args.get('end'))
+        after = parse_export_cursor(request.args.get('cursor'))
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except (ValueError, InvalidId):
+        return jsonify({"error": "Invalid start, end, cursor or limit parameter."}), 400
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    query = {"user_id": current_user_id}
+    add_time_range(query, start, end)
+
+    if request.args.get('type'):
+        query["type"] = request.args['type']
+    if request.args.get('source'):
+        query["source"] = request.args['source']
+    # Payload-specific fields are matched on the flat, indexed normalized subdocument
+    for param, field in (('ip', 'source_ip'), ('event_name', 'event_name'), ('user_arn', 'user_arn'),
+                         ('bucket', 'bucket_name'), ('ua_class', 'ua_class')):
+        if request.args.get(param):
+            query[f"normalized.{field}"] = request.args[param]
+    # e.g. exclude_ua_class=link_preview drops mail and chat link-preview fetches of decoys
+    if request.args.get('exclude_ua_class') and not request.args.get('ua_class'):
+        query["normalized.ua_class"] = {"$nin": request.args['exclude_ua_class'].split(',')}
+    if request.args.get('q'):
+        if not services.alert_store.supports_text_search:
+            return jsonify({"error": "Text search is not supported by the configured alert store."}), 400
+        query["$text"] = {"$search": request.args['q']}
+    if after:
+        query["$or"] = keyset_clause(after, descending=True)
+
+    # Fetch one extra row to know whether another page exists without counting
+    cursor = services.alert_store.find(kind, query).sort([("received_at", -1), ("_id", -1)]).limit(limit + 1)
+
+    try:
+        alerts = list(cursor)
+    except OperationFailure as e:
+        log.error("Alert search failed for user %s: %s", current_user_id, e)
+        return jsonify({"error": "Failed to search alerts"}), 500
+
+    next_cursor = None
+    if len(alerts) > limit:
+        alerts = alerts[:limit]
+        next_cursor = format_cursor(alerts[-1])
+
+    response = {
+        "results": [serialize_alert(alert) for alert in alerts],
+        "next_cursor": next_cursor,
+    }
+
+    if current_app.debug and request.args.get('explain', 'false').lower() in ('1', 'true', 'yes'):
+        plan = cursor.clone().explain()
+        stats = plan.get("executionStats", {})
+        response["explain"] = {
+            "winning_plan": plan.get("queryPlanner", {}).get("winningPlan"),
+            "execution_time_ms": stats.get("executionTimeMillis"),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "returned": stats.get("nReturned"),
+        }
+
+    return jsonify(response), 200
@@ -0,0 +1,316 @@
+from pymongo import IndexModel, ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+import logging
+import os
+import secrets
+import socket
+import threading
+
+from sketches import HyperLogLog, SpaceSaving
+
+log = logging.getLogger(__name__)
+
+# Dimensions tracked with a top-k sketch for every deployment
+TOP_DIMENSIONS = ["ip", "user_agent", "path", "country", "asn"]
+
+# Items tracked per top-k sketch; larger than the 50 served to keep the top accurate
+TOP_CAPACITY = 200
+
+STATS_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("day", ASCENDING), ("deployment", ASCENDING)], name="user_day_deployment"),
+    IndexModel([("worker_id", ASCENDING)], name="worker_id"),
+]
+
+# A worker whose last heartbeat is older than this is considered stopped and compacted
+STATS_WORKER_TIMEOUT_SECONDS = int(os.environ.get("STATS_WORKER_TIMEOUT_SECONDS", 900))
+COMPACTED_WORKER_ID = "compacted"
+# How long a worker remembers that it dropped a past day from memory
+EVICTED_RETENTION_DAYS = 7
+
+def alert_deployment(alert):
+    """The honeypot an alert belongs to: its GET `type`, or the normalized payload kind."""
+    return alert.get("type") or (alert.get("normalized") or {}).get("kind") or "unknown"
+
+def alert_dimensions(alert):
+    normalized = alert.get("normalized") or {}
+    path = None
+    if normalized.get("bucket_name"):
+        path = f"{normalized['bucket_name']}/{normalized.get('object_key') or ''}"
+    elif normalized.get("event_name"):
+        path = normalized["event_name"]
+    geo = alert.get("geo") or {}
+    return {
+        "ip": normalized.get("source_ip"),
+        "user_agent": normalized.get("user_agent"),
+        "path": path,
+        "country": geo.get("country"),
+        "asn": f"{geo['asn']} {geo.get('org') or ''}".strip() if geo.get("asn") else None,
+    }
+
+
+class DeploymentSketch:
+    """Per (user, deployment, day) sketches: top-k per dimension plus distinct source IPs."""
+
+    def __init__(self, top=None, attackers=None, total=0):
+        self.top = top or {dimension: SpaceSaving(TOP_CAPACITY) for dimension in TOP_DIMENSIONS}
+        self.attackers = attackers or HyperLogLog()
+        self.total = total
+
+    def observe(self, dimensions):
+        self.total += 1
+        for dimension, value in dimensions.items():
+            if value:
+                self.top.setdefault(dimension, SpaceSaving(TOP_CAPACITY)).add(value)
+        if dimensions.get("ip"):
+            self.attackers.add(dimensions["ip"])
+
+    def merge(self, other):
+        for dimension, sketch in other.top.items():
+            if dimension in self.top:
+                self.top[dimension].merge(sketch)
+            else:
+                self.top[dimension] = SpaceSaving.from_dict(sketch.to_dict())
+        self.attackers.merge(other.attackers)
+        self.total += other.total
+        return self
+
+    def to_dict(self):
+        return {
+            "top": {dimension: sketch.to_dict() for dimension, sketch in self.top.items()},
+            "attackers": self.attackers.to_dict(),
+            "total": self.total,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            top={dimension: SpaceSaving.from_dict(sketch) for dimension, sketch in data["top"].items()},
+            attackers=HyperLogLog.from_dict(data["attackers"]),
+            total=data.get("total", 0),
+        )
+
+
+class StatsAggregator:
+    """
+    Keeps deployment sketches in memory at ingest and checkpoints them to Mongo.
+
+    Each worker writes its own document per (user, deployment, day), so readers merge
+    the per-worker documents instead of workers coordinating on writes. Workers record
+    a heartbeat with every checkpoint; compact() folds the documents of workers that
+    stopped (recycled, reloaded or crashed) into one document per key, so the number of
+    documents a read merges stays bounded by the number of live workers.
+    """
+
+    def __init__(self, stats_collection, workers_collection):
+        self.stats = stats_collection
+        self.workers = workers_collection
+        self.worker_id = self._new_worker_id()
+        self._registered = False
+        # (user_id, deployment, day) -> DeploymentSketch
+        self.sketches = {}
+        self._dirty = set()
+        # Past-day keys dropped from memory; their checkpoint is the only copy
+        self._evicted = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_worker_id():
+        return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+    @staticmethod
+    def _document_id(key, worker_id):
+        user_id, deployment, day = key
+        return f"{user_id}:{deployment}:{day}:{worker_id}"
+
+    def ensure_indexes(self):
+        self.stats.create_indexes(STATS_INDEXES)
+
+    def observe(self, alert):
+        user_id = alert.get("user_id")
+        received_at = alert.get("received_at") or datetime.now()
+        if not user_id:
+            return
+        key = (user_id, alert_deployment(alert), received_at.date().isoformat())
+        dimensions = alert_dimensions(alert)
+        with self._lock:
+            sketch = self.sketches.get(key)
+            if sketch is None:
+                sketch = self.sketches[key] = DeploymentSketch()
+            sketch.observe(dimensions)
+            self._dirty.add(key)
+
+    def _heartbeat(self):
+        """Mark this worker alive; False when compact() has already folded its documents."""
+        if not self._registered:
+            self.workers.update_one({"_id": self.worker_id}, {"$set": {"heartbeat_at": datetime.now()}}, upsert=True)
+            self._registered = True
+            return True
+        result = self.workers.update_one({"_id": self.worker_id, "compacting_by": {"$exists": False}},
+                                         {"$set": {"heartbeat_at": datetime.now()}})
+        return result.matched_count == 1
+
+    def _restart_after_compaction(self):
+        # Our checkpoints now live in the compacted documents; writing the cumulative
+        # sketches again would count them twice, so start over under a new id
+        log.warning("Stats of worker %s were compacted while it was running; starting a new sketch set", self.worker_id)
+        with self._lock:
+            self.sketches = {}
+            self._dirty = set()
+            self._evicted = set()
+            self.worker_id = self._new_worker_id()
+            self._registered = False
+
+    def checkpoint(self):
+        """Write changed sketches to Mongo and drop finished days from memory."""
+        try:
+            if not self._heartbeat():
+                self._restart_after_compaction()
+                return 0
+        except Exception as e:
+            log.error("Error recording stats heartbeat: %s", e)
+            return 0
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            revived = [key for key in dirty if key in self._evicted]
+        try:
+            # A late alert for an evicted day starts from an empty sketch; fold the
+            # persisted copy back in so the checkpoint does not overwrite it
+            for key in revived:
+                document = self.stats.find_one({"_id": self._document_id(key, self.worker_id)}, {"sketch": 1})
+                with self._lock:
+                    if document:
+                        self.sketches[key].merge(DeploymentSketch.from_dict(document["sketch"]))
+                    self._evicted.discard(key)
+        except Exception as e:
+            log.error("Error restoring alert stats: %s", e)
+            with self._lock:
+                self._dirty |= dirty
+            return 0
+
+        with self._lock:
+            snapshot = {key: self.sketches[key].to_dict() for key in dirty}
+            today = datetime.now().date()
+            for key in [key for key in self.sketches if key[2] < today.isoformat() and key not in self._dirty | dirty]:
+                del self.sketches[key]
+                self._evicted.add(key)
+            forgotten = (today - timedelta(days=EVICTED_RETENTION_DAYS)).isoformat()
+            self._evicted = {key for key in self._evicted if key[2] >= forgotten}
+        if not snapshot:
+            return 0
+
+        operations = [
+            UpdateOne(
+                {"_id": self._document_id((user_id, deployment, day), self.worker_id)},
+                {"$set": {
+                    "user_id": user_id, "deployment": deployment, "day": day,
+                    "worker_id": self.worker_id, "sketch": data, "updated_at": datetime.now(),
+                }},
+                upsert=True
+            )
+            for (user_id, deployment, day), data in snapshot.items()
+        ]
+        try:
+            self.stats.bulk_write(operations, ordered=False)
+        except Exception as e:
+            log.error("Error checkpointing alert stats: %s", e)
+            with self._lock:
+                self._dirty |= set(snapshot)
+            return 0
+        return len(operations)
+
+    def retire(self):
+        """Let compact() fold this worker's documents right away; call after the final checkpoint."""
+        try:
+            self.workers.update_one({"_id": self.worker_id}, {"$set": {"heartbeat_at": datetime.fromtimestamp(0)}})
+        except Exception as e:
+            log.error("Error retiring stats worker %s: %s", self.worker_id, e)
+
+    def merged(self, user_id, day, deployment=None):
+        """Merge the checkpoints of every worker with this worker's live sketches."""
+        query = {"user_id": user_id, "day": day}
+        if deployment:
+            query["deployment"] = deployment
+        result = DeploymentSketch()
+        with self._lock:
+            # Live sketches already contain everything this worker checkpointed for them
+            live = {key: sketch for key, sketch in self.sketches.items()
+                    if key[0] == user_id and key[2] == day and (not deployment or key[1] == deployment)}
+            revived = {key for key in live if key in self._evicted}
+            worker_id = self.worker_id
+        for document in self.stats.find(query, {"sketch": 1, "worker_id": 1, "deployment": 1}):
+            key = (user_id, document["deployment"], day)
+            if document["worker_id"] == worker_id and key in live and key not in revived:
+                continue
+            result.merge(DeploymentSketch.from_dict(document["sketch"]))
+        with self._lock:
+            for sketch in live.values():
+                result.merge(sketch)
+        return result
+
+    # --- Compaction ---
+    def compact(self):
+        """Fold the documents of stopped workers into one compacted document per key."""
+        cutoff = datetime.now() - timedelta(seconds=STATS_WORKER_TIMEOUT_SECONDS)
+        try:
+            worker_ids = set(self.stats.distinct("worker_id")) - {COMPACTED_WORKER_ID}
+            alive = {document["_id"] for document in self.workers.find(
+                {"_id": {"$in": list(worker_ids)}, "heartbeat_at": {"$gte": cutoff}}, {"_id": 1})}
+            compacted = 0
+            for worker_id in worker_ids - alive:
+                if self._claim(worker_id, cutoff):
+                    compacted += self._compact_worker(worker_id)
+            # Heartbeats of workers that stopped without writing any stats
+            self.workers.delete_many({"heartbeat_at": {"$lt": cutoff}, "_id": {"$nin": list(worker_ids)}})
+            return compacted
+        except Exception as e:
+            log.error("Error compacting alert stats: %s", e)
+            return 0
+
+    def _claim(self, worker_id, cutoff):
+        """Take a stopped worker's documents; only one compactor wins, and a crashed one's claim expires."""
+        try:
+            result = self.workers.update_one(
+                {"_id": worker_id, "heartbeat_at": {"$lt": cutoff}},
+                {"$set": {"heartbeat_at": datetime.now(), "compacting_by": self.worker_id}},
+                upsert=True  # Workers from before heartbeats were recorded have none
+            )
+        except DuplicateKeyError:
+            return False  # Alive again, or claimed by another worker
+        return result.matched_count == 1 or result.upserted_id is not None
+
+    def _compact_worker(self, worker_id):
+        folded = 0
+        for document in self.stats.find({"worker_id": worker_id}):
+            key = (document["user_id"], document["deployment"], document["day"])
+            target_id = self._document_id(key, COMPACTED_WORKER_ID)
+            # Optimistic concurrency on "version"; merged_from makes a retried fold a no-op
+            while True:
+                target = self.stats.find_one({"_id": target_id})
+                if target and document["_id"] in target.get("merged_from", []):
+                    break
+                sketch = DeploymentSketch.from_dict(target["sketch"]) if target else DeploymentSketch()
+                sketch.merge(DeploymentSketch.from_dict(document["sketch"]))
+                fields = {
+                    "user_id": key[0], "deployment": key[1], "day": key[2], "worker_id": COMPACTED_WORKER_ID,
+                    "sketch": sketch.to_dict(), "updated_at": datetime.now(),
+                }
+                if target is None:
+                    try:
+                        self.stats.insert_one(dict(fields, _id=target_id, version=1, merged_from=[document["_id"]]))
+                        break
+                    except DuplicateKeyError:
+                        continue
+                result = self.stats.update_one(
+                    {"_id": target_id, "version": target["version"]},
+                    {"$set": dict(fields, version=target["version"] + 1), "$push": {"merged_from": document["_id"]}}
+                )
+                if result.matched_count:
+                    break
+            self.stats.delete_one({"_id": document["_id"]})
+            folded += 1
+        self.workers.delete_one({"_id": worker_id})
+        if folded:
+            log.info("Compacted %s stats documents of stopped worker %s", folded, worker_id)
+        return folded
@@ -0,0 +1,197 @@
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import CollectionInvalid
+import logging
+
+from normalizers import NORMALIZED_INDEXES, NORMALIZED_INDEXED_FIELDS
+
+log = logging.getLogger(__name__)
+
+# Alert kinds map onto the original collection names so existing data keeps its meaning
+ALERT_KINDS = ["cloud_alerts", "generic_alerts"]
+
+# Name of the single collection used by the time-series store
+TIMESERIES_COLLECTION = "alerts"
+# The enrichment pipeline updates measurement fields (enrichment_status, normalized, geo,
+# incident_id), which time-series collections only accept from MongoDB 7.0
+TIMESERIES_MIN_SERVER_VERSION = (7, 0)
+
+# Indexes shared by cloud_alerts and generic_alerts. Every read is scoped to a user,
+# so user_id leads each index and received_at trails it to serve the newest-first sort.
+ALERT_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("received_at", ASCENDING), ("_id", ASCENDING)], name="user_received_at"),
+    IndexModel([("user_id", ASCENDING), ("type", ASCENDING), ("received_at", DESCENDING)], name="user_type_received_at"),
+    IndexModel([("user_id", ASCENDING), ("source", ASCENDING), ("received_at", DESCENDING)], name="user_source_received_at"),
+    # A collection can only have one text index; the user_id prefix keeps text searches per user
+    IndexModel([
+        ("user_id", ASCENDING),
+        ("raw_message.detail.eventName", TEXT),
+        ("raw_message.detail.userIdentity.arn", TEXT),
+        ("raw_message.description", TEXT),
+        ("client_info.user_agent", TEXT),
+        ("type", TEXT),
+        ("source", TEXT),
+    ], name="user_alert_text"),
+] + NORMALIZED_INDEXES
+
+def ensure_alert_indexes(collection):
+    collection.create_indexes(ALERT_INDEXES)
+
+
+class CollectionAlertStore:
+    """Default store: one general-purpose collection per alert kind."""
+
+    supports_text_search = True
+    supports_partial_indexes = True
+
+    def __init__(self, db):
+        self.collections = {kind: db[kind] for kind in ALERT_KINDS}
+
+    def ensure_indexes(self):
+        for collection in self.collections.values():
+            ensure_alert_indexes(collection)
+
+    def collection(self, kind):
+        return self.collections[kind]
+
+    def translate_query(self, kind, query):
+        return query
+
+    def insert_one(self, kind, alert):
+        return self.collections[kind].insert_one(alert)
+
+    def insert_many(self, kind, alerts, ordered=False):
+        return self.collections[kind].insert_many(alerts, ordered=ordered)
+
+    def find(self, kind, query):
+        return self.collections[kind].find(query)
+
+
+class TimeSeriesCursor:
+    """Wraps a pymongo cursor over the time-series collection and restores the original alert shape."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __iter__(self):
+        for alert in self._cursor:
+            yield TimeSeriesAlertStore.from_document(alert)
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # Chained calls (sort, limit, batch_size, clone) must stay wrapped
+            if result is self._cursor or type(result) is type(self._cursor):
+                return TimeSeriesCursor(result)
+            return result
+        return wrapper
+
+
+class TimeSeriesAlertStore:
+    """
+    Stores every alert kind in one MongoDB time-series collection (MongoDB 7.0+).
+
+    received_at is the time field and {user_id, type, kind} the metadata field, so
+    buckets are grouped per user and honeypot type. Documents read back through
+    this store have the same shape as those in the original collections.
+
+    Enrichment writes its results onto the stored alerts; MongoDB 5.0-6.x only allows
+    updates that filter on and modify the metadata field, so every enrichment batch
+    would fail there. The store refuses to start on those servers.
+    """
+
+    # Time-series collections do not support text indexes, nor partial filters on measurements
+    supports_text_search = False
+    supports_partial_indexes = False
+
+    # Top-level alert fields that live under the metadata field
+    META_FIELDS = {"user_id": "meta.user_id", "type": "meta.type"}
+
+    INDEXES = [
+        IndexModel([("meta.user_id", ASCENDING), ("meta.kind", ASCENDING), ("received_at", DESCENDING)], name="meta_user_kind_received_at"),
+        IndexModel([("meta.user_id", ASCENDING), ("meta.kind", ASCENDING), ("meta.type", ASCENDING), ("received_at", DESCENDING)], name="meta_user_kind_type_received_at"),
+    ] + [
+        IndexModel([("meta.user_id", ASCENDING), (f"normalized.{field}", ASCENDING), ("received_at", DESCENDING)], name=f"meta_user_normalized_{field}_received_at")
+        for field in NORMALIZED_INDEXED_FIELDS
+    ]
+
+    def __init__(self, db, collection_name=TIMESERIES_COLLECTION, granularity="seconds"):
+        version = tuple(db.client.server_info().get("versionArray", [0])[:2])
+        if version < TIMESERIES_MIN_SERVER_VERSION:
+            raise RuntimeError(
+                f"ALERT_STORE=timeseries needs MongoDB {'.'.join(map(str, TIMESERIES_MIN_SERVER_VERSION))} or newer "
+                f"(server is {'.'.join(map(str, version))}); use ALERT_STORE=collections"
+            )
+        try:
+            db.create_collection(
+                collection_name,
+                timeseries={"timeField": "received_at", "metaField": "meta", "granularity": granularity}
+            )
+            log.info("Created time-series collection '%s' for alerts", collection_name)
+        except CollectionInvalid:
+            # Already exists
+            pass
+        self._collection = db[collection_name]
+
+    def ensure_indexes(self):
+        self._collection.create_indexes(self.INDEXES)
+
+    def collection(self, kind):
+        return self._collection
+
+    @staticmethod
+    def to_document(kind, alert):
+        document = dict(alert)
+        document["meta"] = {
+            "user_id": document.pop("user_id", None),
+            "type": document.pop("type", None),
+            "kind": kind,
+        }
+        return document
+
+    @staticmethod
+    def from_document(document):
+        meta = document.pop("meta", None) or {}
+        document["user_id"] = meta.get("user_id")
+        if meta.get("type") is not None:
+            document["type"] = meta["type"]
+        return document
+
+    def translate_query(self, kind, query):
+        """Rewrite a filter written against the original collections for the time-series layout."""
+        translated = {}
+        for key, value in query.items():
+            if key in ("$and", "$or", "$nor"):
+                translated[key] = [self.translate_query(None, clause) for clause in value]
+            else:
+                translated[self.META_FIELDS.get(key, key)] = value
+        if kind:
+            translated["meta.kind"] = kind
+        return translated
+
+    def insert_one(self, kind, alert):
+        result = self._collection.insert_one(self.to_document(kind, alert))
+        alert["_id"] = result.inserted_id
+        return result
+
+    def insert_many(self, kind, alerts, ordered=False):
+        documents = [self.to_document(kind, alert) for alert in alerts]
+        result = self._collection.insert_many(documents, ordered=ordered)
+        for alert, document in zip(alerts, documents):
+            alert["_id"] = document["_id"]
+        return result
+
+    def find(self, kind, query):
+        return TimeSeriesCursor(self._collection.find(self.translate_query(kind, query)))
+
+
+def create_alert_store(db, backend="collections"):
+    """Build the alert store selected by the ALERT_STORE setting ('collections' or 'timeseries')."""
+    if backend == "timeseries":
+        return TimeSeriesAlertStore(db)
+    if backend != "collections":
+        log.warning("Unknown alert store backend '%s', falling back to collections", backend)
+    return CollectionAlertStore(db)
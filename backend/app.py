@@ -1,68 +1,46 @@
+import time
+
+# Measured from the first line so cold-start import cost can be reported
+_PROCESS_STARTED = time.perf_counter()
+
 import secrets
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify, g
 from flask_cors import CORS # Remove cross_origin import again
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from pymongo import MongoClient
-import bcrypt
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from datetime import timedelta, datetime
 import re
-import subprocess
-import json
-import threading
-import atexit
 import logging
-import boto3
-from apscheduler.schedulers.background import BackgroundScheduler
-import json
 
 # Import Blueprints
-from terraform_routes import terraform_bp, parse_terraform_variables # Import parse_terraform_variables here
+from terraform_routes import terraform_bp
 from log_routes import log_bp
-
-# Basic logging configuration
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Import honeypot monitoring functions
-# from honeypot_monitor import start_monitoring, stop_monitoring, get_alerts, save_setting # Import save_setting
-
-# Initialize Flask app
-app = Flask(__name__)
-
-# Configure CORS to allow requests from frontend
-CORS(app, resources={r"/*": {"origins": "http://localhost:8080"}}, supports_credentials=True, methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'], allow_headers='*') # Allow OPTIONS and all headers
-
-# Configure JWT
-app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "dev-secret-key")  # Change in production
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=12)
-jwt = JWTManager(app)
-
-# Connect to MongoDB
-try:
-    mongo_uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017/shakuni")
-    client = MongoClient(mongo_uri)
-    db = client.shakuni
-    users_collection = db.users
-    settings_collection = db.settings
-    high_interaction_honeypot_state_file_collection = db.high_interaction_honeypot_state_file # New collection for web honeypot state
-    deployments_collection = db.deployments # New collection for deployment history
-    sqsurl_collection = db.sqsurl # New collection for SQS URLs
-    cloud_alerts_collection = db.cloud_alerts # New collection for Cloud Alerts
-    generic_alerts_collection = db.generic_alerts # New collection for Generic Alerts from GET requests
-    # Create unique index on email field
-    users_collection.create_index("email", unique=True)
-    print("Connected to MongoDB successfully!")
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
-
-# --- SQS Polling Function --- 
-# Removed poll_sqs_and_save function
-
-# --- Background Scheduler Setup ---
-# Removed scheduler setup and atexit registration
-
-# --- Honeypot Monitoring Setup ---
-# Removed honeypot setup code
+from alert_routes import alert_bp
+from incident_routes import incident_bp
+from stats_routes import stats_bp
+from dispatcher import validate_sink
+# Collections and background services are created lazily by the data-access layer
+from db import services
+from metrics import registry, HTTP_REQUEST_SECONDS
+from admin_routes import admin_bp
+import profiling
+import logging_config
+from auth import HasherBusy, LOGIN_ATTEMPTS
+
+log = logging.getLogger(__name__)
+
+_IMPORTS_DONE = time.perf_counter()
+# Filled in by create_app and the first request; reported by /api/health
+startup_timings = {}
+
+# Reverse proxies in front of the app. Each appends the address it received the request
+# from to X-Forwarded-For, so the client is that many hops from the end; with 0 the
+# header is ignored (a client can send anything in it)
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+
+# Routes not owned by a feature blueprint (auth, settings, alert lists)
+core_bp = Blueprint('core_bp', __name__)
 
 # Helper functions
 def is_valid_email(email):
@@ -73,8 +51,13 @@ def is_valid_password(password):
     # Password should be at least 8 characters with at least one number and one letter
     return len(password) >= 8 and any(c.isdigit() for c in password) and any(c.isalpha() for c in password)
 
+def _auth_busy():
+    response = jsonify({"error": "Too many logins in progress, try again shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # Routes
-@app.route('/api/register', methods=['POST'])
+@core_bp.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     
@@ -95,11 +78,15 @@ def register():
         return jsonify({"error": "Password must be at least 8 characters with at least one letter and one number"}), 400
     
     # Check if user already exists
-    if users_collection.find_one({"email": email}):
+    if services.users_collection.find_one({"email": email}):
         return jsonify({"error": "Email already registered"}), 409
     
     # Hash password
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    try:
+        with profiling.phase("auth"):
+            hashed_password = services.password_hasher.hash(password)
+    except HasherBusy:
+        return _auth_busy()
     
     # Create user document
     user = {
@@ -111,12 +98,12 @@ def register():
     
     # Insert user into database
     try:
-        users_collection.insert_one(user)
+        services.users_collection.insert_one(user)
         return jsonify({"message": "User registered successfully"}), 201
     except Exception as e:
         return jsonify({"error": f"Registration failed: {str(e)}"}), 500
 
-@app.route('/api/login', methods=['POST'])
+@core_bp.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     
@@ -126,12 +113,37 @@ def login():
     
     email = data['email']
     password = data['password']
+    ip = request.remote_addr
+
+    # Blocked accounts and IPs are turned away before any lookup or bcrypt work
+    retry_after = services.login_throttle.retry_after(email, ip)
+    if retry_after:
+        LOGIN_ATTEMPTS.inc("throttled")
+        response = jsonify({"error": "Too many failed login attempts, try again later"})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
     
     # Find user in database
-    user = users_collection.find_one({"email": email})
+    user = services.users_collection.find_one({"email": email})
     
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), user['password']):
+    # Unknown emails are checked against a dummy hash, so they take as long as wrong passwords
+    try:
+        with profiling.phase("auth"):
+            valid = services.password_hasher.verify(password, user['password'] if user else None)
+    except HasherBusy:
+        LOGIN_ATTEMPTS.inc("busy")
+        return _auth_busy()
+    if not valid:
+        LOGIN_ATTEMPTS.inc("invalid")
+        services.login_throttle.record_failure(email, ip)
         return jsonify({"error": "Invalid email or password"}), 401
+
+    LOGIN_ATTEMPTS.inc("success")
+    services.login_throttle.record_success(email)
+    if services.password_hasher.needs_rehash(user['password']):
+        # BCRYPT_ROUNDS changed since this hash was made; the login does not wait for the new one
+        services.password_hasher.rehash_in_background(password, lambda hashed: services.users_collection.update_one(
+            {"_id": user['_id'], "password": user['password']}, {"$set": {"password": hashed}}))
     
     # Create access token
     access_token = create_access_token(identity=str(user['_id']))
@@ -145,29 +157,23 @@ def login():
         }
     }), 200
 
-@app.route('/api/user', methods=['GET'])
+@core_bp.route('/api/user', methods=['GET'])
 @jwt_required()
 def get_user_profile():
     # Get user ID from JWT token
     current_user_id = get_jwt_identity()
     
-    # Find user in database
-    from bson.objectid import ObjectId
-    user = users_collection.find_one({"_id": ObjectId(current_user_id)})
+    # Cached profile view (id, username, email; never the password)
+    profile = services.user_cache.profile(current_user_id)
     
-    if not user:
+    if not profile["id"]:
         return jsonify({"error": "User not found"}), 404
     
-    # Return user data (excluding password)
-    return jsonify({
-        "id": str(user['_id']),
-        "username": user['username'],
-        "email": user['email']
-    }), 200
+    return jsonify(profile), 200
 
 
 
-@app.route('/api/settings', methods=['POST'])
+@core_bp.route('/api/settings', methods=['POST'])
 @jwt_required()
 def update_settings():
     user_id = get_jwt_identity()
@@ -194,7 +200,7 @@ def update_settings():
 
     # Update or insert general settings
     if general_update_data:
-        settings_collection.update_one(
+        services.settings_collection.update_one(
             {"user_id": user_id},
             {"$set": general_update_data},
             upsert=True
@@ -219,12 +225,15 @@ def update_settings():
 
     # Update or insert web honeypot settings
     if web_honeypot_update_data:
-        high_interaction_honeypot_state_file_collection.update_one(
+        services.high_interaction_honeypot_state_file_collection.update_one(
             {"user_id": user_id},
             {"$set": web_honeypot_update_data},
             upsert=True
         )
 
+    if general_update_data or web_honeypot_update_data:
+        services.user_cache.invalidate(user_id)
+
     # Check if at least one update occurred
     if not general_update_data and not web_honeypot_update_data:
          return jsonify({"message": "No valid settings provided for update"}), 400 # Or 200 with a different message
@@ -237,13 +246,13 @@ def update_settings():
 # Removed Terraform deploy/destroy/variables routes
 
 # Endpoint to get deployment history
-@app.route('/api/deployments/history', methods=['GET'])
+@core_bp.route('/api/deployments/history', methods=['GET'])
 @jwt_required()
 def get_deployment_history():
     current_user_id = get_jwt_identity()
     try:
         # Fetch history, sort by timestamp descending, limit results (e.g., 20)
-        history_cursor = deployments_collection.find({
+        history_cursor = services.deployments_collection.find({
             "user_id": current_user_id
         }).sort("timestamp", -1).limit(20)
 
@@ -256,29 +265,46 @@ def get_deployment_history():
 
         return jsonify(history), 200
     except Exception as e:
-        print(f"Error fetching deployment history: {e}")
+        log.error("Error fetching deployment history: %s", e)
         return jsonify({"error": "Failed to fetch deployment history."}), 500
 
 # Helper function to parse variables.tf
 # Moved parse_terraform_variables to terraform_routes.py, imported above
 
 # Health check endpoint
-@app.route('/api/health', methods=['GET'])
+@core_bp.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"}), 200
+    # A real round trip, bounded by MONGO_HEALTH_TIMEOUT_MS; 503 lets load balancers take the worker out
+    mongo = services.ping()
+    return jsonify({
+        "status": "healthy" if mongo["ok"] else "unhealthy",
+        "mongo": mongo,
+        "indexes_ready": services.indexes_ready.is_set(),
+        "index_error": services.index_error,
+        # Cold start and first-request latency of this worker, for autoscaling decisions
+        "startup": startup_timings,
+    }), 200 if mongo["ok"] else 503
+
+@core_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint; protected with a bearer token when METRICS_TOKEN is set."""
+    token = os.environ.get("METRICS_TOKEN")
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # --- Honeypot Alert Endpoint ---
 # Removed honeypot alert endpoint (assuming it was related to the removed monitor)
 
 # --- Cloud Alerts API Endpoint --- 
-@app.route('/api/alerts', methods=['GET'])
+@core_bp.route('/api/alerts', methods=['GET'])
 @jwt_required()
 def get_cloud_alerts():
     current_user_id = get_jwt_identity()
-    logging.debug(f"Fetching alerts for user_id: {current_user_id}")
+    log.debug("Fetching alerts for user_id: %s", current_user_id)
     try:
         # Fetch alerts sorted by received time, newest first
-        alerts = list(cloud_alerts_collection.find({"user_id": current_user_id}).sort("received_at", -1))
+        alerts = list(services.alert_store.find("cloud_alerts", {"user_id": current_user_id}).sort("received_at", -1))
 
         # Convert ObjectId to string for JSON serialization
         for alert in alerts:
@@ -292,25 +318,21 @@ def get_cloud_alerts():
             if isinstance(alert.get('raw_message'), datetime):
                  alert['raw_message'] = alert['raw_message'].isoformat()
 
-        logging.debug(f"Found {len(alerts)} alerts for user {current_user_id}")
+        log.debug("Found %s alerts for user %s", len(alerts), current_user_id)
         return jsonify(alerts), 200
     except Exception as e:
-        logging.error(f"Error fetching alerts for user {current_user_id}: {e}")
+        log.error("Error fetching alerts for user %s: %s", current_user_id, e)
         return jsonify({"error": "Failed to fetch alerts"}), 500
 
-# Register Blueprints
-app.register_blueprint(terraform_bp, url_prefix='/api/terraform')
-app.register_blueprint(log_bp, url_prefix='/api/logs')
-
 # --- Generic Alerts API Endpoint --- 
-@app.route('/api/generic-alerts', methods=['GET'])
+@core_bp.route('/api/generic-alerts', methods=['GET'])
 @jwt_required()
 def get_generic_alerts():
     current_user_id = get_jwt_identity()
-    logging.debug(f"Fetching generic alerts for user_id: {current_user_id}")
+    log.debug("Fetching generic alerts for user_id: %s", current_user_id)
     try:
         # Fetch alerts sorted by received time, newest first
-        alerts = list(generic_alerts_collection.find({"user_id": current_user_id}).sort("received_at", -1))
+        alerts = list(services.alert_store.find("generic_alerts", {"user_id": current_user_id}).sort("received_at", -1))
 
         # Convert ObjectId to string for JSON serialization
         for alert in alerts:
@@ -324,10 +346,10 @@ def get_generic_alerts():
             if isinstance(alert.get('raw_message'), datetime):
                  alert['raw_message'] = alert['raw_message'].isoformat()
 
-        logging.debug(f"Found {len(alerts)} generic alerts for user {current_user_id}")
+        log.debug("Found %s generic alerts for user %s", len(alerts), current_user_id)
         return jsonify(alerts), 200
     except Exception as e:
-        logging.error(f"Error fetching generic alerts for user {current_user_id}: {e}")
+        log.error("Error fetching generic alerts for user %s: %s", current_user_id, e)
         return jsonify({"error": "Failed to fetch generic alerts"}), 500
 
 # API Key generation function
@@ -338,17 +360,14 @@ def generate_api_key():
 # (The previous block already included the updated version)
 
 # API Key endpoints
-@app.route('/api/settings/api-keys', methods=['GET'])
+@core_bp.route('/api/settings/api-keys', methods=['GET'])
 @jwt_required()
 def get_user_api_keys():
     current_user_id = get_jwt_identity()
-    user_settings = settings_collection.find_one({"user_id": current_user_id}, {"api_keys": 1, "_id": 0})
-    api_keys = user_settings.get('api_keys', []) if user_settings else []
-    # Return only names and potentially a prefix/suffix of the key for security
-    keys_summary = [{'name': key['name'], 'key_preview': key['key'][:4] + '...' + key['key'][-4:]} for key in api_keys]
-    return jsonify(keys_summary), 200
+    # Only names and a prefix/suffix of each key are returned (and cached)
+    return jsonify(services.user_cache.settings(current_user_id)["api_keys"]), 200
 
-@app.route('/api/settings/api-key', methods=['POST'])
+@core_bp.route('/api/settings/api-key', methods=['POST'])
 @jwt_required()
 def generate_user_api_key():
     current_user_id = get_jwt_identity()
@@ -359,7 +378,7 @@ def generate_user_api_key():
         return jsonify({"error": "API key name is required"}), 400
 
     # Check if a key with the same name already exists for this user
-    existing_key = settings_collection.find_one({"user_id": current_user_id, "api_keys.name": key_name})
+    existing_key = services.settings_collection.find_one({"user_id": current_user_id, "api_keys.name": key_name})
     if existing_key:
         return jsonify({"error": f"An API key with the name '{key_name}' already exists"}), 409
 
@@ -368,19 +387,20 @@ def generate_user_api_key():
     new_key_entry = {"name": key_name, "key": api_key_value, "created_at": datetime.now()}
 
     # Add the new key to the user's api_keys list
-    result = settings_collection.update_one(
+    result = services.settings_collection.update_one(
         {"user_id": current_user_id},
         {"$push": {"api_keys": new_key_entry}},
         upsert=True  # Creates the document if user_id doesn't exist
     )
 
+    services.user_cache.invalidate(current_user_id)
     if result.acknowledged:
         # Return the full key upon creation for the user to copy
         return jsonify({"name": key_name, "api_key": api_key_value}), 201
     else:
         return jsonify({"error": "Failed to save API key"}), 500
 
-@app.route('/api/settings/api-key/<string:key_name>', methods=['DELETE'])
+@core_bp.route('/api/settings/api-key/<string:key_name>', methods=['DELETE'])
 @jwt_required()
 def delete_user_api_key(key_name):
     current_user_id = get_jwt_identity()
@@ -389,10 +409,11 @@ def delete_user_api_key(key_name):
         return jsonify({"error": "API key name is required"}), 400
 
     # Remove the API key entry matching the name from the user's api_keys list
-    result = settings_collection.update_one(
+    result = services.settings_collection.update_one(
         {"user_id": current_user_id},
         {"$pull": {"api_keys": {"name": key_name}}}
     )
+    services.user_cache.invalidate(current_user_id)
 
     if result.modified_count > 0:
         return jsonify({"message": f"API key '{key_name}' deleted successfully"}), 200
@@ -402,34 +423,163 @@ def delete_user_api_key(key_name):
         # This case might mean the user document itself doesn't exist, or just no matching key
         return jsonify({"error": f"API key '{key_name}' not found"}), 404
 
+# Alert sink endpoints
+@core_bp.route('/api/settings/alert-sinks', methods=['GET'])
+@jwt_required()
+def get_alert_sinks():
+    current_user_id = get_jwt_identity()
+    user_settings = services.settings_collection.find_one({"user_id": current_user_id}, {"alert_sinks": 1, "_id": 0})
+    return jsonify({
+        "sinks": user_settings.get('alert_sinks', []) if user_settings else [],
+        # Queue depth, delivery counters and breaker state from this worker's dispatcher
+        "status": services.alert_dispatcher.status(current_user_id),
+    }), 200
+
+@core_bp.route('/api/settings/alert-sink', methods=['POST'])
+@jwt_required()
+def save_alert_sink():
+    """Create or replace (by name) a webhook, syslog or file sink."""
+    current_user_id = get_jwt_identity()
+    sink = request.get_json() or {}
+    error = validate_sink(sink)
+    if error:
+        return jsonify({"error": error}), 400
+
+    services.settings_collection.update_one(
+        {"user_id": current_user_id},
+        {"$pull": {"alert_sinks": {"name": sink["name"]}}},
+        upsert=True
+    )
+    services.settings_collection.update_one(
+        {"user_id": current_user_id},
+        {"$push": {"alert_sinks": sink}}
+    )
+    services.alert_dispatcher.invalidate(current_user_id)
+    # The upsert may have created the user's settings document
+    services.user_cache.invalidate(current_user_id)
+    return jsonify({"message": f"Alert sink '{sink['name']}' saved successfully"}), 200
+
+@core_bp.route('/api/settings/alert-sink/<string:sink_name>', methods=['DELETE'])
+@jwt_required()
+def delete_alert_sink(sink_name):
+    current_user_id = get_jwt_identity()
+    result = services.settings_collection.update_one(
+        {"user_id": current_user_id},
+        {"$pull": {"alert_sinks": {"name": sink_name}}}
+    )
+    if result.modified_count > 0:
+        services.alert_dispatcher.invalidate(current_user_id)
+        return jsonify({"message": f"Alert sink '{sink_name}' deleted successfully"}), 200
+    return jsonify({"error": f"Alert sink '{sink_name}' not found"}), 404
+
 # Need to update the GET /api/settings endpoint as well
-@app.route('/api/settings', methods=['GET'])
+@core_bp.route('/api/settings', methods=['GET'])
 @jwt_required()
 def get_settings():
     user_id = get_jwt_identity()
     
-    # Fetch general settings
-    user_settings = settings_collection.find_one({"user_id": user_id})
-    # Fetch web honeypot settings
-    web_honeypot_settings = high_interaction_honeypot_state_file_collection.find_one({"user_id": user_id})
+    # Merged general and web honeypot settings, cached per user
+    cached = services.user_cache.settings(user_id)
+    general = cached["general"]
+    web_honeypot_settings = cached["web_honeypot"]
 
     # Prepare response data, combining both settings
     settings_data = {
         # General settings with defaults
-        "terraform_provider": user_settings.get("terraform_provider", "aws") if user_settings else "aws",
-        "terraform_s3_bucket": user_settings.get("terraform_s3_bucket", "") if user_settings else "",
-        "terraform_gcs_bucket": user_settings.get("terraform_gcs_bucket", "") if user_settings else "",
-        "terraform_azure_container": user_settings.get("terraform_azure_container", "") if user_settings else "",
+        "terraform_provider": general.get("terraform_provider", "aws"),
+        "terraform_s3_bucket": general.get("terraform_s3_bucket", ""),
+        "terraform_gcs_bucket": general.get("terraform_gcs_bucket", ""),
+        "terraform_azure_container": general.get("terraform_azure_container", ""),
         # Web honeypot settings with defaults
-        "web_honeypot_terraform_provider": web_honeypot_settings.get("web_honeypot_terraform_provider", "aws") if web_honeypot_settings else "aws",
-        "web_honeypot_terraform_s3_bucket": web_honeypot_settings.get("web_honeypot_terraform_s3_bucket", "") if web_honeypot_settings else "",
-        "web_honeypot_terraform_gcs_bucket": web_honeypot_settings.get("web_honeypot_terraform_gcs_bucket", "") if web_honeypot_settings else "",
-        "web_honeypot_terraform_azure_container": web_honeypot_settings.get("web_honeypot_terraform_azure_container", "") if web_honeypot_settings else "",
+        "web_honeypot_terraform_provider": web_honeypot_settings.get("web_honeypot_terraform_provider", "aws"),
+        "web_honeypot_terraform_s3_bucket": web_honeypot_settings.get("web_honeypot_terraform_s3_bucket", ""),
+        "web_honeypot_terraform_gcs_bucket": web_honeypot_settings.get("web_honeypot_terraform_gcs_bucket", ""),
+        "web_honeypot_terraform_azure_container": web_honeypot_settings.get("web_honeypot_terraform_azure_container", ""),
         # Include API keys summary (names and previews)
-        "api_keys": [{'name': key['name'], 'key_preview': key['key'][:4] + '...' + key['key'][-4:]} for key in user_settings.get('api_keys', [])] if user_settings else []
+        "api_keys": cached["api_keys"]
     }
     return jsonify(settings_data), 200
 
+def mark_process_start():
+    """Restart the first-request clock in a forked server worker (imports were paid by the parent)."""
+    global _PROCESS_STARTED
+    _PROCESS_STARTED = time.perf_counter()
+    startup_timings.pop("first_request_ms", None)
+    startup_timings.pop("first_request_after_start_ms", None)
+
+# --- Application Factory ---
+def create_app(start_background=True):
+    """Build the Flask app; MongoDB is only touched on first use and indexes are created in the background."""
+    started = time.perf_counter()
+    # Records go through a queue to a listener thread; see logging_config.py
+    logging_config.configure_logging()
+    app = Flask(__name__)
+    if TRUSTED_PROXY_HOPS:
+        # request.remote_addr (login throttling, callback client info) becomes the client's address
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS, x_host=TRUSTED_PROXY_HOPS)
+    # jsonify() time shows up as the `serialization` phase of request breakdowns
+    app.json = profiling.TimedJSONProvider(app)
+
+    # Configure CORS to allow requests from frontend
+    CORS(app, resources={r"/*": {"origins": "http://localhost:8080"}}, supports_credentials=True, methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'], allow_headers='*') # Allow OPTIONS and all headers
+
+    # Configure JWT
+    app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "dev-secret-key")  # Change in production
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=12)
+    JWTManager(app)
+
+    # Register Blueprints
+    app.register_blueprint(core_bp)
+    app.register_blueprint(terraform_bp, url_prefix='/api/terraform')
+    app.register_blueprint(log_bp, url_prefix='/api/logs')
+    app.register_blueprint(alert_bp, url_prefix='/api/alerts')
+    app.register_blueprint(incident_bp, url_prefix='/api/incidents')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+    @app.before_request
+    def _mark_request_start():
+        g.request_started = profiling.begin_request().started
+        # One attribute check unless an admin turned the profiler on
+        if services.profiler.should_sample(request.url_rule.rule if request.url_rule else None):
+            services.profiler.begin()
+            g.profiled = True
+
+    @app.after_request
+    def _record_first_request(response):
+        if "first_request_ms" not in startup_timings and "request_started" in g:
+            # Includes the lazy MongoDB client setup and pool's first connection
+            startup_timings["first_request_ms"] = round((time.perf_counter() - g.request_started) * 1000, 1)
+            startup_timings["first_request_after_start_ms"] = round((time.perf_counter() - _PROCESS_STARTED) * 1000, 1)
+            log.info("First request (%s) served in %s ms, %s ms after process start",
+                     request.path, startup_timings['first_request_ms'], startup_timings['first_request_after_start_ms'])
+        return response
+
+    @app.after_request
+    def _record_request_metrics(response):
+        if "request_started" in g:
+            # The route pattern, not the path, keeps label cardinality bounded
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            elapsed = time.perf_counter() - g.request_started
+            HTTP_REQUEST_SECONDS.observe(elapsed, request.method, route, str(response.status_code))
+            profiling.slow_requests.observe(request.method, route, response.status_code, elapsed, profiling.end_request())
+        return response
+
+    @app.teardown_request
+    def _end_profiling(exc):
+        if g.pop("profiled", False):
+            services.profiler.end()
+        profiling.end_request()
+
+    if start_background:
+        services.ensure_indexes_in_background()
+        services.start_background()
+
+    startup_timings["imports_ms"] = round((_IMPORTS_DONE - _PROCESS_STARTED) * 1000, 1)
+    startup_timings["create_app_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    log.info("App created in %s ms (imports took %s ms)", startup_timings['create_app_ms'], startup_timings['imports_ms'])
+    return app
+
 if __name__ == '__main__':
-    # Removed honeypot start monitoring call
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; production runs wsgi.py under gunicorn (see gunicorn.conf.py)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,174 @@
+"""
+Password hashing and login throttling.
+
+bcrypt runs on a small per-worker executor instead of on request threads. At most
+AUTH_HASH_QUEUE hashes may be running or waiting; past that, register and login answer
+503 at once instead of piling up. Unknown emails are checked against a dummy hash of
+the same cost, so a login takes as long whether or not the account exists. When
+BCRYPT_ROUNDS changes, a user's hash is replaced in the background on their next
+successful login.
+
+Failed logins are counted per account and per client IP in MongoDB, so every worker
+sees them. After LOGIN_MAX_FAILURES_ACCOUNT (or _IP) failures within
+LOGIN_FAILURE_WINDOW_SECONDS the key is blocked for a doubling delay, and logins are
+refused with 429 before any user lookup or bcrypt work.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from pymongo import IndexModel, ASCENDING, ReturnDocument
+import bcrypt
+import logging
+import math
+import os
+import secrets
+import threading
+
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+AUTH_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Hashes running or waiting per worker process before requests are turned away
+AUTH_HASH_QUEUE = int(os.environ.get("AUTH_HASH_QUEUE", 32))
+AUTH_HASH_TIMEOUT_SECONDS = 10
+
+LOGIN_MAX_FAILURES_ACCOUNT = int(os.environ.get("LOGIN_MAX_FAILURES_ACCOUNT", 5))
+LOGIN_MAX_FAILURES_IP = int(os.environ.get("LOGIN_MAX_FAILURES_IP", 20))
+LOGIN_FAILURE_WINDOW_SECONDS = int(os.environ.get("LOGIN_FAILURE_WINDOW_SECONDS", 900))
+LOGIN_BACKOFF_BASE_SECONDS = 1
+LOGIN_BACKOFF_MAX_SECONDS = 900
+
+ATTEMPT_INDEXES = [
+    # Counters disappear once their window has passed without new failures
+    IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+]
+
+LOGIN_ATTEMPTS = registry.counter(
+    "shakuni_login_attempts_total", "Login attempts by outcome (success, invalid, throttled, busy)", ("outcome",))
+PASSWORD_HASHES_REJECTED = registry.counter(
+    "shakuni_password_hashes_rejected_total", "bcrypt operations refused because the hash queue was full")
+
+
+class HasherBusy(Exception):
+    """The hash queue is full or a hash did not finish in time; the caller should answer 503."""
+
+
+# --- Password hashing ---
+class PasswordHasher:
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=AUTH_HASH_WORKERS, queue_limit=AUTH_HASH_QUEUE):
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self._dummy_hash = None
+        self._lock = threading.Lock()
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            PASSWORD_HASHES_REJECTED.inc()
+            raise HasherBusy()
+        with self._lock:
+            self.pending += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _wait(self, future):
+        try:
+            return future.result(AUTH_HASH_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            # The executor is too far behind; answered like a full queue
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._wait(self._submit(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds)))
+
+    def verify(self, password, hashed):
+        """Check a password; hashed=None (unknown user) costs the same and returns False."""
+        known = hashed is not None
+        if not known:
+            hashed = self.dummy_hash()
+        matches = self._wait(self._submit(bcrypt.checkpw, password.encode('utf-8'), hashed))
+        return known and matches
+
+    def dummy_hash(self):
+        if self._dummy_hash is None:
+            # Computed once per worker, on the first unknown email
+            dummy = self.hash(secrets.token_hex(16))
+            with self._lock:
+                self._dummy_hash = self._dummy_hash or dummy
+        return self._dummy_hash
+
+    def needs_rehash(self, hashed):
+        # bcrypt hashes look like $2b$<cost>$<salt and hash>
+        try:
+            return int(hashed.split(b"$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def rehash_in_background(self, password, save):
+        """Hash the password at the current cost and pass it to save(); skipped when busy."""
+        def _save(future):
+            try:
+                save(future.result())
+            except Exception as e:
+                log.warning("Rehashing a password failed: %s", e)
+
+        try:
+            self._submit(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds)).add_done_callback(_save)
+        except HasherBusy:
+            pass  # Tried again on the user's next login
+
+
+# --- Failed login tracking ---
+class LoginThrottle:
+    """Per-account and per-IP failure counters with exponential backoff, shared through MongoDB."""
+
+    def __init__(self, attempts_collection):
+        self.attempts = attempts_collection
+
+    def ensure_indexes(self):
+        self.attempts.create_indexes(ATTEMPT_INDEXES)
+
+    def _keys(self, email, ip):
+        keys = {f"account:{email.strip().lower()}": LOGIN_MAX_FAILURES_ACCOUNT}
+        if ip:
+            keys[f"ip:{ip}"] = LOGIN_MAX_FAILURES_IP
+        return keys
+
+    def retry_after(self, email, ip):
+        """Seconds until this account and IP may try again; 0 when not blocked."""
+        now = datetime.now()
+        blocked = self.attempts.find(
+            {"_id": {"$in": list(self._keys(email, ip))}, "blocked_until": {"$gt": now}}, {"blocked_until": 1})
+        return max((math.ceil((document["blocked_until"] - now).total_seconds()) for document in blocked), default=0)
+
+    def record_failure(self, email, ip):
+        now = datetime.now()
+        for key, limit in self._keys(email, ip).items():
+            document = self.attempts.find_one_and_update(
+                {"_id": key},
+                {"$inc": {"failures": 1}, "$set": {"expires_at": now + timedelta(seconds=LOGIN_FAILURE_WINDOW_SECONDS)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            failures = document["failures"]
+            if failures >= limit:
+                delay = min(LOGIN_BACKOFF_MAX_SECONDS, LOGIN_BACKOFF_BASE_SECONDS * 2 ** (failures - limit))
+                blocked_until = now + timedelta(seconds=delay)
+                # Keep the counter until the block has run out
+                self.attempts.update_one({"_id": key}, {"$set": {
+                    "blocked_until": blocked_until,
+                    "expires_at": max(document["expires_at"], blocked_until),
+                }})
+                log.warning("Blocking logins for %s for %ss after %s failures", key, delay, failures)
+
+    def record_success(self, email):
+        # The IP keeps its count: one valid password does not clear a credential-stuffing source
+        self.attempts.delete_one({"_id": f"account:{email.strip().lower()}"})
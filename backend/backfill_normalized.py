@@ -0,0 +1,63 @@
+"""
+Backfill the `normalized` subdocument on alerts stored before ingest-time extraction.
+
+Walks each alert collection in _id order and applies the extractors from normalizers.py
+with unordered bulk writes. The job only touches documents still missing `normalized`,
+so it can be stopped and re-run safely.
+
+Usage:
+    python backfill_normalized.py [--collection cloud_alerts] [--batch-size 1000]
+"""
+from pymongo import MongoClient, UpdateOne
+import argparse
+import logging
+import os
+import time
+
+from normalizers import normalize_alert
+import db
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ALERT_COLLECTIONS = ["cloud_alerts", "generic_alerts"]
+
+def backfill_collection(collection, batch_size):
+    last_id = None
+    updated = 0
+    started = time.monotonic()
+    while True:
+        query = {"normalized": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(collection.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne({"_id": alert["_id"]}, {"$set": {"normalized": normalize_alert(alert)}})
+            for alert in batch
+        ]
+        result = collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+        last_id = batch[-1]["_id"]
+
+        elapsed = time.monotonic() - started
+        logging.info(f"{collection.name}: {updated} alerts normalized ({updated / elapsed:.0f}/s), last _id {last_id}")
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill normalized fields on existing alerts")
+    parser.add_argument("--collection", choices=ALERT_COLLECTIONS, action="append",
+                        help="Collection to backfill (default: all alert collections)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per bulk write")
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017/shakuni")
+    database = MongoClient(mongo_uri)[db.DB_NAME]
+
+    for name in args.collection or ALERT_COLLECTIONS:
+        total = backfill_collection(database[name], args.batch_size)
+        logging.info(f"Finished {name}: {total} alerts normalized")
+
+if __name__ == '__main__':
+    main()
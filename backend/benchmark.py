@@ -0,0 +1,296 @@
+"""
+Shared harness for the backend benchmarks (benchmark_ingest.py, benchmark_reads.py).
+
+Runs the Flask app in-process against a local mongod or, when no URI is given, the
+mongomock in-memory stand-in, and drives it from a pool of threads through Flask's
+test client so results measure the application rather than a socket stack. Timings
+become throughput and p50/p95/p99 latency; a separate single-threaded pass under
+tracemalloc measures per-request allocations. Results are saved as JSON and can be
+compared against a baseline so CI fails on regressions.
+
+The mongomock stand-in is a development dependency:
+    pip install -r requirements-dev.txt
+"""
+from datetime import datetime
+import json
+import logging
+import os
+import platform
+import secrets
+import subprocess
+import threading
+import time
+import tracemalloc
+
+BENCH_DB_NAME = "shakuni_bench"
+BENCH_USER_ID = "benchmark-user"
+# A regression is flagged when a metric is this much worse than the baseline
+DEFAULT_TOLERANCE = 0.25
+# Latency changes smaller than this are timer and scheduler noise, not regressions
+MIN_LATENCY_DELTA_MS = 1.0
+
+def start_app(mongo_uri=None, db_name=BENCH_DB_NAME, log_level="WARNING", fresh=True):
+    """
+    Create the app against the benchmark database and return (app, api_key).
+
+    Background services stay off so request timings are not mixed with enrichment
+    work; indexes are built up front because they shape write cost. With fresh=False
+    an already seeded database is used as is.
+    """
+    import db
+
+    db.DB_NAME = db_name
+    if not mongo_uri:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock is required without --mongo-uri (pip install -r requirements-dev.txt)")
+        db.MongoClient = mongomock.MongoClient
+
+    from app import create_app
+
+    # create_app replaces this script's logging setup; progress lines stay human-readable
+    os.environ.setdefault("LOG_FORMAT", "text")
+    app = create_app(start_background=False)
+    # Per-request log lines would dominate the numbers
+    logging.getLogger().setLevel(log_level)
+
+    db.services.init(mongo_uri)
+    if fresh:
+        db.services.client.drop_database(db_name)
+    db.services.ensure_indexes()
+    api_key = secrets.token_hex(32)
+    db.services.settings_collection.insert_one({
+        "user_id": BENCH_USER_ID,
+        "api_keys": [{"name": "benchmark", "key": api_key, "created_at": datetime.now()}],
+    })
+    return app, api_key
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize_latencies(latencies, elapsed, errors):
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def run_load(app, make_request, concurrency, total_requests, seed=0):
+    """
+    Send total_requests requests from `concurrency` threads as fast as they complete.
+
+    make_request(rng) returns (method, path, kwargs, expected_statuses); each thread
+    has its own seeded RNG and test client.
+    """
+    import random
+
+    lock = threading.Lock()
+    remaining = [total_requests]
+    latencies = []
+    errors = [0]
+
+    def worker(index):
+        rng = random.Random(f"{seed}:{index}")
+        client = app.test_client()
+        local = []
+        local_errors = 0
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            method, path, kwargs, expected = make_request(rng)
+            started = time.perf_counter()
+            response = client.open(path, method=method, **kwargs)
+            # Streamed responses are only produced while the body is read
+            response.get_data()
+            response.close()
+            local.append(time.perf_counter() - started)
+            if response.status_code not in expected:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize_latencies(latencies, time.perf_counter() - started, errors[0])
+
+
+def measure_allocations(app, make_request, requests=200, warmup=20, seed=0):
+    """
+    Per-request memory under tracemalloc: peak bytes allocated while serving one
+    request, and bytes still held afterwards (averaged; steady growth means a leak).
+    """
+    import random
+
+    rng = random.Random(f"{seed}:alloc")
+    client = app.test_client()
+    for _ in range(warmup):
+        method, path, kwargs, _ = make_request(rng)
+        client.open(path, method=method, **kwargs)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        start_current, _ = tracemalloc.get_traced_memory()
+        for _ in range(requests):
+            method, path, kwargs, _ = make_request(rng)
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            client.open(path, method=method, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+        end_current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return {
+        "requests": requests,
+        "peak_kib_p50": round(percentile(peaks, 50) / 1024, 1),
+        "peak_kib_p95": round(percentile(peaks, 95) / 1024, 1),
+        "retained_bytes_per_request": round((end_current - start_current) / requests, 1),
+    }
+
+
+class RSSSampler:
+    """
+    Samples this process's resident set size on a thread while the block runs.
+
+    Reads /proc/self/statm (Linux); elsewhere falls back to the lifetime peak from
+    getrusage, which cannot show growth for a single block.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            import resource
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if platform.system() == "Darwin" else peak * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, self.current())
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self.current())
+
+    def to_dict(self):
+        return {
+            "peak_rss_mib": round(self.peak_bytes / 2 ** 20, 1),
+            "rss_growth_mib": round((self.peak_bytes - self.start_bytes) / 2 ** 20, 1),
+        }
+
+
+def environment_info(mongo_uri):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        # Never record credentials from the URI
+        "mongo": "mongomock" if not mongo_uri else "mongod",
+    }
+
+
+# --- Baselines ---
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return human-readable regressions of results against baseline.
+
+    Throughput may not drop, and p95 latency, allocation peaks and RSS growth may not
+    grow, by more than `tolerance` (a fraction). p99 is reported but not gated: with a few
+    thousand requests it is a handful of samples and too noisy for CI. Scenarios
+    missing from either side are skipped.
+    """
+    regressions = []
+    for scenario, current in results.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base:
+            continue
+        for level, metrics in current.get("load", {}).items():
+            base_metrics = base.get("load", {}).get(level)
+            if not base_metrics:
+                continue
+            if metrics["throughput_rps"] < base_metrics["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{scenario} c={level}: throughput {metrics['throughput_rps']} rps "
+                                   f"< baseline {base_metrics['throughput_rps']} rps")
+            if (metrics["p95_ms"] > base_metrics["p95_ms"] * (1 + tolerance)
+                    and metrics["p95_ms"] - base_metrics["p95_ms"] >= MIN_LATENCY_DELTA_MS):
+                regressions.append(f"{scenario} c={level}: p95 {metrics['p95_ms']} ms > baseline {base_metrics['p95_ms']} ms")
+            if metrics.get("errors") and not base_metrics.get("errors"):
+                regressions.append(f"{scenario} c={level}: {metrics['errors']} errors (baseline had none)")
+        allocations, base_allocations = current.get("allocations"), base.get("allocations")
+        if allocations and base_allocations:
+            if allocations["peak_kib_p50"] > base_allocations["peak_kib_p50"] * (1 + tolerance):
+                regressions.append(f"{scenario}: peak allocation {allocations['peak_kib_p50']} KiB "
+                                   f"> baseline {base_allocations['peak_kib_p50']} KiB")
+        memory, base_memory = current.get("memory"), base.get("memory")
+        # Growth below a few MiB is allocator noise
+        if memory and base_memory and memory["rss_growth_mib"] > max(base_memory["rss_growth_mib"] * (1 + tolerance),
+                                                                        base_memory["rss_growth_mib"] + 5):
+            regressions.append(f"{scenario}: RSS growth {memory['rss_growth_mib']} MiB "
+                               f"> baseline {base_memory['rss_growth_mib']} MiB")
+    return regressions
+
+
+def print_load_table(scenario, load):
+    print(f"\n{scenario}")
+    print(f"  {'conc':>5} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    for level, metrics in load.items():
+        print(f"  {level:>5} {metrics['throughput_rps']:>10} {metrics['p50_ms']:>9} {metrics['p95_ms']:>9} "
+              f"{metrics['p99_ms']:>9} {metrics['max_ms']:>9} {metrics['errors']:>7}")
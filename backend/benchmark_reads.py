@@ -0,0 +1,136 @@
+"""
+Benchmark the read endpoints against a seeded, skewed dataset.
+
+Each endpoint is timed for three tenants picked from the skewed user distribution
+(heaviest, median and lightest by alert volume), recording latency percentiles,
+response bytes and the process's RSS while serving. Endpoints that return a
+user's whole collection show here how they grow with tenant size.
+
+Usage:
+    pip install -r requirements-dev.txt                         # mongomock, for runs without --mongo-uri
+    python benchmark_reads.py                                   # mongomock, small in-process dataset
+    python seed_alerts.py --mongo-uri mongodb://localhost:27017 --cloud-alerts 2000000
+    python benchmark_reads.py --mongo-uri mongodb://localhost:27017 --no-seed --users 500
+    python benchmark_reads.py ... --save-baseline reads_baseline.json | --compare reads_baseline.json
+"""
+from flask_jwt_extended import create_access_token
+import argparse
+import logging
+import sys
+
+import benchmark
+import seed_alerts
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# The app's own logging is turned down while measuring; progress stays visible
+log = logging.getLogger("benchmark")
+log.setLevel(logging.INFO)
+
+# name -> path; new pagination, search or summary endpoints are benchmarked by adding them here
+ENDPOINTS = {
+    "cloud_alerts": "/api/alerts",
+    "generic_alerts": "/api/generic-alerts",
+    "deployment_history": "/api/deployments/history",
+    "settings": "/api/settings",
+    "search_first_page": "/api/alerts/search?collection=cloud&limit=50",
+    "search_by_ip": "/api/alerts/search?collection=cloud&ip=185.220.101.1&limit=50",
+    "search_generic_type": "/api/alerts/search?collection=generic&type=email_deception&limit=50",
+    "export_10k": "/api/alerts/export?collection=cloud&limit=10000",
+}
+
+def tenants(users):
+    """Heaviest, median and lightest seeded users (user ids are ordered by skew rank)."""
+    ids = seed_alerts.user_ids(users)
+    return {"heavy": ids[0], "median": ids[len(ids) // 2], "light": ids[-1]}
+
+
+def tenant_sizes(services, user_id):
+    return {kind: services.alert_store.collection(kind).count_documents(
+                services.alert_store.translate_query(kind, {"user_id": user_id}))
+            for kind in ("cloud_alerts", "generic_alerts")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Shakuni read endpoints")
+    parser.add_argument("--mongo-uri", help="Local mongod to benchmark against (default: in-memory mongomock)")
+    parser.add_argument("--db-name", default=benchmark.BENCH_DB_NAME)
+    parser.add_argument("--no-seed", action="store_true", help="Use a database already filled by seed_alerts.py")
+    parser.add_argument("--users", type=int, default=100, help="Seeded users (must match seed_alerts.py with --no-seed)")
+    parser.add_argument("--cloud-alerts", type=int, default=50000)
+    parser.add_argument("--generic-alerts", type=int, default=25000)
+    parser.add_argument("--deployments", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="Seeding processes (mongod only)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per endpoint and tenant")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--save-baseline", help="Write results JSON as the new baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=benchmark.DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(unknown)}")
+    if args.no_seed and not args.mongo_uri:
+        parser.error("--no-seed needs --mongo-uri; the mongomock database only lives in this process")
+
+    app, _ = benchmark.start_app(args.mongo_uri, args.db_name, fresh=not args.no_seed)
+    from db import services
+
+    if not args.no_seed:
+        counts = {"cloud_alerts": args.cloud_alerts, "generic_alerts": args.generic_alerts, "deployments": args.deployments}
+        log.info(f"Seeding {sum(counts.values()):,} documents for {args.users} users")
+        seed_alerts.seed_database(services.db, counts, args.users, args.seed, mongo_uri=args.mongo_uri, workers=args.workers)
+        services.ensure_indexes()
+
+    results = {"meta": benchmark.environment_info(args.mongo_uri), "scenarios": {}}
+    results["meta"].update({"repeat": args.repeat, "users": args.users, "seed": args.seed})
+    with app.app_context():
+        tokens = {tenant: create_access_token(identity=user_id) for tenant, user_id in tenants(args.users).items()}
+    for tenant, user_id in tenants(args.users).items():
+        results["meta"][f"{tenant}_tenant"] = {"user_id": user_id, **tenant_sizes(services, user_id)}
+
+    client = app.test_client()
+    for name in names:
+        for tenant, token in tokens.items():
+            path = ENDPOINTS[name]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            def make_request(rng):
+                return "GET", path, {"headers": headers}, (200,)
+
+            scenario_name = f"{name}:{tenant}"
+            log.info(f"Running {scenario_name}")
+            with benchmark.RSSSampler() as sampler:
+                # The first call also measures the (possibly streamed) response size
+                response = client.get(path, headers=headers)
+                response_bytes = len(response.get_data())
+                response.close()
+                load = benchmark.run_load(app, make_request, 1, args.repeat, seed=args.seed)
+            results["scenarios"][scenario_name] = {
+                "load": {"1": load},
+                "response_bytes": response_bytes,
+                "memory": sampler.to_dict(),
+            }
+            benchmark.print_load_table(scenario_name, {"1": load})
+            print(f"  response {response_bytes:,} bytes, peak RSS {sampler.to_dict()['peak_rss_mib']} MiB "
+                  f"(+{sampler.to_dict()['rss_growth_mib']} MiB)")
+
+    if args.output:
+        benchmark.save_results(results, args.output)
+    if args.save_baseline:
+        benchmark.save_results(results, args.save_baseline)
+        log.info(f"Saved baseline to {args.save_baseline}")
+    if args.compare:
+        regressions = benchmark.compare_results(results, benchmark.load_results(args.compare), args.tolerance)
+        for regression in regressions:
+            log.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        log.info(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
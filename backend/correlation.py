@@ -0,0 +1,270 @@
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from bson.objectid import ObjectId
+from datetime import timedelta
+import hashlib
+import ipaddress
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# How long a shared key keeps linking new alerts to an existing incident
+KEY_WINDOWS = {
+    "ip": timedelta(hours=1),
+    "ua": timedelta(minutes=30),
+    "akid": timedelta(hours=24),
+    "token": timedelta(hours=24),
+}
+MAX_KEY_WINDOW = max(KEY_WINDOWS.values())
+
+# Only the most recent members are kept on the incident document; alert_count has the total
+MAX_INCIDENT_MEMBERS = 1000
+
+# Prune expired keys from the in-memory index after this many correlated alerts
+PRUNE_INTERVAL = 10000
+
+# Base severity score per normalized alert kind
+KIND_SEVERITY = {
+    "cloudtrail": 3,
+    "web_honeypot_login": 3,
+    "pdf_decoy": 2,
+    "callback": 1,
+    "unknown": 1,
+}
+SEVERITY_LABELS = [(5, "critical"), (4, "high"), (3, "medium"), (0, "low")]
+
+INCIDENT_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("last_seen", DESCENDING)], name="user_last_seen"),
+    IndexModel([("user_id", ASCENDING), ("keys", ASCENDING), ("last_seen", DESCENDING)], name="user_keys_last_seen"),
+]
+
+def severity_label(score):
+    for threshold, label in SEVERITY_LABELS:
+        if score >= threshold:
+            return label
+    return "low"
+
+def ua_fingerprint(alert):
+    """
+    Hash the user agent together with the accept headers a client sends alongside it.
+
+    None without any accept header (e.g. CloudTrail events): a bare UA string such as
+    aws-cli/2.x is shared by unrelated users and would merge them into one incident.
+    """
+    normalized = alert.get("normalized") or {}
+    user_agent = normalized.get("user_agent")
+    if not user_agent:
+        return None
+    client_info = alert.get("client_info") or {}
+    headers = [client_info.get(h) or '' for h in ("accept", "accept_language", "accept_encoding")]
+    if not any(header and header != 'Unknown' for header in headers):
+        return None
+    return hashlib.sha1('|'.join([user_agent] + headers).encode('utf-8')).hexdigest()[:16]
+
+def is_ip_address(value):
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+def correlation_keys(alert):
+    """The shared attributes that can link an alert to others, as 'type:value' strings."""
+    normalized = alert.get("normalized") or {}
+    keys = []
+    # CloudTrail reports service callers as e.g. "AWS Internal" or "s3.amazonaws.com"
+    if normalized.get("source_ip") and is_ip_address(normalized["source_ip"]):
+        keys.append(f"ip:{normalized['source_ip']}")
+    fingerprint = ua_fingerprint(alert)
+    if fingerprint:
+        keys.append(f"ua:{fingerprint}")
+    if normalized.get("access_key_id"):
+        keys.append(f"akid:{normalized['access_key_id']}")
+    if normalized.get("canary_token"):
+        keys.append(f"token:{normalized['canary_token']}")
+    return keys
+
+def alert_severity(alert):
+    normalized = alert.get("normalized") or {}
+    score = KIND_SEVERITY.get(normalized.get("kind"), 1)
+    # Credentials being used is worse than a bucket being looked at
+    if normalized.get("access_key_id") or normalized.get("username"):
+        score += 1
+    return score
+
+
+class UnionFind:
+    """Disjoint sets over incident ids with path halving and union by size."""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def add(self, node):
+        if node not in self.parent:
+            self.parent[node] = node
+            self.size[node] = 1
+
+    def find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        """Merge two sets and return (root, absorbed); absorbed is None if already joined."""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a, None
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a, root_b
+
+    def detach(self, node):
+        """Undo the union that absorbed node, so it is the root of its own set again."""
+        root = self.find(node)
+        if root != node:
+            self.size[root] -= self.size[node]
+            self.parent[node] = node
+
+
+class CorrelationEngine:
+    """
+    Groups alerts into attacker incidents by shared source IP, user-agent fingerprint,
+    access key id or canary token seen within KEY_WINDOWS of each other.
+
+    Key lookups hit an in-memory index first and fall back to the incidents collection,
+    so incidents keep growing across restarts and across workers.
+    """
+
+    def __init__(self, incidents_collection):
+        self.incidents = incidents_collection
+        self.union_find = UnionFind()
+        # (user_id, key) -> (incident_id, last_seen)
+        self.key_index = {}
+        self._lock = threading.Lock()
+        self._since_prune = 0
+
+    def ensure_indexes(self):
+        self.incidents.create_indexes(INCIDENT_INDEXES)
+
+    def _lookup(self, user_id, key, seen_at):
+        window = KEY_WINDOWS[key.split(':', 1)[0]]
+        entry = self.key_index.get((user_id, key))
+        if entry and seen_at - entry[1] <= window:
+            return self.union_find.find(entry[0])
+        incident = self.incidents.find_one(
+            {"user_id": user_id, "keys": key, "last_seen": {"$gte": seen_at - window}},
+            {"_id": 1},
+            sort=[("last_seen", -1)]
+        )
+        if incident:
+            self.union_find.add(incident["_id"])
+            return self.union_find.find(incident["_id"])
+        return None
+
+    def _merge_into(self, root_id, absorbed_id):
+        """
+        Fold the absorbed incident into root_id. The root is updated before the absorbed
+        incident is deleted, and only while it still exists; returns False when another
+        worker has already merged it away, leaving the absorbed incident untouched.
+        """
+        merged_count, merged_ids = 0, set()
+        while True:
+            absorbed = self.incidents.find_one({"_id": absorbed_id})
+            if not absorbed:
+                return True
+            # Only what was added since the last pass, if the absorbed incident grew meanwhile
+            members = [m for m in absorbed.get("members", []) if m.get("alert_id") not in merged_ids]
+            result = self.incidents.update_one({"_id": root_id}, {
+                "$push": {"members": {"$each": members, "$slice": -MAX_INCIDENT_MEMBERS}},
+                "$addToSet": {"keys": {"$each": absorbed.get("keys", [])}},
+                "$min": {"first_seen": absorbed["first_seen"]},
+                "$max": {"last_seen": absorbed["last_seen"], "severity_score": absorbed.get("severity_score", 1)},
+                "$inc": {"alert_count": absorbed.get("alert_count", 0) - merged_count,
+                         "merged_incidents": 0 if merged_ids else 1},
+            })
+            if not result.matched_count:
+                return False
+            merged_count = absorbed.get("alert_count", 0)
+            merged_ids.update(m.get("alert_id") for m in members)
+            if self.incidents.delete_one({"_id": absorbed_id, "alert_count": merged_count}).deleted_count:
+                return True
+
+    def _resolve(self, user_id, keys, seen_at, retry=True):
+        """The incident the keys lead to, merging any others they bridge; None when there is none."""
+        roots = []
+        for key in keys:
+            root = self._lookup(user_id, key, seen_at)
+            if root is not None and root not in roots:
+                roots.append(root)
+        if not roots:
+            return None
+        root = roots[0]
+        for other in roots[1:]:
+            root, absorbed = self.union_find.union(root, other)
+            if absorbed is not None and not self._merge_into(root, absorbed):
+                # The root was merged elsewhere; the surviving incident carries its keys
+                self.union_find.detach(absorbed)
+                for key in keys:
+                    self.key_index.pop((user_id, key), None)
+                return self._resolve(user_id, keys, seen_at, retry=False) if retry else None
+        return root
+
+    def correlate(self, kind, alert):
+        """Attach a stored alert to an incident, merging incidents it bridges. Returns the incident id."""
+        user_id = alert.get("user_id")
+        seen_at = alert.get("received_at")
+        keys = correlation_keys(alert)
+        if not user_id or not seen_at or not keys:
+            return None
+
+        member = {"alert_id": alert["_id"], "collection": kind, "received_at": seen_at}
+        update = {
+            "$setOnInsert": {"user_id": user_id, "created_at": seen_at},
+            "$push": {"members": {"$each": [member], "$slice": -MAX_INCIDENT_MEMBERS}},
+            "$addToSet": {"keys": {"$each": keys}},
+            "$min": {"first_seen": seen_at},
+            "$max": {"last_seen": seen_at, "severity_score": alert_severity(alert)},
+            "$inc": {"alert_count": 1},
+        }
+        with self._lock:
+            root = self._resolve(user_id, keys, seen_at)
+            # Existing incidents are only updated, never upserted: another worker may have
+            # merged this one into its own, and an upsert would bring it back
+            if root is not None and not self.incidents.update_one({"_id": root}, update).matched_count:
+                for key in keys:
+                    self.key_index.pop((user_id, key), None)
+                # The surviving incident carries the merged keys, so MongoDB finds it
+                root = self._resolve(user_id, keys, seen_at)
+                if root is not None and not self.incidents.update_one({"_id": root}, update).matched_count:
+                    root = None
+            if root is None:
+                root = ObjectId()
+                self.union_find.add(root)
+                self.incidents.update_one({"_id": root}, update, upsert=True)
+
+            for key in keys:
+                self.key_index[(user_id, key)] = (root, seen_at)
+
+            self._since_prune += 1
+            if self._since_prune >= PRUNE_INTERVAL:
+                self._prune(seen_at)
+        return root
+
+    def _prune(self, now):
+        self._since_prune = 0
+        expired = [k for k, (_, last_seen) in self.key_index.items() if now - last_seen > MAX_KEY_WINDOW]
+        for k in expired:
+            del self.key_index[k]
+        # Rebuild the disjoint sets around the incidents that are still referenced
+        union_find = UnionFind()
+        for k, (incident_id, last_seen) in self.key_index.items():
+            root = self.union_find.find(incident_id)
+            union_find.add(root)
+            self.key_index[k] = (root, last_seen)
+        self.union_find = union_find
+        log.debug("Correlation index pruned %s expired keys, %s remain", len(expired), len(self.key_index))
@@ -0,0 +1,279 @@
+"""
+Shared data-access layer: one tuned MongoClient and the services built on it.
+
+Nothing connects at import time. `services` builds the client, collections and
+background services (alert store, correlation, stats, rate monitor, dispatcher,
+enrichment pipeline) on first attribute access, so blueprints can import it at module
+level without importing app.py. Index creation runs once on a background thread.
+"""
+from pymongo import MongoClient, monitoring
+from pymongo.write_concern import WriteConcern
+import atexit
+import logging
+import os
+import pymongo
+import random
+import threading
+import time
+
+from metrics import registry
+import auth
+import profiling
+
+log = logging.getLogger(__name__)
+
+DB_NAME = os.environ.get("MONGO_DB_NAME", "shakuni")
+
+# --- Client tuning ---
+# Bounded pool with fast failure: a request waits at most WAIT_QUEUE_TIMEOUT_MS for a
+# connection and SERVER_SELECTION_TIMEOUT_MS for a reachable server instead of the
+# 30s driver default, so an unhealthy database shows up as errors, not stuck workers.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 60000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+
+# --- Write concerns ---
+# Accounts, settings (API keys, sinks) and deployment records must survive a primary
+# failover; alerts and derived data are high-volume and re-creatable, so they are
+# acknowledged by the primary alone.
+DURABLE_WRITE_CONCERN = WriteConcern(w="majority", wtimeout=5000)
+FAST_WRITE_CONCERN = WriteConcern(w=1)
+
+INDEX_RETRY_MAX = 60.0
+# /api/health must answer quickly even when MongoDB does not
+HEALTH_PING_TIMEOUT_MS = int(os.environ.get("MONGO_HEALTH_TIMEOUT_MS", 2000))
+METRICS_FLUSH_SECONDS = int(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+# Ingest rates are shared and evaluated this often, so spikes are noticed within about this long
+RATE_CHECK_SECONDS = int(os.environ.get("RATE_CHECK_SECONDS", 15))
+
+MONGO_COMMAND_SECONDS = registry.histogram(
+    "shakuni_mongo_command_duration_seconds", "MongoDB command round trips", ("command", "outcome"))
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Records every command's driver-measured duration; runs on the calling thread."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "ok")
+        profiling.record_mongo(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "error")
+        profiling.record_mongo(event.duration_micros / 1e6)
+
+
+def create_client(mongo_uri=None):
+    """Build the process-wide MongoClient (connections are opened lazily by the driver)."""
+    return MongoClient(
+        mongo_uri or os.environ.get("MONGO_URI", "mongodb://localhost:27017/shakuni"),
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        retryWrites=True,
+        appname="shakuni-backend",
+        event_listeners=[CommandTimer()],
+    )
+
+
+class Services:
+    """Lazily initialized collections and background services shared by all blueprints."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._initialized = False
+        self._background_started = False
+        self._index_thread = None
+        self.indexes_ready = threading.Event()
+        self.index_error = None
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set yet: build everything on first use
+        if name.startswith("_") or self.__dict__.get("_initialized"):
+            raise AttributeError(name)
+        self.init()
+        return object.__getattribute__(self, name)
+
+    def init(self, mongo_uri=None):
+        # Imported here: these modules import blueprints, which import this module
+        from alert_store import create_alert_store
+        from correlation import CorrelationEngine
+        from alert_stats import StatsAggregator
+        from geoip import GeoIPResolver
+        from enrichment import build_enrichment_pipeline
+        from dispatcher import AlertDispatcher
+        from rate_monitor import RateMonitor
+        from user_cache import UserCache, create_cache_backend
+
+        with self._lock:
+            if self._initialized:
+                return self
+            started = time.perf_counter()
+            self.client = create_client(mongo_uri)
+            durable_db = self.client.get_database(DB_NAME, write_concern=DURABLE_WRITE_CONCERN)
+            fast_db = self.client.get_database(DB_NAME, write_concern=FAST_WRITE_CONCERN)
+            self.db = fast_db
+
+            self.users_collection = durable_db.users
+            self.settings_collection = durable_db.settings
+            self.high_interaction_honeypot_state_file_collection = durable_db.high_interaction_honeypot_state_file
+            self.deployments_collection = durable_db.deployments
+            self.sqsurl_collection = durable_db.sqsurl
+            self.incidents_collection = fast_db.incidents # Attacker incidents built by the correlation engine
+            # Settings and profile views, invalidated by the routes that change them
+            self.user_cache = UserCache(self.users_collection, self.settings_collection,
+                                        self.high_interaction_honeypot_state_file_collection, create_cache_backend())
+
+            # bcrypt on a bounded per-worker executor; failed logins are counted for all workers
+            self.password_hasher = auth.PasswordHasher()
+            self.login_throttle = auth.LoginThrottle(fast_db.login_attempts)
+
+            # Local GeoIP/ASN lookups used to enrich ingested alerts (disabled unless GEOIP_*_DB is set)
+            self.geoip_resolver = GeoIPResolver.from_env()
+            # Cloud and generic alerts are read and written through the configured alert store
+            # ('collections' keeps cloud_alerts/generic_alerts, 'timeseries' uses one time-series collection)
+            self.alert_store = create_alert_store(fast_db, os.environ.get("ALERT_STORE", "collections"))
+            self.correlation_engine = CorrelationEngine(self.incidents_collection)
+            self.stats_aggregator = StatsAggregator(fast_db.alert_stats, fast_db.alert_stats_workers) # Per-deployment top-k / distinct attacker sketches
+            # Per-honeypot ingest rates shared by all processes through MongoDB; raises rate_anomaly generic alerts
+            self.rate_monitor = RateMonitor(self.alert_store, fast_db.ingest_rate_streams, fast_db.ingest_rate_slots,
+                                            check_seconds=RATE_CHECK_SECONDS)
+            # Forwards enriched alerts to each user's webhook/syslog/file sinks (settings.alert_sinks)
+            self.alert_dispatcher = AlertDispatcher(self.settings_collection, max_workers=int(os.environ.get("DISPATCH_WORKERS", 4)))
+            # Enrichment (normalization, GeoIP, stats, correlation, dispatch) runs in background workers, not in ingest
+            self.enrichment_pipeline = build_enrichment_pipeline(
+                self.alert_store, fast_db.pipeline_checkpoints, self.geoip_resolver,
+                self.stats_aggregator, self.correlation_engine, self.alert_dispatcher
+            )
+            # Admin-toggled sampling profiler; its on/off state is shared by all workers
+            self.profiler = profiling.SamplingProfiler(fast_db.profiler_state, fast_db.profiles)
+            self._register_gauges()
+            self._initialized = True
+            log.info("Data-access layer initialized in %.1f ms", (time.perf_counter() - started) * 1000)
+            return self
+
+    def _register_gauges(self):
+        # Read at scrape time from this worker's services; replaced when a forked worker rebuilds them
+        registry.gauge("shakuni_dispatch_queued_alerts", "Alerts waiting in sink delivery queues",
+                       callback=self.alert_dispatcher.queued)
+        registry.gauge("shakuni_enrichment_lag_seconds", "Age of the oldest alert in the last enrichment batch",
+                       callback=lambda: self.enrichment_pipeline.lag_seconds, aggregate="max")
+        registry.gauge("shakuni_stats_sketches", "Deployment stats sketches held in memory",
+                       callback=lambda: len(self.stats_aggregator.sketches))
+        registry.gauge("shakuni_rate_monitor_streams", "Honeypot streams with ingest counts not yet shared",
+                       callback=lambda: len(self.rate_monitor.pending))
+        registry.gauge("shakuni_password_hashes_pending", "bcrypt operations running or waiting for the executor",
+                       callback=lambda: self.password_hasher.pending)
+
+    def ping(self):
+        """Round trip to MongoDB for /api/health: {"ok", "latency_ms"[, "error"]}."""
+        started = time.perf_counter()
+        try:
+            with pymongo.timeout(HEALTH_PING_TIMEOUT_MS / 1000):
+                self.client.admin.command("ping")
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+        except Exception as e:
+            return {"ok": False, "latency_ms": round((time.perf_counter() - started) * 1000, 2), "error": str(e)}
+
+    # --- Indexes ---
+    def ensure_indexes(self):
+        self.users_collection.create_index("email", unique=True)
+        self.login_throttle.ensure_indexes()
+        # Compound and text indexes backing alert reads, exports and search
+        self.alert_store.ensure_indexes()
+        self.correlation_engine.ensure_indexes()
+        self.stats_aggregator.ensure_indexes()
+        self.rate_monitor.ensure_indexes()
+        self.enrichment_pipeline.ensure_indexes()
+
+    def ensure_indexes_in_background(self):
+        """Create indexes on a daemon thread, retrying until MongoDB is reachable."""
+        with self._lock:
+            if self._index_thread is not None:
+                return self._index_thread
+            self._index_thread = threading.Thread(target=self._index_loop, name="mongo-indexes", daemon=True)
+            self._index_thread.start()
+            return self._index_thread
+
+    def _index_loop(self):
+        failures = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                self.ensure_indexes()
+                self.index_error = None
+                self.indexes_ready.set()
+                log.info("MongoDB indexes ensured in %.1f ms", (time.perf_counter() - started) * 1000)
+                return
+            except Exception as e:
+                failures += 1
+                self.index_error = str(e)
+                delay = random.uniform(1.0, min(INDEX_RETRY_MAX, 2 ** failures))
+                log.error("Error ensuring MongoDB indexes (%s in a row), retrying in %.0fs: %s", failures, delay, e)
+                time.sleep(delay)
+
+    # --- Background services ---
+    def start_background(self):
+        """Start the scheduler, dispatcher and enrichment workers once per process."""
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        with self._lock:
+            if self._background_started:
+                return
+            self._background_started = True
+
+            # Periodically checkpoint the in-memory alert stats sketches to MongoDB
+            self.scheduler = BackgroundScheduler(daemon=True)
+            self.scheduler.add_job(self.stats_aggregator.checkpoint, 'interval',
+                                   seconds=int(os.environ.get("STATS_CHECKPOINT_SECONDS", 30)), id='stats_checkpoint')
+            # Fold the stats documents of recycled or crashed workers, so reads merge a bounded set
+            self.scheduler.add_job(self.stats_aggregator.compact, 'interval',
+                                   seconds=int(os.environ.get("STATS_COMPACT_SECONDS", 300)), id='stats_compact')
+            # Shares this worker's ingest counts and evaluates rates; silent honeypots are only noticed here
+            self.scheduler.add_job(self.rate_monitor.check, 'interval', seconds=RATE_CHECK_SECONDS, id='rate_check')
+            # Share this worker's metrics with the others (only when METRICS_DIR is set)
+            self.scheduler.add_job(registry.write_snapshot, 'interval', seconds=METRICS_FLUSH_SECONDS, id='metrics_snapshot')
+            self.scheduler.add_job(self.profiler.refresh, 'interval', seconds=profiling.PROFILER_POLL_SECONDS, id='profiler_refresh')
+            self.scheduler.start()
+
+            self.alert_dispatcher.start()
+            self.enrichment_pipeline.start()
+            atexit.register(self.stop_background)
+
+    def stop_background(self):
+        """Stop background services and flush their state; safe to call more than once."""
+        with self._lock:
+            if not self._background_started:
+                return
+            self._background_started = False
+            self.scheduler.shutdown(wait=False)
+            self.enrichment_pipeline.stop()
+            self.alert_dispatcher.stop()
+            self.stats_aggregator.checkpoint()
+            self.stats_aggregator.retire()
+            self.rate_monitor.flush()
+            self.profiler.flush()
+            registry.write_snapshot(final=True)
+
+    def reset(self):
+        """
+        Forget the client and services inherited from a parent process.
+
+        MongoClient and the worker threads are not fork-safe, so a forked server
+        worker calls this before first use; everything is rebuilt lazily in the child.
+        """
+        self.__dict__.clear()
+        self.__init__()
+
+
+services = Services()
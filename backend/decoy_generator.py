@@ -0,0 +1,200 @@
+"""
+Generate large, realistic decoy datasets for the aws_cloud_native_honeypot S3 buckets.
+
+Each dataset is written as fixed-size part files (dummy_data/generated/<dataset>/part-NNNNN.*)
+that the S3 template uploads as separate objects. Parts are generated in parallel,
+one process per core, and streamed to disk in blocks, so memory stays flat however
+large the output. Every part is seeded from (seed, dataset, part number), so the same
+arguments always produce byte-identical files regardless of the number of workers.
+
+Usage:
+    python decoy_generator.py --size-mb 2048 [--part-size-mb 64] [--seed 42]
+    python decoy_generator.py --dataset customers --size-mb 512
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import argparse
+import logging
+import os
+import random
+import re
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'terraform', 'templates', 'aws', 'aws_cloud_native_honeypot', 'dummy_data', 'generated')
+
+# Written parts, and the .tmp files of interrupted ones
+PART_FILE = re.compile(r"part-(\d{5})\.")
+
+# Rows are formatted in blocks and written with one call per block
+ROWS_PER_BLOCK = 2000
+
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+               "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Carlos", "Karen",
+               "Daniel", "Lisa", "Matthew", "Nancy", "Anthony", "Betty", "Mark", "Sandra", "Priya", "Wei",
+               "Ahmed", "Fatima", "Hiroshi", "Yuki", "Olga", "Ivan", "Lucas", "Sofia", "Mateo", "Aisha"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+              "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+              "Patel", "Nguyen", "Kim", "Chen", "Singh", "Kowalski", "Muller", "Rossi", "Tanaka", "Okafor"]
+STREET_NAMES = ["Main", "Oak", "Pine", "Maple", "Cedar", "Elm", "Washington", "Lake", "Hill", "Park",
+                "Sunset", "Highland", "River", "Church", "Willow", "Mill", "Spring", "Ridge", "Valley", "Forest"]
+STREET_SUFFIXES = ["St", "Ave", "Rd", "Blvd", "Ln", "Dr", "Ct", "Way"]
+CITIES = [("Austin", "TX", "787"), ("Denver", "CO", "802"), ("Seattle", "WA", "981"), ("Boston", "MA", "021"),
+          ("Chicago", "IL", "606"), ("Phoenix", "AZ", "850"), ("Portland", "OR", "972"), ("Atlanta", "GA", "303"),
+          ("San Jose", "CA", "951"), ("Columbus", "OH", "432"), ("Nashville", "TN", "372"), ("Miami", "FL", "331")]
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com", "icloud.com", "protonmail.com", "aol.com"]
+PLANS = ["free", "basic", "pro", "business", "enterprise"]
+CARD_BRANDS = ["visa", "mastercard", "amex", "discover"]
+
+HTTP_PATHS = ["/", "/login", "/api/v1/orders", "/api/v1/customers", "/api/v1/invoices", "/static/app.js",
+              "/static/main.css", "/admin", "/api/v1/auth/token", "/healthz", "/reports/export", "/api/v1/payments"]
+HTTP_METHODS = ["GET"] * 8 + ["POST"] * 3 + ["PUT", "DELETE"]
+HTTP_STATUSES = [200] * 20 + [201, 204, 301, 302, 304, 400, 401, 403, 404, 404, 500, 502]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "okhttp/4.12.0", "python-requests/2.31.0", "aws-sdk-java/2.25.6", "Go-http-client/1.1",
+]
+SERVICE_USERS = ["svc-billing", "svc-reporting", "etl-runner", "jenkins", "deploy-bot", "-", "-", "-"]
+
+BACKUP_SERVERS = ["prod-db-01", "prod-db-02", "prod-app-01", "prod-app-02", "fin-ledger-01", "hr-files-01", "crm-db-01"]
+BACKUP_DIRS = ["/var/lib/postgresql/14/main/base", "/srv/finance/ledger", "/home/shared/hr/payroll",
+               "/opt/crm/exports", "/var/backups/mysql", "/srv/app/uploads/invoices", "/etc/ssl/private"]
+BACKUP_EXTENSIONS = [".dat", ".sql.gz", ".xlsx", ".pdf", ".csv", ".tar.zst", ".parquet", ".key"]
+STORAGE_CLASSES = ["STANDARD", "STANDARD_IA", "GLACIER_IR", "DEEP_ARCHIVE"]
+
+BASE_TIME = datetime(2024, 1, 1)
+
+def _customer_rows(rng, part):
+    customer_id = part * 10_000_000
+    while True:
+        block = []
+        for _ in range(ROWS_PER_BLOCK):
+            customer_id += 1
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            city, state, zip_prefix = rng.choice(CITIES)
+            created = BASE_TIME - timedelta(seconds=rng.randrange(5 * 365 * 86400))
+            last_login = created + timedelta(seconds=rng.randrange(400 * 86400))
+            block.append(
+                f'{{"customerId":"CUST-{customer_id:09d}","firstName":"{first}","lastName":"{last}",'
+                f'"email":"{first.lower()}.{last.lower()}{rng.randrange(100)}@{rng.choice(EMAIL_DOMAINS)}",'
+                f'"phone":"+1-{rng.randrange(200, 999)}-{rng.randrange(200, 999)}-{rng.randrange(10000):04d}",'
+                f'"address":{{"street":"{rng.randrange(1, 9999)} {rng.choice(STREET_NAMES)} {rng.choice(STREET_SUFFIXES)}",'
+                f'"city":"{city}","state":"{state}","zip":"{zip_prefix}{rng.randrange(100):02d}"}},'
+                f'"plan":"{rng.choice(PLANS)}","card":{{"brand":"{rng.choice(CARD_BRANDS)}","last4":"{rng.randrange(10000):04d}",'
+                f'"exp":"{rng.randrange(1, 13):02d}/{rng.randrange(25, 31)}"}},'
+                f'"lifetimeValue":{rng.randrange(0, 5_000_000) / 100:.2f},'
+                f'"accountCreated":"{created:%Y-%m-%dT%H:%M:%SZ}","lastLogin":"{last_login:%Y-%m-%dT%H:%M:%SZ}"}}\n'
+            )
+        yield ''.join(block)
+
+def _access_log_rows(rng, part):
+    # Each part starts on its own day, so parts read as consecutive daily logs
+    moment = BASE_TIME + timedelta(days=part)
+    while True:
+        block = []
+        for _ in range(ROWS_PER_BLOCK):
+            moment += timedelta(milliseconds=rng.randrange(1, 400))
+            status = rng.choice(HTTP_STATUSES)
+            block.append(
+                f'{moment:%Y-%m-%dT%H:%M:%S}.{moment.microsecond // 1000:03d}Z,'
+                f'{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)},'
+                f'{rng.choice(HTTP_METHODS)},{rng.choice(HTTP_PATHS)},{status},'
+                f'{rng.randrange(200, 250_000) if status < 300 else rng.randrange(0, 600)},'
+                f'{rng.randrange(2, 1800)},{rng.choice(SERVICE_USERS)},"{rng.choice(USER_AGENTS)}"\n'
+            )
+        yield ''.join(block)
+
+def _backup_manifest_rows(rng, part):
+    while True:
+        block = []
+        for _ in range(ROWS_PER_BLOCK):
+            server = rng.choice(BACKUP_SERVERS)
+            modified = BASE_TIME - timedelta(seconds=rng.randrange(365 * 86400))
+            block.append(
+                f'{{"backupId":"bkp-{server}-{BASE_TIME:%Y%m%d}-{part:05d}","server":"{server}",'
+                f'"path":"{rng.choice(BACKUP_DIRS)}/{rng.getrandbits(40):010x}{rng.choice(BACKUP_EXTENSIONS)}",'
+                f'"sizeBytes":{rng.randrange(1024, 8 * 1024 ** 3)},"sha256":"{rng.getrandbits(256):064x}",'
+                f'"modified":"{modified:%Y-%m-%dT%H:%M:%SZ}","storageClass":"{rng.choice(STORAGE_CLASSES)}",'
+                f'"encrypted":{"true" if rng.random() < 0.7 else "false"}}}\n'
+            )
+        yield ''.join(block)
+
+# name -> (row generator, file extension, header line)
+DATASETS = {
+    "customers": (_customer_rows, "jsonl", None),
+    "access_logs": (_access_log_rows, "csv", "timestamp,client_ip,method,path,status,bytes,latency_ms,user,user_agent\n"),
+    "backup_manifests": (_backup_manifest_rows, "jsonl", None),
+}
+
+def generate_part(dataset, part, part_bytes, seed, output_dir):
+    """Write one part file of about part_bytes; returns (path, bytes written)."""
+    rows, extension, header = DATASETS[dataset]
+    rng = random.Random(f"{seed}:{dataset}:{part}")
+    directory = os.path.join(output_dir, dataset)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{part:05d}.{extension}")
+    tmp_path = path + ".tmp"
+    written = 0
+    with open(tmp_path, 'w', buffering=1024 * 1024) as f:
+        if header:
+            written += f.write(header)
+        for block in rows(rng, part):
+            written += f.write(block)
+            if written >= part_bytes:
+                break
+    # Only complete parts get their final name, so an interrupted run never uploads a torn file
+    os.replace(tmp_path, path)
+    return path, written
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate decoy datasets for the cloud-native honeypot buckets")
+    parser.add_argument("--dataset", choices=list(DATASETS), action="append",
+                        help="Dataset to generate (default: all)")
+    parser.add_argument("--size-mb", type=int, default=256, help="Approximate size per dataset in MB")
+    parser.add_argument("--part-size-mb", type=int, default=64, help="Approximate size per part file in MB")
+    parser.add_argument("--seed", default="shakuni", help="Seed; the same seed reproduces the same files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parallel processes (default: all cores)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args()
+    for option, value in (("--size-mb", args.size_mb), ("--part-size-mb", args.part_size_mb), ("--workers", args.workers)):
+        if value < 1:
+            parser.error(f"{option} must be positive")
+
+    part_bytes = args.part_size_mb * 1024 * 1024
+    parts = max(1, -(-args.size_mb // args.part_size_mb))
+    datasets = args.dataset or list(DATASETS)
+
+    # Parts left over from a larger earlier run would otherwise still be uploaded; other files are left alone
+    for dataset in datasets:
+        directory = os.path.join(args.output_dir, dataset)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                match = PART_FILE.match(name)
+                if match and (int(match.group(1)) >= parts or name.endswith(".tmp")):
+                    os.remove(os.path.join(directory, name))
+
+    started = time.monotonic()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(generate_part, dataset, part, part_bytes, args.seed, args.output_dir)
+            for dataset in datasets
+            for part in range(parts)
+        ]
+        for future in futures:
+            path, written = future.result()
+            total += written
+            logging.info(f"Wrote {path} ({written / 1024 ** 2:.1f} MB)")
+
+    elapsed = time.monotonic() - started
+    logging.info(f"Generated {total / 1024 ** 2:.0f} MB in {elapsed:.1f}s ({total / 1024 ** 2 / elapsed:.0f} MB/s, {args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
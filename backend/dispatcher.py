@@ -0,0 +1,421 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+import ipaddress
+import json
+import logging
+import os
+import random
+import re
+import requests
+import socket
+import threading
+import time
+
+from alert_routes import json_default
+
+log = logging.getLogger(__name__)
+
+SINK_TYPES = ["webhook", "syslog", "file"]
+
+# Per-sink delivery defaults; a sink's settings entry can override batch_size
+DEFAULT_BATCH_SIZE = 100
+FLUSH_INTERVAL = 2.0
+QUEUE_SIZE = 10000
+SEND_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+
+# Consecutive failed deliveries that open a sink's breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+# User sink settings are re-read at most this often
+SINK_CONFIG_TTL = 60
+
+# File sinks can only write here, one file per sink name
+FILE_SINK_DIR = os.environ.get("ALERT_SINK_FILE_DIR", os.path.join(os.path.dirname(__file__), 'alert_exports'))
+
+# Webhook and syslog sinks must resolve to public addresses, so users cannot make the
+# backend reach loopback, link-local (cloud metadata), private or reserved networks.
+# Set to true when the SIEM legitimately lives on an internal network.
+ALLOW_PRIVATE_SINKS = os.environ.get("ALERT_SINK_ALLOW_PRIVATE", "false").lower() == "true"
+
+def resolve_public(host, port):
+    """getaddrinfo() results for host; raises ValueError unless every address is public."""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Cannot resolve sink host '{host}': {e}")
+    if ALLOW_PRIVATE_SINKS:
+        return infos
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Sink host '{host}' resolves to a non-public address ({address})")
+    return infos
+
+def _sink_endpoint(sink):
+    """(host, port) a webhook or syslog sink connects to."""
+    if sink["type"] == "webhook":
+        url = urlsplit(sink["url"])
+        return url.hostname, url.port or (443 if url.scheme == "https" else 80)
+    return sink["host"], int(sink.get("port", 514))
+
+def validate_sink(sink):
+    """Return an error message for an invalid sink definition, or None."""
+    if not isinstance(sink, dict) or not sink.get("name"):
+        return "Sink name is required"
+    if not re.match(r'^[\w.-]{1,64}$', sink["name"]):
+        return "Sink name may only contain letters, digits, '.', '_' and '-'"
+    if sink.get("type") not in SINK_TYPES:
+        return f"Sink type must be one of: {', '.join(SINK_TYPES)}"
+    if sink["type"] == "webhook" and not str(sink.get("url", "")).startswith(("http://", "https://")):
+        return "Webhook sinks need an http(s) url"
+    if sink["type"] == "syslog":
+        if not sink.get("host"):
+            return "Syslog sinks need a host"
+        if sink.get("protocol", "udp") not in ("udp", "tcp"):
+            return "Syslog protocol must be 'udp' or 'tcp'"
+    if sink["type"] in ("webhook", "syslog"):
+        try:
+            host, port = _sink_endpoint(sink)
+            if not host:
+                return "Webhook sinks need a url with a host"
+            resolve_public(host, port)
+        except ValueError as e:
+            return str(e)
+    return None
+
+
+class CircuitBreaker:
+    """Closed until too many consecutive failures, then open; after a cooldown one trial (half-open)."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+# --- Sinks ---
+
+class WebhookSink:
+    def __init__(self, config, session):
+        self.config = config
+        self.url = config["url"]
+        self.headers = {"Content-Type": "application/json"}
+        self.headers.update(config.get("headers") or {})
+        self.timeout = config.get("timeout", 10)
+        self.session = session
+
+    def send(self, alerts):
+        # Checked again on every delivery: the name may resolve elsewhere since the sink was saved
+        resolve_public(*_sink_endpoint(self.config))
+        body = json.dumps({"alerts": alerts}, default=json_default)
+        # A redirect could point at an internal address, so none are followed
+        response = self.session.post(self.url, data=body, headers=self.headers, timeout=self.timeout,
+                                     allow_redirects=False)
+        response.raise_for_status()
+
+    def close(self):
+        pass
+
+
+class SyslogSink:
+    def __init__(self, config):
+        self.config = config
+        self.protocol = config.get("protocol", "udp")
+        self.hostname = socket.gethostname()
+        self.address = None
+        self._socket = None
+
+    def _connect(self):
+        if self._socket is None:
+            # Resolved and checked once per connection; the socket uses the checked address
+            family, _, _, _, address = resolve_public(*_sink_endpoint(self.config))[0]
+            if self.protocol == "tcp":
+                self._socket = socket.create_connection(address[:2], timeout=10)
+            else:
+                self._socket = socket.socket(family, socket.SOCK_DGRAM)
+            self.address = address
+        return self._socket
+
+    def _format(self, alert):
+        # RFC 5424: <PRI>VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID SD MSG, facility local0 / warning
+        timestamp = datetime.now().astimezone().isoformat()
+        message = json.dumps(alert, default=json_default)
+        return f"<132>1 {timestamp} {self.hostname} shakuni - alert - {message}".encode('utf-8')
+
+    def send(self, alerts):
+        try:
+            sock = self._connect()
+            for alert in alerts:
+                line = self._format(alert)
+                if self.protocol == "tcp":
+                    # Octet-counting framing (RFC 6587)
+                    sock.sendall(str(len(line)).encode() + b" " + line)
+                else:
+                    sock.sendto(line, self.address)
+        except (OSError, ValueError):
+            self.close()
+            raise
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class FileSink:
+    def __init__(self, config, user_id):
+        directory = os.path.join(FILE_SINK_DIR, user_id)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{config['name']}.ndjson")
+
+    def send(self, alerts):
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(alert, default=json_default) + '\n' for alert in alerts))
+
+    def close(self):
+        pass
+
+
+class SinkChannel:
+    """Queue, breaker and delivery counters for one user's sink."""
+
+    def __init__(self, user_id, config, sink, queue_size):
+        self.user_id = user_id
+        self.config = config
+        self.sink = sink
+        self.batch_size = int(config.get("batch_size", DEFAULT_BATCH_SIZE))
+        self.queue = deque(maxlen=queue_size)
+        self.breaker = CircuitBreaker()
+        self.in_flight = False
+        self.closed = False
+        self.last_flush = time.monotonic()
+        self.sent = 0
+        self.failed_batches = 0
+        self.dropped = 0
+        self.last_error = None
+
+    def status(self):
+        return {
+            "name": self.config["name"],
+            "type": self.config["type"],
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "failed_batches": self.failed_batches,
+            "dropped": self.dropped,
+            "breaker": self.breaker.state,
+            "last_error": self.last_error,
+        }
+
+
+class AlertDispatcher:
+    """
+    Forwards enriched alerts to the sinks each user configures in settings.alert_sinks.
+
+    enqueue() only appends to the sink's bounded in-memory queue, so ingest and the
+    enrichment pipeline never wait on a sink. A flush loop hands full (or aged)
+    batches to a thread pool, with at most one delivery in flight per sink. Deliveries
+    retry with jittered exponential backoff, and repeated failures open the sink's
+    circuit breaker so its batches wait instead of tying up the pool. When a queue is
+    full the oldest alerts are dropped and counted. stop() keeps flushing until the
+    queues are empty or its timeout runs out.
+    """
+
+    def __init__(self, settings_collection, max_workers=4, queue_size=QUEUE_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.settings = settings_collection
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatch")
+        # One pooled keep-alive session shared by every webhook sink
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max_workers * 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # (user_id, sink name) -> SinkChannel
+        self.channels = {}
+        # user_id -> (loaded_at, [sink configs])
+        self._configs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _build_sink(self, user_id, config):
+        if config["type"] == "webhook":
+            return WebhookSink(config, self.session)
+        if config["type"] == "syslog":
+            return SyslogSink(config)
+        return FileSink(config, user_id)
+
+    def _load_sinks(self, user_id):
+        document = self.settings.find_one({"user_id": user_id}, {"alert_sinks": 1, "_id": 0}) or {}
+        return [sink for sink in document.get("alert_sinks", []) if sink.get("enabled", True)]
+
+    def _close_channel(self, key):
+        """Remove a channel; its sink is closed now, or by _deliver when a batch is in flight. Needs self._lock."""
+        channel = self.channels.pop(key)
+        channel.closed = True
+        if not channel.in_flight:
+            channel.sink.close()
+        return channel
+
+    def _apply_sinks(self, user_id, sinks):
+        """
+        Cache a user's sink settings and close channels of sinks that were removed or changed;
+        a changed sink gets a new channel that keeps the queued alerts. Needs self._lock.
+        """
+        self._configs[user_id] = (time.monotonic(), sinks)
+        configs = {config["name"]: config for config in sinks}
+        for key in [key for key, channel in self.channels.items() if key[0] == user_id and channel.config not in sinks]:
+            channel = self._close_channel(key)
+            config = configs.get(key[1])
+            if config is not None:
+                self.channels[key] = SinkChannel(user_id, config, self._build_sink(user_id, config), self.queue_size)
+                self.channels[key].queue.extend(channel.queue)
+            elif channel.queue:
+                log.info("Discarding %s queued alerts for removed sink '%s' of user %s", len(channel.queue), key[1], user_id)
+
+    def _user_sinks(self, user_id):
+        cached = self._configs.get(user_id)
+        if cached and time.monotonic() - cached[0] < SINK_CONFIG_TTL:
+            return cached[1]
+        # Loaded without holding the lock, so a slow query does not stall delivery bookkeeping
+        sinks = self._load_sinks(user_id)
+        with self._lock:
+            self._apply_sinks(user_id, sinks)
+        return sinks
+
+    def invalidate(self, user_id):
+        """Reload a user's sink settings after they change; removed or changed sinks stop delivering."""
+        sinks = self._load_sinks(user_id)
+        with self._lock:
+            self._apply_sinks(user_id, sinks)
+
+    def enqueue(self, kind, alert):
+        user_id = alert.get("user_id")
+        if not user_id:
+            return
+        # Claim bookkeeping from the enrichment pipeline is not part of the alert
+        outgoing = {key: value for key, value in alert.items() if not key.startswith("enrichment_")}
+        outgoing["collection"] = kind
+        sinks = self._user_sinks(user_id)
+        with self._lock:
+            # The cached settings may have been reloaded since; _apply_sinks keeps the channels matching them
+            for config in self._configs.get(user_id, (None, sinks))[1]:
+                key = (user_id, config["name"])
+                channel = self.channels.get(key)
+                if channel is None:
+                    channel = self.channels[key] = SinkChannel(user_id, config, self._build_sink(user_id, config), self.queue_size)
+                if len(channel.queue) == channel.queue.maxlen:
+                    channel.dropped += 1
+                channel.queue.append(outgoing)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dispatch-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop flushing on a schedule, then deliver what is queued for up to `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        while time.monotonic() < deadline:
+            self.flush(force=True)
+            with self._lock:
+                # Sinks behind an open breaker cannot be drained before the deadline
+                pending = any(channel.in_flight or (channel.queue and channel.breaker.state != "open")
+                              for channel in self.channels.values())
+            if not pending:
+                break
+            time.sleep(0.05)
+        undelivered = self.queued()
+        if undelivered:
+            log.warning("Stopping the alert dispatcher with %s undelivered alerts", undelivered)
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+    def _run(self):
+        while not self._stop.wait(0.2):
+            self.flush()
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            for channel in self.channels.values():
+                if channel.in_flight or not channel.queue:
+                    continue
+                due = len(channel.queue) >= channel.batch_size or now - channel.last_flush >= self.flush_interval
+                if not (due or force) or not channel.breaker.allow():
+                    continue
+                batch = [channel.queue.popleft() for _ in range(min(channel.batch_size, len(channel.queue)))]
+                channel.in_flight = True
+                channel.last_flush = now
+                self.executor.submit(self._deliver, channel, batch)
+
+    def _deliver(self, channel, batch):
+        error = None
+        for attempt in range(SEND_ATTEMPTS):
+            try:
+                channel.sink.send(batch)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt + 1 < SEND_ATTEMPTS:
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+                    time.sleep(random.uniform(0, delay))
+        with self._lock:
+            if channel.closed:
+                # The sink was removed or changed while this batch was in flight
+                channel.sink.close()
+                channel.in_flight = False
+                return
+            if error is None:
+                channel.breaker.record_success()
+                channel.sent += len(batch)
+            else:
+                channel.breaker.record_failure()
+                channel.failed_batches += 1
+                channel.last_error = str(error)
+                # Put the batch back in front; with a full queue the newest alerts give way
+                free = channel.queue.maxlen - len(channel.queue)
+                channel.dropped += max(0, len(batch) - free)
+                channel.queue.extendleft(reversed(batch[:free]))
+                log.warning("Delivery to sink '%s' for user %s failed (%s): %s",
+                            channel.config['name'], channel.user_id, channel.breaker.state, error)
+            channel.in_flight = False
+
+    def queued(self):
+        """Alerts waiting in all sink queues of this worker."""
+        with self._lock:
+            return sum(len(channel.queue) for channel in self.channels.values())
+
+    def status(self, user_id):
+        with self._lock:
+            return [channel.status() for (owner, _), channel in self.channels.items() if owner == user_id]
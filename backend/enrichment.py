@@ -0,0 +1,231 @@
+from pymongo import IndexModel, ASCENDING, UpdateOne
+from datetime import datetime, timedelta
+import logging
+import os
+import secrets
+import threading
+import time
+
+from alert_store import ALERT_KINDS
+from normalizers import normalize_alert
+
+log = logging.getLogger(__name__)
+
+# Alerts are written with this status by ingest and lose it once enriched
+PENDING = "pending"
+PROCESSING = "processing"
+
+# A claim older than this is assumed to belong to a dead worker and is taken over
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+# Only pending/claimed alerts carry enrichment_status, so this index stays small
+ENRICHMENT_INDEXES = [
+    IndexModel(
+        [("enrichment_status", ASCENDING), ("_id", ASCENDING)],
+        name="enrichment_status_pending",
+        partialFilterExpression={"enrichment_status": {"$exists": True}}
+    ),
+]
+# Time-series collections take no partial filter on measurement fields
+TIMESERIES_ENRICHMENT_INDEXES = [
+    IndexModel([("meta.kind", ASCENDING), ("enrichment_status", ASCENDING)], name="meta_kind_enrichment_status"),
+]
+
+
+class StageStats:
+    def __init__(self):
+        self.processed = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 3),
+            "per_second": round(self.processed / self.seconds, 1) if self.seconds else None,
+        }
+
+
+class EnrichmentPipeline:
+    """
+    Enriches stored alerts in batches, off the ingest request path.
+
+    Ingest stores each alert with enrichment_status=pending. Worker threads claim
+    pending alerts in batches, run the registered stages in order, and write every
+    stage's fields back with one unordered bulk_write per batch. A stage is a
+    function taking (kind, alert) and returning a dict of fields to $set (or None);
+    fields returned by a stage are visible on the alert to the stages after it.
+    Claims expire after CLAIM_TIMEOUT, so a restarted or crashed worker's batch is
+    picked up again, and per-kind progress is checkpointed in pipeline_checkpoints.
+    """
+
+    def __init__(self, alert_store, checkpoints_collection, workers=2, batch_size=500, poll_interval=1.0):
+        self.alert_store = alert_store
+        self.checkpoints = checkpoints_collection
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stages = []
+        self.stage_stats = {}
+        self.processed = 0
+        self.batches = 0
+        self.lag_seconds = None
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def register_stage(self, name, func):
+        self.stages.append((name, func))
+        self.stage_stats[name] = StageStats()
+
+    def ensure_indexes(self):
+        indexes = ENRICHMENT_INDEXES if self.alert_store.supports_partial_indexes else TIMESERIES_ENRICHMENT_INDEXES
+        # The time-series store keeps every kind in one collection
+        collections = []
+        for kind in ALERT_KINDS:
+            if self.alert_store.collection(kind) not in collections:
+                collections.append(self.alert_store.collection(kind))
+        for collection in collections:
+            collection.create_indexes(indexes)
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"enrichment-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        log.info("Started enrichment pipeline with %s workers and stages: %s", self.workers, [name for name, _ in self.stages])
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            worked = False
+            for kind in ALERT_KINDS:
+                try:
+                    worked = self.process_batch(kind) > 0 or worked
+                except Exception as e:
+                    log.error("Enrichment batch for %s failed: %s", kind, e)
+            if not worked:
+                self._stop.wait(self.poll_interval)
+
+    def _claim(self, kind):
+        """Mark up to batch_size pending (or abandoned) alerts as ours and return them."""
+        collection = self.alert_store.collection(kind)
+        now = datetime.now()
+        claimable = self.alert_store.translate_query(kind, {"$or": [
+            {"enrichment_status": PENDING},
+            {"enrichment_status": PROCESSING, "enrichment_claimed_at": {"$lt": now - CLAIM_TIMEOUT}},
+        ]})
+        ids = [doc["_id"] for doc in collection.find(claimable, {"_id": 1}).sort("_id", 1).limit(self.batch_size)]
+        if not ids:
+            return []
+        token = secrets.token_hex(8)
+        claim_filter = dict(claimable)
+        claim_filter["_id"] = {"$in": ids}
+        collection.update_many(claim_filter, {"$set": {
+            "enrichment_status": PROCESSING, "enrichment_claim": token, "enrichment_claimed_at": now,
+        }})
+        # Another worker may have won some of these ids between the find and the update
+        return list(self.alert_store.find(kind, {"_id": {"$in": ids}, "enrichment_claim": token}))
+
+    def process_batch(self, kind):
+        alerts = self._claim(kind)
+        if not alerts:
+            return 0
+
+        updates = {alert["_id"]: {} for alert in alerts}
+        for name, func in self.stages:
+            stats = self.stage_stats[name]
+            started = time.perf_counter()
+            for alert in alerts:
+                try:
+                    fields = func(kind, alert)
+                except Exception as e:
+                    stats.errors += 1
+                    log.error("Enrichment stage %s failed for alert %s: %s", name, alert['_id'], e)
+                    continue
+                if fields:
+                    alert.update(fields)
+                    updates[alert["_id"]].update(fields)
+            with self._stats_lock:
+                stats.processed += len(alerts)
+                stats.seconds += time.perf_counter() - started
+
+        now = datetime.now()
+        operations = [
+            UpdateOne(
+                self.alert_store.translate_query(kind, {"_id": alert_id}),
+                {
+                    "$set": dict(fields, enriched_at=now),
+                    "$unset": {"enrichment_status": "", "enrichment_claim": "", "enrichment_claimed_at": ""},
+                }
+            )
+            for alert_id, fields in updates.items()
+        ]
+        self.alert_store.collection(kind).bulk_write(operations, ordered=False)
+
+        oldest = min((alert.get("received_at") for alert in alerts if alert.get("received_at")), default=None)
+        with self._stats_lock:
+            self.processed += len(alerts)
+            self.batches += 1
+            if oldest:
+                self.lag_seconds = (now - oldest).total_seconds()
+        self.checkpoints.update_one(
+            {"_id": f"enrichment:{kind}"},
+            {"$max": {"last_id": max(updates)}, "$inc": {"processed": len(alerts)}, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        return len(alerts)
+
+    def status(self):
+        with self._stats_lock:
+            return {
+                "workers": len(self._threads),
+                "processed": self.processed,
+                "batches": self.batches,
+                "lag_seconds": self.lag_seconds,
+                "stages": {name: stats.to_dict() for name, stats in self.stage_stats.items()},
+                "checkpoints": {doc["_id"]: {"last_id": str(doc.get("last_id")), "processed": doc.get("processed", 0)}
+                                for doc in self.checkpoints.find({"_id": {"$regex": "^enrichment:"}})},
+            }
+
+
+def build_enrichment_pipeline(alert_store, checkpoints_collection, geoip_resolver, stats_aggregator, correlation_engine, dispatcher):
+    """The default stage order: normalize (incl. UA class), GeoIP, stats sketches, correlation, dispatch."""
+    pipeline = EnrichmentPipeline(
+        alert_store,
+        checkpoints_collection,
+        workers=int(os.environ.get("ENRICHMENT_WORKERS", 2)),
+        batch_size=int(os.environ.get("ENRICHMENT_BATCH_SIZE", 500)),
+    )
+
+    def normalize_stage(kind, alert):
+        return {"normalized": normalize_alert(alert)}
+
+    def geoip_stage(kind, alert):
+        geo = geoip_resolver.enrich(alert)
+        return {"geo": geo} if geo else None
+
+    def stats_stage(kind, alert):
+        stats_aggregator.observe(alert)
+
+    def correlation_stage(kind, alert):
+        incident_id = correlation_engine.correlate(kind, alert)
+        return {"incident_id": str(incident_id)} if incident_id else None
+
+    def dispatch_stage(kind, alert):
+        # Only queues the fully enriched alert; delivery happens on the dispatcher's threads
+        dispatcher.enqueue(kind, alert)
+
+    pipeline.register_stage("normalize", normalize_stage)
+    pipeline.register_stage("geoip", geoip_stage)
+    pipeline.register_stage("stats", stats_stage)
+    pipeline.register_stage("correlation", correlation_stage)
+    pipeline.register_stage("dispatch", dispatch_stage)
+    return pipeline
@@ -0,0 +1,94 @@
+from functools import lru_cache
+import ipaddress
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+# Recently seen IPs kept in the lookup cache; honeypot traffic repeats the same sources a lot
+GEOIP_CACHE_SIZE = 65536
+
+
+class GeoIPResolver:
+    """
+    Resolves country, ASN and organisation for an IP from local MMDB files.
+
+    The files are opened memory-mapped, so lookups never leave the host and pages are
+    shared between workers through the OS page cache. Accepts MaxMind GeoLite2/GeoIP2
+    Country or City plus ASN databases, or a single combined file (e.g. ipinfo's
+    country_asn.mmdb). Results are cached per IP and must be treated as read-only.
+    """
+
+    def __init__(self, country_db_path=None, asn_db_path=None, cache_size=GEOIP_CACHE_SIZE):
+        self.readers = []
+        if maxminddb is None:
+            if country_db_path or asn_db_path:
+                log.warning("maxminddb is not installed; GeoIP enrichment is disabled")
+        else:
+            for path in dict.fromkeys(p for p in (country_db_path, asn_db_path) if p):
+                try:
+                    # MODE_AUTO memory-maps the file, using the C extension when it is available
+                    self.readers.append(maxminddb.open_database(path, maxminddb.MODE_AUTO))
+                    log.info("Loaded GeoIP database %s", path)
+                except (OSError, ValueError) as e:
+                    log.error("Could not open GeoIP database %s: %s", path, e)
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            country_db_path=os.environ.get("GEOIP_COUNTRY_DB"),
+            asn_db_path=os.environ.get("GEOIP_ASN_DB"),
+            cache_size=int(os.environ.get("GEOIP_CACHE_SIZE", GEOIP_CACHE_SIZE)),
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.readers)
+
+    def _lookup(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if not address.is_global:
+            return None
+
+        geo = {}
+        for reader in self.readers:
+            record = reader.get(address)
+            if not record:
+                continue
+            country = record.get("country")
+            if isinstance(country, dict):
+                # MaxMind layout: {"country": {"iso_code": ..., "names": {...}}}
+                geo.setdefault("country", country.get("iso_code"))
+                geo.setdefault("country_name", (country.get("names") or {}).get("en"))
+            elif country:
+                # ipinfo layout: flat country / country_name / asn / as_name
+                geo.setdefault("country", country)
+                geo.setdefault("country_name", record.get("country_name"))
+            if record.get("autonomous_system_number"):
+                geo.setdefault("asn", f"AS{record['autonomous_system_number']}")
+                geo.setdefault("org", record.get("autonomous_system_organization"))
+            elif record.get("asn"):
+                geo.setdefault("asn", record["asn"])
+                geo.setdefault("org", record.get("as_name"))
+        return {key: value for key, value in geo.items() if value} or None
+
+    def enrich(self, alert):
+        """Return the geo subdocument for an alert's normalized source IP, or None."""
+        if not self.readers:
+            return None
+        ip = (alert.get("normalized") or {}).get("source_ip")
+        return self.lookup(ip) if ip else None
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+        self.readers = []
@@ -0,0 +1,85 @@
+"""
+Gunicorn settings for the Shakuni backend.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+    kill -HUP <master pid>    # graceful reload: new workers start, old ones finish in-flight requests
+
+Tuned for many small ingest requests arriving while a few Terraform deployments run
+for minutes: gthread workers serve requests from a thread pool, so a blocking
+`terraform apply` occupies one thread rather than a whole worker, and the worker's
+main thread keeps heart-beating so the arbiter does not kill it mid-deploy. Every
+setting can be overridden from the environment.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# --- Workers ---
+# Processes give ingest CPU parallelism (JSON parsing, bcrypt); threads absorb blocking I/O
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+backlog = int(os.environ.get("GUNICORN_BACKLOG", 2048))
+# Load the app in the master so workers fork with imports done (faster spawn and reload)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# --- Timeouts ---
+# Worker heartbeat timeout; long requests on other threads do not count against it
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+# Time old workers get to finish in-flight requests and flush background state on reload/stop
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# Honeypot forwarders reuse connections between batches
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers periodically (staggered by jitter) to bound memory growth
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 20000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 2000))
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Workers share metrics through snapshot files here (see metrics.py); stale ones
+    # from a previous server run would be counted again, so the directory starts empty
+    directory = os.environ.get("METRICS_DIR") or tempfile.mkdtemp(prefix="shakuni-metrics-")
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.unlink(path)
+    os.environ["METRICS_DIR"] = directory
+    server.log.info(f"Sharing worker metrics through {directory}")
+
+
+def post_fork(server, worker):
+    from app import mark_process_start
+    from db import services
+    from metrics import registry
+    import logging_config
+
+    # Anything the master built before forking belongs to the master
+    services.reset()
+    registry.reset()
+    logging_config.reset_after_fork()
+    mark_process_start()
+
+
+def post_worker_init(worker):
+    from db import services
+
+    services.ensure_indexes_in_background()
+    services.start_background()
+    worker.log.info(f"Worker {worker.pid} started background services")
+
+
+def worker_exit(server, worker):
+    from db import services
+    import logging_config
+
+    # Flush dispatcher queues and stats sketches before the process goes away
+    services.stop_background()
+    logging_config.stop_logging()
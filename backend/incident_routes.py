@@ -0,0 +1,91 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+import logging
+
+from correlation import severity_label, SEVERITY_LABELS
+from alert_routes import serialize_alert
+from db import services
+
+log = logging.getLogger(__name__)
+
+# Initialize Blueprint
+incident_bp = Blueprint('incident_bp', __name__)
+
+INCIDENT_DEFAULT_LIMIT = 50
+INCIDENT_MAX_LIMIT = 200
+# Member alerts returned with an incident's details
+INCIDENT_DETAIL_ALERTS = 100
+
+def serialize_incident(incident, include_members=False):
+    data = {
+        "id": str(incident["_id"]),
+        "first_seen": incident["first_seen"].isoformat() if isinstance(incident.get("first_seen"), datetime) else incident.get("first_seen"),
+        "last_seen": incident["last_seen"].isoformat() if isinstance(incident.get("last_seen"), datetime) else incident.get("last_seen"),
+        "alert_count": incident.get("alert_count", 0),
+        "severity": severity_label(incident.get("severity_score", 1)),
+        "severity_score": incident.get("severity_score", 1),
+        "keys": incident.get("keys", []),
+    }
+    if include_members:
+        data["members"] = [
+            {
+                "alert_id": str(member["alert_id"]),
+                "collection": member.get("collection"),
+                "received_at": member["received_at"].isoformat() if isinstance(member.get("received_at"), datetime) else member.get("received_at"),
+            }
+            for member in incident.get("members", [])
+        ]
+    return data
+
+@incident_bp.route('', methods=['GET'])
+@jwt_required()
+def list_incidents():
+    """List the current user's incidents, most recently active first. Supports min_severity and limit."""
+    current_user_id = get_jwt_identity()
+    try:
+        limit = max(1, min(int(request.args.get('limit', INCIDENT_DEFAULT_LIMIT)), INCIDENT_MAX_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid limit parameter."}), 400
+
+    query = {"user_id": current_user_id}
+    min_severity = request.args.get('min_severity')
+    if min_severity:
+        thresholds = {label: threshold for threshold, label in SEVERITY_LABELS}
+        if min_severity not in thresholds:
+            return jsonify({"error": f"Unknown severity '{min_severity}'."}), 400
+        query["severity_score"] = {"$gte": thresholds[min_severity]}
+
+    try:
+        incidents = services.incidents_collection.find(query, {"members": 0}).sort("last_seen", -1).limit(limit)
+        return jsonify([serialize_incident(incident) for incident in incidents]), 200
+    except Exception as e:
+        log.error("Error fetching incidents for user %s: %s", current_user_id, e)
+        return jsonify({"error": "Failed to fetch incidents"}), 500
+
+@incident_bp.route('/<string:incident_id>', methods=['GET'])
+@jwt_required()
+def get_incident(incident_id):
+    """Return one incident with its member references and the most recent member alerts."""
+    current_user_id = get_jwt_identity()
+    try:
+        incident = services.incidents_collection.find_one({"_id": ObjectId(incident_id), "user_id": current_user_id})
+    except InvalidId:
+        return jsonify({"error": "Invalid incident id."}), 400
+    if not incident:
+        return jsonify({"error": "Incident not found"}), 404
+
+    data = serialize_incident(incident, include_members=True)
+
+    # Fetch the most recent member alerts from each collection they were stored in
+    recent = incident.get("members", [])[-INCIDENT_DETAIL_ALERTS:]
+    alerts = []
+    for kind in {member["collection"] for member in recent}:
+        alert_ids = [member["alert_id"] for member in recent if member["collection"] == kind]
+        alerts.extend(services.alert_store.find(kind, {"user_id": current_user_id, "_id": {"$in": alert_ids}}))
+    alerts.sort(key=lambda alert: alert.get("received_at") or datetime.min, reverse=True)
+    data["alerts"] = [serialize_alert(alert) for alert in alerts]
+
+    return jsonify(data), 200
@@ -0,0 +1,186 @@
+"""
+Request parsing and alert documents shared by the ingest endpoints.
+
+The Flask routes in log_routes.py and the asyncio service in ingest_service.py accept
+the same callbacks and must store identical alerts, so everything that does not touch
+the web framework or the database driver lives here. Validation problems are raised
+as IngestError and rendered by each caller as {"error": message} with its status.
+"""
+from datetime import datetime
+from werkzeug.datastructures import LanguageAccept
+from werkzeug.http import parse_accept_header
+import json
+import zlib
+
+from enrichment import PENDING
+from metrics import registry
+from ua_classifier import classify_user_agent
+
+# Limits for /ingest/batch; the byte limit applies to the body as sent and again after decompression
+MAX_BATCH_EVENTS = 1000
+MAX_BATCH_BYTES = 10 * 1024 * 1024
+
+INGESTED_ALERTS = registry.counter("shakuni_ingested_alerts_total", "Alerts stored by ingest", ("collection", "source"))
+API_KEY_LOOKUP_SECONDS = registry.histogram("shakuni_api_key_lookup_duration_seconds", "Settings lookup by API key")
+
+
+class IngestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def is_json_mimetype(mimetype):
+    """Same rule as Flask's request.is_json."""
+    return mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+
+
+def user_id_for(user_settings):
+    """The owner of a settings document found by API key; raises IngestError when there is none."""
+    if not user_settings:
+        raise IngestError(401, "Invalid API key")
+    user_id = user_settings.get("user_id")
+    if not user_id:
+        # Should not happen for a found key, but the document would be unusable
+        raise IngestError(500, "Internal server error: User ID mapping issue")
+    return user_id
+
+
+# --- POST /ingest ---
+def build_log_entry(user_id, log_data):
+    if not log_data:
+        raise IngestError(400, "No log data provided")
+    return {
+        "user_id": user_id,
+        "received_at": datetime.now(),
+        "source": "api_ingest", # Indicate the source of the log
+        "raw_message": log_data, # Store the entire received JSON payload
+        # Normalization, GeoIP, stats and correlation run in the enrichment pipeline
+        "enrichment_status": PENDING
+    }
+
+
+# --- POST /ingest/batch ---
+def parse_batch(body, content_encoding):
+    """Events from a batch body ({"events": [...]} or a JSON list, optionally gzip-compressed)."""
+    if (content_encoding or '').lower() == 'gzip':
+        # Bounded decompression, so a small gzip bomb cannot exhaust memory
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            body = decompressor.decompress(body, MAX_BATCH_BYTES)
+        except zlib.error:
+            raise IngestError(400, "Invalid gzip body")
+        if decompressor.unconsumed_tail:
+            raise IngestError(413, "Batch too large")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise IngestError(400, "Request body must be JSON")
+
+    events = payload.get("events") if isinstance(payload, dict) else payload
+    if not isinstance(events, list) or not events:
+        raise IngestError(400, "No events provided")
+    if len(events) > MAX_BATCH_EVENTS:
+        raise IngestError(413, f"At most {MAX_BATCH_EVENTS} events per batch")
+    return events
+
+
+def build_batch_entries(user_id, events):
+    received_at = datetime.now()
+    return [
+        {
+            "user_id": user_id,
+            "received_at": received_at,
+            "source": "api_ingest_batch",
+            "raw_message": event,
+            "enrichment_status": PENDING
+        }
+        for event in events
+    ]
+
+
+def failed_indexes(bulk_write_error):
+    """Indexes of the events an unordered insert_many could not store."""
+    return sorted({error["index"] for error in bulk_write_error.details.get("writeErrors", [])})
+
+
+# --- GET /ingest ---
+def client_address(peer, forwarded_for, trusted_hops):
+    """
+    The client of a request: the peer, or with trusted_hops proxies in front the
+    X-Forwarded-For entry that many hops from the end (as werkzeug's ProxyFix).
+    """
+    if trusted_hops and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return peer
+
+
+def query_log_data(args):
+    """All query parameters except api_key."""
+    log_data = {key: value for key, value in args.items() if key != 'api_key'}
+    if not log_data:
+        raise IngestError(400, "No log data provided in query parameters")
+    return log_data
+
+
+def build_client_info(remote_addr, host, method, path, url, headers, cookies):
+    """Everything known about the client of a pixel or link callback; headers must be case-insensitive."""
+    user_agent = headers.get('User-Agent', 'Unknown')
+    ua_details = classify_user_agent(user_agent)
+    return {
+        # Basic connection info
+        "ip_address": remote_addr,
+        "x_forwarded_for": headers.get('X-Forwarded-For', 'Unknown'),  # For clients behind proxies
+        "host": host,
+        "method": method,
+        "path": path,
+        "url": url,
+        "timestamp": datetime.now().isoformat(),
+
+        # User agent details, from the memoized classifier instead of re-parsing every request
+        "user_agent": user_agent,
+        "browser": ua_details["ua_name"] or 'Unknown',
+        "platform": ua_details["ua_platform"] or 'Unknown',
+        "version": ua_details["ua_version"] or 'Unknown',
+        "language": parse_accept_header(headers.get('Accept-Language'), LanguageAccept).best or 'Unknown',
+
+        # HTTP headers
+        "referer": headers.get('Referer', 'Unknown'),
+        "accept": headers.get('Accept', 'Unknown'),
+        "accept_encoding": headers.get('Accept-Encoding', 'Unknown'),
+        "accept_language": headers.get('Accept-Language', 'Unknown'),
+        "cache_control": headers.get('Cache-Control', 'Unknown'),
+        "connection": headers.get('Connection', 'Unknown'),
+        "dnt": headers.get('DNT', 'Unknown'),  # Do Not Track
+        "origin": headers.get('Origin', 'Unknown'),
+        "pragma": headers.get('Pragma', 'Unknown'),
+        "sec_fetch_dest": headers.get('Sec-Fetch-Dest', 'Unknown'),
+        "sec_fetch_mode": headers.get('Sec-Fetch-Mode', 'Unknown'),
+        "sec_fetch_site": headers.get('Sec-Fetch-Site', 'Unknown'),
+        "sec_fetch_user": headers.get('Sec-Fetch-User', 'Unknown'),
+        "upgrade_insecure_requests": headers.get('Upgrade-Insecure-Requests', 'Unknown'),
+
+        # Cookies (if any)
+        "cookies": {key: value for key, value in cookies.items()} if cookies else {},
+
+        # All headers (for any we missed)
+        "all_headers": {key: value for key, value in headers.items()}
+    }
+
+
+def build_get_entry(user_id, log_data, alert_type, client_info):
+    """The alert for a GET callback and the collection it belongs in (generic_alerts when typed)."""
+    log_entry = {
+        "user_id": user_id,
+        "received_at": datetime.now(),
+        "type": alert_type or "unknown",  # Store the type of generic log ingestion
+        "source": "api_ingest_get",  # Indicate this came from GET request
+        "client_info": client_info,  # Add client information
+        "raw_message": log_data,
+        "enrichment_status": PENDING
+    }
+    # Untyped callbacks stay in cloud_alerts for backward compatibility
+    return log_entry, "generic_alerts" if alert_type else "cloud_alerts"
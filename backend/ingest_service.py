@@ -0,0 +1,312 @@
+"""
+Standalone asyncio service for the public ingest callbacks.
+
+Serves POST /api/logs/ingest, POST /api/logs/ingest/batch and GET /api/logs/ingest
+with the same requests, responses and stored alerts as the Flask routes (the shared
+parts are in ingest_common.py), on aiohttp and the motor driver. One event loop holds
+tens of thousands of idle keep-alive callbacks, so an attack wave is absorbed here
+instead of by the management API's thread pool and its Terraform runs.
+
+Route /api/logs/ingest* to this service at the reverse proxy and keep the management
+API (wsgi.py) for everything else: it still runs the enrichment pipeline that picks up
+the alerts stored here, and creates the indexes and the time-series collection this
+service writes to. Settings lookups by API key are cached for
+INGEST_API_KEY_CACHE_SECONDS, so a deleted key is accepted here for up to that long.
+Ingest rates are shared with the management API through MongoDB, so /api/stats/rates
+there includes the callbacks served here. Set TRUSTED_PROXY_HOPS as for the management
+API, or every callback records the proxy's address.
+
+Usage:
+    pip install aiohttp motor
+    python ingest_service.py --port 5001
+    # one process per core sharing the port (Linux):
+    for i in $(seq $(nproc)); do python ingest_service.py --port 5001 --reuse-port & done
+"""
+from aiohttp import web
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+import argparse
+import asyncio
+import logging
+import os
+import secrets
+import time
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from alert_store import TIMESERIES_COLLECTION, TimeSeriesAlertStore, create_alert_store
+from ingest_common import (IngestError, INGESTED_ALERTS, API_KEY_LOOKUP_SECONDS, MAX_BATCH_BYTES, build_batch_entries,
+                           build_client_info, build_get_entry, build_log_entry, client_address, failed_indexes,
+                           is_json_mimetype, parse_batch, query_log_data, user_id_for)
+from metrics import registry
+from rate_monitor import RateMonitor
+import db
+import logging_config
+
+log = logging.getLogger("ingest_service")
+
+INGEST_API_KEY_CACHE_SECONDS = int(os.environ.get("INGEST_API_KEY_CACHE_SECONDS", 30))
+API_KEY_CACHE_SIZE = 100000
+INGEST_KEEPALIVE_SECONDS = int(os.environ.get("INGEST_KEEPALIVE_SECONDS", 75))
+INGEST_BACKLOG = int(os.environ.get("INGEST_BACKLOG", 4096))
+# Reverse proxies in front of this service, as for the management API (see app.py)
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+
+
+class AsyncAlertWriter:
+    """Inserts alerts like the configured ALERT_STORE does, through motor."""
+
+    def __init__(self, database, backend):
+        self.database = database
+        self.timeseries = backend == "timeseries"
+
+    def _collection(self, kind):
+        return self.database[TIMESERIES_COLLECTION] if self.timeseries else self.database[kind]
+
+    def _document(self, kind, alert):
+        return TimeSeriesAlertStore.to_document(kind, alert) if self.timeseries else alert
+
+    async def insert_one(self, kind, alert):
+        document = self._document(kind, alert)
+        result = await self._collection(kind).insert_one(document)
+        alert["_id"] = result.inserted_id
+        return result
+
+    async def insert_many(self, kind, alerts):
+        documents = [self._document(kind, alert) for alert in alerts]
+        try:
+            return await self._collection(kind).insert_many(documents, ordered=False)
+        finally:
+            for alert, document in zip(alerts, documents):
+                alert["_id"] = document.get("_id")
+
+
+class ApiKeyCache:
+    """Settings lookups by API key, kept for a short TTL; unknown keys are always looked up."""
+
+    def __init__(self, settings_collection, ttl=INGEST_API_KEY_CACHE_SECONDS):
+        self.settings = settings_collection
+        self.ttl = ttl
+        self.entries = {}
+
+    async def find(self, api_key):
+        now = time.monotonic()
+        cached = self.entries.get(api_key)
+        if cached and cached[0] > now:
+            return cached[1]
+        with API_KEY_LOOKUP_SECONDS.time():
+            user_settings = await self.settings.find_one({"api_keys.key": api_key}, {"user_id": 1})
+        if user_settings:
+            if len(self.entries) >= API_KEY_CACHE_SIZE:
+                self.entries.clear()
+            self.entries[api_key] = (now + self.ttl, user_settings)
+        return user_settings
+
+
+# --- Handlers ---
+CLIENT = web.AppKey("client", AsyncIOMotorClient)
+WRITER = web.AppKey("writer", AsyncAlertWriter)
+API_KEYS = web.AppKey("api_keys", ApiKeyCache)
+RATE_MONITOR = web.AppKey("rate_monitor", RateMonitor)
+SYNC_CLIENT = web.AppKey("sync_client", object)
+TASKS = web.AppKey("tasks", list)
+
+def _error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+def _ingest_error(api_key, error):
+    if error.status == 500:
+        log.error("API key %s... rejected: %s", api_key[:4], error.message)
+    return _error(error.status, error.message)
+
+
+async def ingest_log(request):
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        return _error(401, "API key is required")
+    try:
+        user_id = user_id_for(await request.app[API_KEYS].find(api_key))
+        if not is_json_mimetype(request.content_type):
+            return _error(400, "Request must be JSON")
+        try:
+            log_data = await request.json()
+        except ValueError:
+            return _error(400, "Request body must be JSON")
+        log_entry = build_log_entry(user_id, log_data)
+    except IngestError as e:
+        return _ingest_error(api_key, e)
+
+    try:
+        result = await request.app[WRITER].insert_one("cloud_alerts", log_entry)
+        INGESTED_ALERTS.inc("cloud_alerts", "api_ingest")
+        request.app[RATE_MONITOR].observe(log_entry)
+        return web.json_response({"message": "Log ingested successfully", "log_id": str(result.inserted_id)}, status=201)
+    except Exception as e:
+        log.error("Error inserting log for user %s: %s", user_id, e)
+        return _error(500, "Failed to ingest log")
+
+
+async def ingest_log_batch(request):
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        return _error(401, "API key is required")
+    try:
+        user_id = user_id_for(await request.app[API_KEYS].find(api_key))
+        try:
+            body = await request.read()
+        except web.HTTPRequestEntityTooLarge:
+            return _error(413, "Batch too large")
+        events = parse_batch(body, request.headers.get('Content-Encoding'))
+    except IngestError as e:
+        return _ingest_error(api_key, e)
+    log_entries = build_batch_entries(user_id, events)
+
+    failed = []
+    try:
+        await request.app[WRITER].insert_many("cloud_alerts", log_entries)
+    except BulkWriteError as e:
+        failed = failed_indexes(e)
+    except Exception as e:
+        log.error("Error inserting log batch for user %s: %s", user_id, e)
+        return _error(500, "Failed to ingest logs")
+
+    INGESTED_ALERTS.inc("cloud_alerts", "api_ingest_batch", amount=len(events) - len(failed))
+    for index, log_entry in enumerate(log_entries):
+        if index not in failed:
+            request.app[RATE_MONITOR].observe(log_entry)
+    return web.json_response({"message": "Logs ingested", "inserted": len(events) - len(failed), "failed": failed},
+                             status=201 if not failed else 207)
+
+
+async def ingest_log_get(request):
+    api_key = request.headers.get('X-API-Key') or request.query.get('api_key')
+    if not api_key:
+        return _error(401, "API key is required")
+    try:
+        user_id = user_id_for(await request.app[API_KEYS].find(api_key))
+        # First value of each parameter, as Flask's request.args.items() gives
+        log_data = query_log_data({key: request.query.get(key) for key in request.query})
+    except IngestError as e:
+        return _ingest_error(api_key, e)
+
+    remote_addr = client_address(request.remote, request.headers.get('X-Forwarded-For'), TRUSTED_PROXY_HOPS)
+    client_info = build_client_info(remote_addr, request.host, request.method, request.path, str(request.url),
+                                    request.headers, request.cookies)
+    log_entry, collection_name = build_get_entry(user_id, log_data, request.query.get('type'), client_info)
+    try:
+        result = await request.app[WRITER].insert_one(collection_name, log_entry)
+        INGESTED_ALERTS.inc(collection_name, "api_ingest_get")
+        request.app[RATE_MONITOR].observe(log_entry)
+        return web.json_response({"message": "Log ingested successfully", "log_id": str(result.inserted_id)}, status=201)
+    except Exception as e:
+        log.error("Error inserting log for user %s: %s", user_id, e)
+        return _error(500, "Failed to ingest log")
+
+
+async def health_check(request):
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(request.app[CLIENT].admin.command("ping"), db.HEALTH_PING_TIMEOUT_MS / 1000)
+        mongo = {"ok": True}
+    except Exception as e:
+        mongo = {"ok": False, "error": str(e)}
+    mongo["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return web.json_response({"status": "healthy" if mongo["ok"] else "unhealthy", "mongo": mongo},
+                             status=200 if mongo["ok"] else 503)
+
+
+async def prometheus_metrics(request):
+    token = os.environ.get("METRICS_TOKEN")
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return _error(401, "Unauthorized")
+    return web.Response(body=registry.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+# --- Lifecycle ---
+async def _every(seconds, fn):
+    """Run a blocking job periodically on the default executor, off the event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await loop.run_in_executor(None, fn)
+        except Exception as e:
+            log.error("Periodic job %s failed: %s", fn.__qualname__, e)
+
+
+async def _start(app):
+    mongo_uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017/shakuni")
+    backend = os.environ.get("ALERT_STORE", "collections")
+    app[CLIENT] = AsyncIOMotorClient(
+        mongo_uri,
+        maxPoolSize=db.MONGO_MAX_POOL_SIZE,
+        minPoolSize=db.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=db.MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=db.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=db.MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=db.MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=db.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        retryWrites=True,
+        appname="shakuni-ingest",
+        event_listeners=[db.CommandTimer()],
+    )
+    fast_db = app[CLIENT].get_database(db.DB_NAME, write_concern=db.FAST_WRITE_CONCERN)
+    app[WRITER] = AsyncAlertWriter(fast_db, backend)
+    app[API_KEYS] = ApiKeyCache(app[CLIENT].get_database(db.DB_NAME).settings)
+
+    # The rate monitor uses blocking pymongo; its check (flush, evaluation, anomaly inserts) runs on the executor
+    app[SYNC_CLIENT] = db.create_client(mongo_uri)
+    sync_db = app[SYNC_CLIENT].get_database(db.DB_NAME, write_concern=db.FAST_WRITE_CONCERN)
+    app[RATE_MONITOR] = RateMonitor(create_alert_store(sync_db, backend), sync_db.ingest_rate_streams,
+                                    sync_db.ingest_rate_slots, check_seconds=db.RATE_CHECK_SECONDS)
+    app[TASKS] = [asyncio.create_task(_every(db.RATE_CHECK_SECONDS, app[RATE_MONITOR].check))]
+    # Under METRICS_DIR, share this process's metrics like a gunicorn worker does
+    app[TASKS].append(asyncio.create_task(_every(db.METRICS_FLUSH_SECONDS, registry.write_snapshot)))
+    log.info("Ingest service started (alert store: %s)", backend)
+
+
+async def _stop(app):
+    for task in app[TASKS]:
+        task.cancel()
+    await asyncio.gather(*app[TASKS], return_exceptions=True)
+    # Counts since the last check would otherwise be missing from the shared rates
+    await asyncio.get_running_loop().run_in_executor(None, app[RATE_MONITOR].flush)
+    registry.write_snapshot(final=True)
+    app[CLIENT].close()
+    app[SYNC_CLIENT].close()
+
+
+def create_app():
+    # Bodies are read as sent (gzip batches are decompressed with a bound by parse_batch), up to this size
+    app = web.Application(client_max_size=MAX_BATCH_BYTES, handler_args={"auto_decompress": False})
+    app.router.add_post('/api/logs/ingest', ingest_log)
+    app.router.add_post('/api/logs/ingest/batch', ingest_log_batch)
+    app.router.add_get('/api/logs/ingest', ingest_log_get)
+    app.router.add_get('/api/health', health_check)
+    app.router.add_get('/metrics', prometheus_metrics)
+    app.on_startup.append(_start)
+    app.on_cleanup.append(_stop)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shakuni asyncio ingest service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("INGEST_PORT", 5001)))
+    parser.add_argument("--reuse-port", action="store_true", help="Let several processes bind the same port (SO_REUSEPORT)")
+    args = parser.parse_args()
+
+    logging_config.configure_logging()
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    # No access log: at callback rates it would cost more than the inserts
+    web.run_app(create_app(), host=args.host, port=args.port, reuse_port=args.reuse_port,
+                backlog=INGEST_BACKLOG, keepalive_timeout=INGEST_KEEPALIVE_SECONDS, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
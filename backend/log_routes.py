@@ -1,193 +1,155 @@
 from flask import Blueprint, request, jsonify, send_file
-from datetime import datetime
+from pymongo.errors import BulkWriteError
 import logging
 import secrets
 import os
 import tempfile
 
-# Import the PDF generator
-from pdf_generator import generate_pdf
+from db import services
+from ingest_common import (IngestError, INGESTED_ALERTS, API_KEY_LOOKUP_SECONDS, MAX_BATCH_BYTES, build_batch_entries,
+                           build_client_info, build_get_entry, build_log_entry, failed_indexes, parse_batch, query_log_data,
+                           user_id_for)
+from metrics import registry
+import profiling
+
+log = logging.getLogger(__name__)
 
 # Initialize Blueprint
 log_bp = Blueprint('log_bp', __name__)
 
+PDF_GENERATION_SECONDS = registry.histogram("shakuni_pdf_generation_duration_seconds", "Tracking PDF generation")
+
+def _ingest_error(api_key, error):
+    if error.status == 500:
+        log.error("API key %s... rejected: %s", api_key[:4], error.message)
+    return jsonify({"error": error.message}), error.status
+
+def _read_batch_body():
+    """The request body, refused with 413 once it exceeds MAX_BATCH_BYTES on the wire (also for chunked uploads)."""
+    if request.content_length is not None and request.content_length > MAX_BATCH_BYTES:
+        raise IngestError(413, "Batch too large")
+    body = request.stream.read(MAX_BATCH_BYTES + 1)
+    if len(body) > MAX_BATCH_BYTES:
+        raise IngestError(413, "Batch too large")
+    return body
+
+def find_settings_by_api_key(api_key):
+    """The settings document holding api_key, or None."""
+    with API_KEY_LOOKUP_SECONDS.time(), profiling.phase("api_key_lookup"):
+        return services.settings_collection.find_one({"api_keys.key": api_key})
+
 @log_bp.route('/ingest', methods=['POST'])
 def ingest_log():
-    # Placeholder: Access MongoDB collection (replace with actual method)
-    # Assuming cloud_alerts_collection is accessible via app context or direct import
-    try:
-        from app import cloud_alerts_collection, settings_collection
-    except ImportError:
-        logging.error("Could not import collections from app. Ensure MongoDB is initialized.")
-        return jsonify({"error": "Server configuration error"}), 500
-
     # Get API key from request header
     api_key = request.headers.get('X-API-Key')
     if not api_key:
         return jsonify({"error": "API key is required"}), 401
-    
-    # Find user by API key within the api_keys list
-    user_settings = settings_collection.find_one({"api_keys.key": api_key})
-    if not user_settings:
-        return jsonify({"error": "Invalid API key"}), 401
-
-    # Extract the user_id associated with the settings document
-    user_id = user_settings.get("user_id")
-    if not user_id:
-        # This case should ideally not happen if the key is found, but good to check
-        logging.error(f"API key {api_key[:4]}... found, but no associated user_id in document {user_settings.get('_id')}")
-        return jsonify({"error": "Internal server error: User ID mapping issue"}), 500
-    
-    # Check if the request has JSON data
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
 
-    log_data = request.get_json()
-
-    if not log_data:
-        return jsonify({"error": "No log data provided"}), 400
+    try:
+        # Find user by API key within the api_keys list
+        user_id = user_id_for(find_settings_by_api_key(api_key))
 
-    # Prepare the document to be inserted
-    log_entry = {
-        "user_id": user_id,
-        "received_at": datetime.now(),
-        "source": "api_ingest", # Indicate the source of the log
-        "raw_message": log_data # Store the entire received JSON payload
-        # You could add more specific fields here if you parse log_data further
-        # e.g., "event_time": log_data.get('timestamp'), "details": log_data.get('details')
-    }
+        # Check if the request has JSON data
+        if not request.is_json:
+            return jsonify({"error": "Request must be JSON"}), 400
+        log_entry = build_log_entry(user_id, request.get_json())
+    except IngestError as e:
+        return _ingest_error(api_key, e)
 
     try:
         # Insert the log entry into the collection
-        result = cloud_alerts_collection.insert_one(log_entry)
-        logging.info(f"Successfully ingested log for user {user_id}. Inserted ID: {result.inserted_id}")
+        result = services.alert_store.insert_one("cloud_alerts", log_entry)
+        INGESTED_ALERTS.inc("cloud_alerts", "api_ingest")
+        services.rate_monitor.observe(log_entry)
+        # Per-alert lines are debug: at ingest rates they cost more than the insert
+        log.debug("Ingested log %s for user %s", result.inserted_id, user_id,
+                  extra={"user_id": user_id, "collection": "cloud_alerts"})
         return jsonify({"message": "Log ingested successfully", "log_id": str(result.inserted_id)}), 201
     except Exception as e:
-        logging.error(f"Error inserting log for user {user_id}: {e}")
+        log.error("Error inserting log for user %s: %s", user_id, e)
         return jsonify({"error": "Failed to ingest log"}), 500
 
-@log_bp.route('/ingest', methods=['GET'])
-def ingest_log_get():
-    # Access MongoDB collections
+@log_bp.route('/ingest/batch', methods=['POST'])
+def ingest_log_batch():
+    """
+    Store many events in one request, as sent by the Lambda forwarder.
+
+    Body: {"events": [...]} or a JSON list, optionally with Content-Encoding: gzip.
+    Responds with the indexes of events that could not be stored in "failed", so the
+    sender can retry only those.
+    """
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        return jsonify({"error": "API key is required"}), 401
+
+    try:
+        body = _read_batch_body()
+        user_id = user_id_for(find_settings_by_api_key(api_key))
+        events = parse_batch(body, request.headers.get('Content-Encoding'))
+    except IngestError as e:
+        return _ingest_error(api_key, e)
+    log_entries = build_batch_entries(user_id, events)
+
+    failed = []
     try:
-        from app import cloud_alerts_collection, settings_collection, generic_alerts_collection
-    except ImportError:
-        logging.error("Could not import collections from app. Ensure MongoDB is initialized.")
-        return jsonify({"error": "Server configuration error"}), 500
+        services.alert_store.insert_many("cloud_alerts", log_entries, ordered=False)
+    except BulkWriteError as e:
+        failed = failed_indexes(e)
+    except Exception as e:
+        log.error("Error inserting log batch for user %s: %s", user_id, e)
+        return jsonify({"error": "Failed to ingest logs"}), 500
+
+    INGESTED_ALERTS.inc("cloud_alerts", "api_ingest_batch", amount=len(events) - len(failed))
+    for index, log_entry in enumerate(log_entries):
+        if index not in failed:
+            services.rate_monitor.observe(log_entry)
+    log.debug("Ingested batch of %s/%s logs for user %s", len(events) - len(failed), len(events), user_id,
+              extra={"user_id": user_id, "collection": "cloud_alerts"})
+    return jsonify({"message": "Logs ingested", "inserted": len(events) - len(failed), "failed": failed}), 201 if not failed else 207
 
+@log_bp.route('/ingest', methods=['GET'])
+def ingest_log_get():
     # Get API key from request header or query parameter
     api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
     if not api_key:
         return jsonify({"error": "API key is required"}), 401
-    
-    # Find user by API key
-    user_settings = settings_collection.find_one({"api_keys.key": api_key})
-    if not user_settings:
-        return jsonify({"error": "Invalid API key"}), 401
 
-    # Extract the user_id
-    user_id = user_settings.get("user_id")
-    if not user_id:
-        logging.error(f"API key {api_key[:4]}... found, but no associated user_id in document {user_settings.get('_id')}")
-        return jsonify({"error": "Internal server error: User ID mapping issue"}), 500
-    
-    # Get log data from query parameters
-    # Extract all query parameters except api_key
-    log_data = {}
-    for key, value in request.args.items():
-        if key != 'api_key':
-            log_data[key] = value
-    
-    if not log_data:
-        return jsonify({"error": "No log data provided in query parameters"}), 400
+    try:
+        # Find user by API key
+        user_id = user_id_for(find_settings_by_api_key(api_key))
+        # Log data is every query parameter except api_key
+        log_data = query_log_data(request.args)
+    except IngestError as e:
+        return _ingest_error(api_key, e)
 
-    # Check if type parameter is provided to determine which collection to use
-    alert_type = request.args.get('type')
-    
     # Capture comprehensive client information
-    client_info = {
-        # Basic connection info
-        "ip_address": request.remote_addr,
-        "x_forwarded_for": request.headers.get('X-Forwarded-For', 'Unknown'),  # For clients behind proxies
-        "host": request.host,
-        "method": request.method,
-        "path": request.path,
-        "url": request.url,
-        "timestamp": datetime.now().isoformat(),
-        
-        # User agent details
-        "user_agent": request.headers.get('User-Agent', 'Unknown'),
-        "browser": request.user_agent.browser if hasattr(request, 'user_agent') else 'Unknown',
-        "platform": request.user_agent.platform if hasattr(request, 'user_agent') else 'Unknown',
-        "version": request.user_agent.version if hasattr(request, 'user_agent') else 'Unknown',
-        "language": request.user_agent.language if hasattr(request, 'user_agent') else 'Unknown',
-        
-        # HTTP headers
-        "referer": request.headers.get('Referer', 'Unknown'),
-        "accept": request.headers.get('Accept', 'Unknown'),
-        "accept_encoding": request.headers.get('Accept-Encoding', 'Unknown'),
-        "accept_language": request.headers.get('Accept-Language', 'Unknown'),
-        "cache_control": request.headers.get('Cache-Control', 'Unknown'),
-        "connection": request.headers.get('Connection', 'Unknown'),
-        "dnt": request.headers.get('DNT', 'Unknown'),  # Do Not Track
-        "origin": request.headers.get('Origin', 'Unknown'),
-        "pragma": request.headers.get('Pragma', 'Unknown'),
-        "sec_fetch_dest": request.headers.get('Sec-Fetch-Dest', 'Unknown'),
-        "sec_fetch_mode": request.headers.get('Sec-Fetch-Mode', 'Unknown'),
-        "sec_fetch_site": request.headers.get('Sec-Fetch-Site', 'Unknown'),
-        "sec_fetch_user": request.headers.get('Sec-Fetch-User', 'Unknown'),
-        "upgrade_insecure_requests": request.headers.get('Upgrade-Insecure-Requests', 'Unknown'),
-        
-        # Cookies (if any)
-        "cookies": {key: value for key, value in request.cookies.items()} if request.cookies else {},
-        
-        # All headers (for any we missed)
-        "all_headers": {key: value for key, value in request.headers.items()}
-    }
-    
-    # Prepare the document to be inserted
-    log_entry = {
-        "user_id": user_id,
-        "received_at": datetime.now(),
-        "type": alert_type or "unknown",  # Store the type of generic log ingestion
-        "source": "api_ingest_get",  # Indicate this came from GET request
-        "client_info": client_info,  # Add client information
-        "raw_message": log_data
-    }
+    client_info = build_client_info(request.remote_addr, request.host, request.method, request.path, request.url,
+                                    request.headers, request.cookies)
+    # Check if type parameter is provided to determine which collection to use
+    log_entry, collection_name = build_get_entry(user_id, log_data, request.args.get('type'), client_info)
 
     try:
-        # Determine which collection to use based on presence of type parameter
-        if alert_type:
-            # Insert into generic_alerts collection
-            result = generic_alerts_collection.insert_one(log_entry)
-            collection_name = "generic_alerts"
-        else:
-            # Insert into regular cloud_alerts collection (backward compatibility)
-            result = cloud_alerts_collection.insert_one(log_entry)
-            collection_name = "cloud_alerts"
+        result = services.alert_store.insert_one(collection_name, log_entry)
+        INGESTED_ALERTS.inc(collection_name, "api_ingest_get")
+        services.rate_monitor.observe(log_entry)
             
-        logging.info(f"Successfully ingested log via GET for user {user_id} in {collection_name}. Inserted ID: {result.inserted_id}")
+        log.debug("Ingested log %s via GET for user %s in %s", result.inserted_id, user_id, collection_name,
+                  extra={"user_id": user_id, "collection": collection_name})
         return jsonify({"message": "Log ingested successfully", "log_id": str(result.inserted_id)}), 201
     except Exception as e:
-        logging.error(f"Error inserting log for user {user_id}: {e}")
+        log.error("Error inserting log for user %s: %s", user_id, e)
         return jsonify({"error": "Failed to ingest log"}), 500
 
 @log_bp.route('/generate-pdf', methods=['GET'])
 def generate_tracking_pdf():
     # Access MongoDB collections
-    try:
-        from app import settings_collection
-    except ImportError:
-        logging.error("Could not import collections from app. Ensure MongoDB is initialized.")
-        return jsonify({"error": "Server configuration error"}), 500
-
     # Get API key from query parameter
     api_key = request.args.get('api_key')
     if not api_key:
         return jsonify({"error": "API key is required"}), 401
     
     # Find user by API key
-    user_settings = settings_collection.find_one({"api_keys.key": api_key})
+    user_settings = find_settings_by_api_key(api_key)
     if not user_settings:
         return jsonify({"error": "Invalid API key"}), 401
 
@@ -225,21 +187,24 @@ def generate_tracking_pdf():
         "Note: This document contains embedded tracking features for security purposes."
     )
     
-    logging.info(f"[generate_pdf route] Received server_url_param: {server_url_param}")
-    logging.info(f"[generate_pdf route] Using server_url: {server_url} for PDF generation")
+    log.debug("[generate_pdf route] Using server_url: %s (requested: %s)", server_url, server_url_param)
     
     try:
+        # Imported here so reportlab is not loaded on every worker's cold start
+        from pdf_generator import generate_pdf
+
         # Generate the PDF using our pdf_generator module
         # The 'content' variable above is for the visible PDF body.
         # The 'description' parameter is passed separately for the tracking URL.
-        generate_pdf(
-            filename=temp_filename,
-            title=title,
-            content=content,  # Use the fake financial content for the visible body
-            api_key=api_key,
-            server_url=server_url,
-            description=description  # Pass the original description for the tracking URL
-        )
+        with PDF_GENERATION_SECONDS.time():
+            generate_pdf(
+                filename=temp_filename,
+                title=title,
+                content=content,  # Use the fake financial content for the visible body
+                api_key=api_key,
+                server_url=server_url,
+                description=description  # Pass the original description for the tracking URL
+            )
         
         # Send the file to the client
         return send_file(
@@ -249,7 +214,7 @@ def generate_tracking_pdf():
             mimetype='application/pdf'
         )
     except Exception as e:
-        logging.error(f"Error generating PDF: {e}")
+        log.error("Error generating PDF: %s", e)
         return jsonify({"error": "Failed to generate PDF"}), 500
     finally:
         # Clean up the temporary file after sending
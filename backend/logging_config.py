@@ -0,0 +1,200 @@
+"""
+Non-blocking, structured logging for the backend.
+
+Request threads never write to a stream: the root logger's only handler puts records
+on a bounded queue, and a listener thread formats them (one JSON object per line by
+default) and writes them to stderr. Modules log through `logging.getLogger(__name__)`
+with %-style arguments, so a message is only built for records that pass their
+logger's level, and then on the listener thread. Each logger is rate limited; records
+over the limit, or arriving while the queue is full, are dropped and counted in
+shakuni_log_records_dropped_total instead of slowing ingest down. The next record a
+rate-limited logger writes carries the number it suppressed.
+
+Environment:
+    LOG_LEVEL        root level (default INFO)
+    LOG_LEVELS       per-logger levels, e.g. "log_routes=WARNING,terraform_routes=DEBUG"
+    LOG_RATE_LIMIT   records per second per logger (default 100; 0 turns limiting off)
+    LOG_RATE_LIMITS  per-logger rates, e.g. "log_routes=20,rate_monitor=5"
+    LOG_FORMAT       json (default) or text
+    LOG_QUEUE_SIZE   records buffered for the listener (default 10000)
+"""
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from metrics import registry
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+# Noisy third-party loggers, unless LOG_LEVELS says otherwise
+DEFAULT_LEVELS = {"pymongo": "WARNING", "urllib3": "WARNING", "botocore": "WARNING", "apscheduler": "WARNING"}
+
+# Attributes every LogRecord has; anything else was passed with extra= and is emitted as a field
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+LOG_RECORDS_DROPPED = registry.counter("shakuni_log_records_dropped_total", "Log records not written", ("reason",))
+
+def _parse_pairs(value):
+    """'a=1,b.c=2' -> {'a': '1', 'b.c': '2'}"""
+    pairs = {}
+    for item in (value or "").split(","):
+        name, _, setting = item.partition("=")
+        if name.strip() and setting.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logger, holding one second's worth of records."""
+
+    def __init__(self, default_rate, rates):
+        super().__init__()
+        self.default_rate = default_rate
+        self.rates = rates
+        # logger name -> [tokens, last refill, suppressed since last written record]
+        self._buckets = {}
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, name):
+        """The rate of the logger or its closest configured parent ('a.b' falls back to 'a')."""
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = self.default_rate
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        rate = self._rate(record.name)
+        if not rate:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [rate, now, 0]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                suppressed = None
+            else:
+                bucket[0] -= 1
+                suppressed, bucket[2] = bucket[2], 0
+        if suppressed is None:
+            LOG_RECORDS_DROPPED.inc("rate_limited")
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener as they are; a full queue drops instead of blocking."""
+
+    def prepare(self, record):
+        # Only tracebacks are rendered here, while the frames they refer to still exist;
+        # the message itself is formatted by the listener
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc("queue_full")
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room, so stopping with a full queue still flushes it
+        self.queue.put(self._sentinel)
+
+
+_listener = None
+_atexit_registered = False
+
+def configure_logging():
+    """Install the queue handler on the root logger and start the listener thread (idempotent)."""
+    global _listener, _atexit_registered
+    stop_logging()
+
+    output = logging.StreamHandler(sys.stderr)
+    if os.environ.get("LOG_FORMAT", "json").lower() == "text":
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    records = queue.Queue(int(os.environ.get("LOG_QUEUE_SIZE", 10000)))
+    handler = NonBlockingQueueHandler(records)
+    rates = {name: float(rate) for name, rate in _parse_pairs(os.environ.get("LOG_RATE_LIMITS")).items()}
+    handler.addFilter(RateLimitFilter(float(os.environ.get("LOG_RATE_LIMIT", 100)), rates))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    levels = dict(DEFAULT_LEVELS, **_parse_pairs(os.environ.get("LOG_LEVELS")))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = _Listener(records, output)
+    _listener.start()
+    if not _atexit_registered:
+        atexit.register(stop_logging)
+        _atexit_registered = True
+
+
+def stop_logging():
+    """Write out queued records and stop the listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def reset_after_fork():
+    """
+    Restart logging in a forked server worker.
+
+    The parent's listener thread does not exist in the child, so its queue would only
+    fill up; the child gets a fresh queue and listener (records still queued in the
+    parent are written by the parent).
+    """
+    global _listener
+    _listener = None
+    configure_logging()
@@ -0,0 +1,343 @@
+"""
+Prometheus-style counters, histograms and gauges, rendered by GET /metrics.
+
+Recording is lock-free: every thread writes into its own shard (a plain dict only
+that thread mutates), and shards are only summed when the endpoint is scraped.
+Gauges are callbacks evaluated at scrape time, so queue depths cost nothing on the
+hot path. Under gunicorn each worker also writes its snapshot to METRICS_DIR every
+few seconds and /metrics merges the files of all workers, so any worker answers for
+the whole server. Files of exited workers are folded into `retired.json` so their
+counters keep counting and their gauges drop out.
+"""
+from bisect import bisect_left
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Seconds; request, Mongo and PDF latencies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Terraform phases take seconds to many minutes
+TERRAFORM_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0)
+
+RETIRED_FILE = "retired.json"
+
+def metrics_dir():
+    """Read at use, not import: gunicorn.conf.py sets it after the app is preloaded."""
+    return os.environ.get("METRICS_DIR")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def inc(self, *label_values, amount=1):
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Histogram:
+    """Per-label state is [count per bucket..., count above the last bucket, sum]."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        state = shard.get(key)
+        if state is None:
+            state = shard[key] = [0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+class Gauge:
+    """
+    Evaluated at scrape time; callback returns a number or {label values tuple: number}.
+    Workers' values are summed, or with aggregate="max" the largest one is reported.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, registry, name, help, labels=(), callback=None, aggregate="sum"):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.callback = callback
+        self.aggregate = aggregate
+
+    def values(self):
+        try:
+            result = self.callback() if self.callback else {}
+        except Exception as e:
+            log.warning("Metrics gauge %s failed: %s", self.name, e)
+            return {}
+        if result is None:
+            return {}
+        return result if isinstance(result, dict) else {(): result}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._local = threading.local()
+        # (thread, shard); shards of finished threads are folded into _retired
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None and existing.kind != metric.kind:
+            raise ValueError(f"Metric {metric.name} is already registered as a {existing.kind}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    def gauge(self, name, help, labels=(), callback=None, aggregate="sum"):
+        """Register (or, e.g. after services are rebuilt in a forked worker, replace) a gauge."""
+        return self._register(Gauge(self, name, help, labels, callback, aggregate))
+
+    # --- Collection ---
+    def snapshot(self):
+        """{name: {label values tuple: value or histogram state}} for this process."""
+        samples = {}
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    # Nobody writes to a finished thread's shard any more
+                    _add_shard(self._retired, shard)
+            self._shards = live
+            for _, shard in live:
+                # dict.copy is atomic under the GIL, so the owning thread can keep writing
+                _add_shard(samples, shard.copy())
+            self.merge(samples, self._retired)
+        for metric in self.metrics.values():
+            if metric.kind == "gauge":
+                for label_values, value in metric.values().items():
+                    samples.setdefault(metric.name, {})[tuple(label_values)] = value
+        return samples
+
+    def reset(self):
+        """Forget values inherited from a parent process (called in a forked worker)."""
+        # The parent's lock may have been held by a thread that does not exist here
+        self._lock = threading.Lock()
+        with self._lock:
+            self._local = threading.local()
+            self._shards = []
+            self._retired = {}
+
+    # --- Multi-process ---
+    def write_snapshot(self, final=False):
+        """Write this worker's snapshot to METRICS_DIR; a final snapshot leaves out gauges."""
+        directory = metrics_dir()
+        if not directory:
+            return
+        samples = self.snapshot()
+        if final:
+            samples = {name: values for name, values in samples.items() if self._kind(name) != "gauge"}
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        _write_json(path, _encode(samples))
+
+    def collect(self):
+        """This process's samples merged with every other worker's latest snapshot."""
+        samples = self.snapshot()
+        directory = metrics_dir()
+        if not directory:
+            return samples
+        # Retire exited workers first, so their counts are not missed between the two files
+        for filename in os.listdir(directory):
+            stem = filename[:-5]
+            if filename.endswith(".json") and stem.isdigit() and not _pid_alive(int(stem)):
+                self._retire(directory, os.path.join(directory, filename))
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json") or filename == f"{os.getpid()}.json":
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path) as f:
+                    other = _decode(json.load(f))
+            except (OSError, ValueError):
+                # Removed by another worker's retire, or caught mid-replace
+                continue
+            self.merge(samples, other)
+        return samples
+
+    def merge(self, target, source):
+        """Add source samples into target: counters sum, histograms add bucket-wise, gauges per their aggregate."""
+        for name, values in source.items():
+            metric = self.metrics.get(name)
+            use_max = metric is not None and metric.kind == "gauge" and metric.aggregate == "max"
+            merged = target.setdefault(name, {})
+            for label_values, value in values.items():
+                current = merged.get(label_values)
+                if current is None:
+                    merged[label_values] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    merged[label_values] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[label_values] = max(current, value) if use_max else current + value
+
+    def _retire(self, directory, path):
+        """Fold an exited worker's counters and histograms into retired.json."""
+        with open(os.path.join(directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    dead = _decode(json.load(f))
+            except (OSError, ValueError):
+                return
+            retired_path = os.path.join(directory, RETIRED_FILE)
+            retired = {}
+            if os.path.exists(retired_path):
+                with open(retired_path) as f:
+                    retired = _decode(json.load(f))
+            self.merge(retired, {name: values for name, values in dead.items() if self._kind(name) != "gauge"})
+            _write_json(retired_path, _encode(retired))
+            os.unlink(path)
+
+    def _kind(self, name):
+        metric = self.metrics.get(name)
+        return metric.kind if metric else None
+
+    # --- Exposition ---
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        samples = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            values = samples.get(metric.name)
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if not values:
+                continue
+            for label_values, value in sorted(values.items()):
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{_format_labels(metric.labels, label_values)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), value[:-1]):
+                    cumulative += count
+                    labels = _format_labels(metric.labels, label_values, ("le", _format_value(bound)))
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(metric.labels, label_values)
+                lines.append(f"{metric.name}_sum{labels} {_format_value(value[-1])}")
+                lines.append(f"{metric.name}_count{labels} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _add_shard(samples, shard):
+    """Add a thread shard ({(name, label values): value}) into samples ({name: {label values: value}})."""
+    for (name, label_values), value in shard.items():
+        values = samples.setdefault(name, {})
+        current = values.get(label_values)
+        if current is None:
+            values[label_values] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            values[label_values] = [a + b for a, b in zip(current, value)]
+        else:
+            values[label_values] = current + value
+
+
+def _encode(samples):
+    return {name: [[list(label_values), value] for label_values, value in values.items()]
+            for name, values in samples.items()}
+
+
+def _decode(data):
+    return {name: {tuple(label_values): value for label_values, value in values} for name, values in data.items()}
+
+
+def _write_json(path, data):
+    # Replaced atomically, so readers never see a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+registry = Registry()
+
+# --- Request metrics ---
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "shakuni_http_request_duration_seconds", "Time to produce a response, by route", ("method", "route", "status"))
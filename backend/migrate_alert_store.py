@@ -0,0 +1,86 @@
+"""
+Copy alerts from cloud_alerts/generic_alerts into the time-series alert store.
+
+Documents are read in _id order and written with unordered bulk inserts. Progress is
+checkpointed per source collection in `migration_checkpoints`. Time-series collections
+do not enforce unique _ids, so copies of a batch left by a run that stopped before its
+checkpoint (a crash or a BulkWriteError) are deleted before the batch is inserted again;
+a restarted run never duplicates alerts.
+Alerts that predate ingest-time extraction get their `normalized` fields on the way.
+
+Usage:
+    python migrate_alert_store.py [--collection cloud_alerts] [--batch-size 5000]
+    # then run the backend with ALERT_STORE=timeseries
+"""
+from pymongo import MongoClient
+from datetime import datetime
+import argparse
+import logging
+import os
+import time
+
+from alert_store import ALERT_KINDS, TimeSeriesAlertStore
+from normalizers import normalize_alert
+import db as database
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHECKPOINT_ID = "alert_store_timeseries"
+
+def migrate_collection(db, store, kind, batch_size):
+    checkpoints = db.migration_checkpoints
+    checkpoint = checkpoints.find_one({"_id": f"{CHECKPOINT_ID}:{kind}"}) or {}
+    last_id = checkpoint.get("last_id")
+    copied = checkpoint.get("copied", 0)
+    if last_id is not None:
+        logging.info(f"Resuming {kind} after _id {last_id} ({copied} alerts already copied)")
+
+    source = db[kind]
+    started = time.monotonic()
+    session_copied = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(source.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        for alert in batch:
+            if "normalized" not in alert:
+                alert["normalized"] = normalize_alert(alert)
+            # The time field is mandatory in a time-series collection
+            if not isinstance(alert.get("received_at"), datetime):
+                alert["received_at"] = alert["_id"].generation_time.replace(tzinfo=None)
+        # A previous run may have inserted some or all of this batch without checkpointing it
+        store.collection(kind).delete_many(store.translate_query(kind, {"_id": {"$in": [alert["_id"] for alert in batch]}}))
+        store.insert_many(kind, batch, ordered=False)
+
+        last_id = batch[-1]["_id"]
+        copied += len(batch)
+        session_copied += len(batch)
+        checkpoints.update_one(
+            {"_id": f"{CHECKPOINT_ID}:{kind}"},
+            {"$set": {"last_id": last_id, "copied": copied, "updated_at": datetime.now()}},
+            upsert=True
+        )
+        elapsed = time.monotonic() - started
+        logging.info(f"{kind}: {copied} alerts copied ({session_copied / elapsed:.0f}/s), last _id {last_id}")
+    return copied
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate alerts into the time-series alert store")
+    parser.add_argument("--collection", choices=ALERT_KINDS, action="append",
+                        help="Source collection to migrate (default: all alert collections)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Documents per bulk insert")
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017/shakuni")
+    db = MongoClient(mongo_uri)[database.DB_NAME]
+    store = TimeSeriesAlertStore(db)
+    store.ensure_indexes()
+
+    for kind in args.collection or ALERT_KINDS:
+        total = migrate_collection(db, store, kind, args.batch_size)
+        logging.info(f"Finished {kind}: {total} alerts in the time-series store")
+
+if __name__ == '__main__':
+    main()
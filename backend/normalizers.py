@@ -0,0 +1,134 @@
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+from ua_classifier import classify_user_agent
+
+# Extractors run in registration order. Each receives the alert document about to be
+# stored and returns a dict of flat fields (or None when the payload is not its kind).
+# Fields set by an earlier extractor are never overwritten by a later one.
+EXTRACTORS = []
+
+# Flat fields that are indexed for per-user queries
+NORMALIZED_INDEXED_FIELDS = ["event_name", "source_ip", "user_arn", "bucket_name", "ua_class"]
+
+NORMALIZED_INDEXES = [
+    IndexModel(
+        [("user_id", ASCENDING), (f"normalized.{field}", ASCENDING), ("received_at", DESCENDING)],
+        name=f"user_normalized_{field}_received_at"
+    )
+    for field in NORMALIZED_INDEXED_FIELDS
+]
+
+def register_extractor(func):
+    """Decorator adding an extractor to the normalization stage."""
+    EXTRACTORS.append(func)
+    return func
+
+def normalize_alert(log_entry):
+    """Run every registered extractor over an alert and return its `normalized` subdocument."""
+    normalized = {}
+    for extractor in EXTRACTORS:
+        try:
+            fields = extractor(log_entry)
+        except Exception:
+            # A malformed payload must never stop an alert from being stored
+            fields = None
+        if not fields:
+            continue
+        for key, value in fields.items():
+            if value not in (None, '', 'Unknown') and key not in normalized:
+                normalized[key] = value
+    normalized.setdefault("kind", "unknown")
+    # Tag scanners, headless browsers, CLI clients and link-preview bots (memoized per UA)
+    for key, value in classify_user_agent(normalized.get("user_agent")).items():
+        if value is not None:
+            normalized[key] = value
+    return normalized
+
+def _connection_fields(client_info):
+    """
+    Source address of a GET callback.
+
+    ip_address is the peer address, or the client address a trusted proxy reported
+    (TRUSTED_PROXY_HOPS). X-Forwarded-For is whatever the client sent, so on a honeypot
+    it is kept for reference only and never used for GeoIP, correlation or stats.
+    """
+    return {
+        "source_ip": client_info.get("ip_address"),
+        "forwarded_for": client_info.get("x_forwarded_for"),
+    }
+
+# --- Extractors ---
+
+@register_extractor
+def extract_cloudtrail(log_entry):
+    """CloudTrail API calls, either wrapped in an EventBridge event or as a bare record."""
+    raw = log_entry.get("raw_message")
+    if not isinstance(raw, dict):
+        return None
+    detail = raw.get("detail") if isinstance(raw.get("detail"), dict) else raw
+    if "eventName" not in detail or "eventSource" not in detail:
+        return None
+
+    identity = detail.get("userIdentity") or {}
+    request_parameters = detail.get("requestParameters") or {}
+    return {
+        "kind": "cloudtrail",
+        "event_name": detail.get("eventName"),
+        "event_source": detail.get("eventSource"),
+        "source_ip": detail.get("sourceIPAddress"),
+        "user_agent": detail.get("userAgent"),
+        "user_arn": identity.get("arn"),
+        "access_key_id": identity.get("accessKeyId"),
+        "aws_account": identity.get("accountId") or raw.get("account"),
+        "aws_region": detail.get("awsRegion") or raw.get("region"),
+        "bucket_name": request_parameters.get("bucketName"),
+        "object_key": request_parameters.get("key"),
+    }
+
+@register_extractor
+def extract_web_honeypot_login(log_entry):
+    """Login attempts posted by the web honeypot's login.php."""
+    raw = log_entry.get("raw_message")
+    if not isinstance(raw, dict):
+        return None
+    # login.php posts {"source": ..., "raw_message": {...}}, which is stored as-is
+    message = raw.get("raw_message") if isinstance(raw.get("raw_message"), dict) else raw
+    if message.get("event_type") != "honeypot_login_attempt":
+        return None
+    return {
+        "kind": "web_honeypot_login",
+        "event_name": message.get("event_type"),
+        "source_ip": message.get("ip_address"),
+        "user_agent": message.get("user_agent"),
+        "username": message.get("username"),
+    }
+
+@register_extractor
+def extract_pdf_decoy(log_entry):
+    """Callbacks from tracking PDFs built by pdf_generator."""
+    if log_entry.get("type") != "pdf_decoy":
+        return None
+    raw = log_entry.get("raw_message") or {}
+    client_info = log_entry.get("client_info") or {}
+    # The generation timestamp in the tracking URL is unique per generated document
+    canary = raw.get("timestamp")
+    return dict(_connection_fields(client_info), **{
+        "kind": "pdf_decoy",
+        "event_name": raw.get("event_type"),
+        "user_agent": client_info.get("user_agent"),
+        "canary_token": f"pdf:{canary}" if canary else None,
+        "description": raw.get("description"),
+    })
+
+@register_extractor
+def extract_client_info(log_entry):
+    """Fallback for GET callbacks: connection details captured by ingest_log_get."""
+    client_info = log_entry.get("client_info")
+    if not isinstance(client_info, dict):
+        return None
+    raw = log_entry.get("raw_message") or {}
+    return dict(_connection_fields(client_info), **{
+        "kind": "callback",
+        "event_name": raw.get("event_type") if isinstance(raw, dict) else None,
+        "user_agent": client_info.get("user_agent"),
+    })
@@ -0,0 +1,313 @@
+"""
+Per-request timing breakdowns, slowest-request tracking and a sampling profiler.
+
+Every request gets a RequestTimings on a thread-local; code on the request path adds
+to named phases (`auth`, `api_key_lookup`, `mongo`, `serialization`) and the rest of
+the wall time is reported as `other`. Phases can nest: `mongo` includes the commands
+issued inside `api_key_lookup`. Each worker keeps its slowest requests and logs a
+request with its breakdown when it enters that list.
+
+The sampling profiler is off unless an admin enables it (admin_routes.py). Its
+configuration lives in MongoDB so every worker follows it; each worker re-reads it
+every PROFILER_POLL_SECONDS. While it is on, a fraction of requests to the selected
+routes is sampled: one thread per worker reads those requests' stacks every few
+milliseconds and counts them as collapsed stacks (`frame;frame;frame count`), the
+input format of flamegraph.pl and speedscope. Counts are written to MongoDB per
+worker and merged on read. When off, a request costs one attribute check.
+"""
+from datetime import datetime, timedelta
+from flask.json.provider import DefaultJSONProvider
+import heapq
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+SLOW_REQUESTS_TOP_N = int(os.environ.get("SLOW_REQUESTS_TOP_N", 20))
+# Requests faster than this are never logged as slow, even while the list fills up
+SLOW_REQUEST_MIN_MS = float(os.environ.get("SLOW_REQUEST_MIN_MS", 250))
+
+PROFILER_POLL_SECONDS = int(os.environ.get("PROFILER_POLL_SECONDS", 5))
+DEFAULT_SAMPLE_INTERVAL_MS = 5
+MAX_STACK_DEPTH = 64
+# Distinct stacks kept per worker and session (keeps the MongoDB document well under 16 MB);
+# further stacks are counted under one overflow entry
+MAX_STACKS = 2000
+OVERFLOW_STACK = "[other stacks]"
+
+_local = threading.local()
+
+# --- Timing breakdown ---
+class RequestTimings:
+    __slots__ = ("started", "phases", "mongo_calls")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.mongo_calls = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def breakdown(self, total):
+        """Milliseconds per phase; `other` is the wall time no phase accounts for."""
+        phases = {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()}
+        # API-key lookups are MongoDB queries, so their time is not counted twice
+        accounted = sum(seconds for name, seconds in self.phases.items() if name != "mongo")
+        accounted += max(0.0, self.phases.get("mongo", 0.0) - self.phases.get("api_key_lookup", 0.0))
+        phases["other"] = round(max(0.0, total - accounted) * 1000, 2)
+        phases["mongo_calls"] = self.mongo_calls
+        return phases
+
+
+def begin_request():
+    _local.timings = RequestTimings()
+    return _local.timings
+
+
+def end_request():
+    timings = getattr(_local, "timings", None)
+    _local.timings = None
+    return timings
+
+
+def record(phase, seconds):
+    """Add to a phase of the current request; a no-op outside requests (e.g. background threads)."""
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+def record_mongo(seconds):
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings.add("mongo", seconds)
+        timings.mongo_calls += 1
+
+
+class phase:
+    """Time a block into a phase of the current request: `with profiling.phase("auth"): ...`."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing jsonify() into the `serialization` phase."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            record("serialization", time.perf_counter() - started)
+
+
+class SlowRequestLog:
+    """The slowest N requests this worker has served, with their breakdowns."""
+
+    def __init__(self, size=SLOW_REQUESTS_TOP_N, min_ms=SLOW_REQUEST_MIN_MS):
+        self.size = size
+        self.min_ms = min_ms
+        # Min-heap of (total_ms, sequence, entry); the root is the fastest kept request
+        self._heap = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, status, total_seconds, timings):
+        total_ms = total_seconds * 1000
+        if total_ms < self.min_ms:
+            return False
+        # Unlocked fast path: most requests are faster than everything kept
+        if len(self._heap) >= self.size and total_ms <= self._heap[0][0]:
+            return False
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "method": method,
+            "route": route,
+            "status": status,
+            "total_ms": round(total_ms, 2),
+            "breakdown": timings.breakdown(total_seconds) if timings else {},
+        }
+        with self._lock:
+            self._sequence += 1
+            item = (total_ms, self._sequence, entry)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            elif total_ms > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+            else:
+                return False
+        breakdown = " ".join(f"{name}={value}" for name, value in entry["breakdown"].items())
+        log.warning("Slow request %s %s -> %s in %s ms: %s", method, route, status, entry['total_ms'], breakdown)
+        return True
+
+    def entries(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, reverse=True)]
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+
+slow_requests = SlowRequestLog()
+
+# --- Sampling profiler ---
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of selected requests' threads; see the module docstring.
+
+    config is None when off, else {"session", "routes", "sample_rate", "interval_ms",
+    "until"}. An empty routes list selects every route.
+    """
+
+    CONFIG_ID = "profiler"
+
+    def __init__(self, state_collection, profiles_collection):
+        self.state = state_collection
+        self.profiles = profiles_collection
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.config = None
+        self.routes = None
+        # Thread ids currently serving a sampled request
+        self.active = set()
+        self.stacks = {}
+        self.samples = 0
+        self.sampled_requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Called on every request: must stay cheap while the profiler is off
+    def should_sample(self, route):
+        config = self.config
+        if config is None:
+            return False
+        if self.routes and route not in self.routes:
+            return False
+        return random.random() < config["sample_rate"]
+
+    def begin(self):
+        with self._lock:
+            self.active.add(threading.get_ident())
+            self.sampled_requests += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+
+    def end(self):
+        with self._lock:
+            self.active.discard(threading.get_ident())
+
+    def _run(self):
+        while True:
+            config = self.config
+            if config is None:
+                return
+            time.sleep(config["interval_ms"] / 1000)
+            with self._lock:
+                idents = list(self.active)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            collapsed = [_collapse(frames[ident]) for ident in idents if ident in frames]
+            with self._lock:
+                for stack in collapsed:
+                    if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+                        stack = OVERFLOW_STACK
+                    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                    self.samples += 1
+
+    # --- Shared configuration ---
+    def enable(self, routes, sample_rate, duration_seconds, interval_ms=DEFAULT_SAMPLE_INTERVAL_MS):
+        config = {
+            "session": datetime.now().strftime("%Y%m%dT%H%M%S"),
+            "routes": list(routes),
+            "sample_rate": sample_rate,
+            "interval_ms": interval_ms,
+            "until": datetime.now() + timedelta(seconds=duration_seconds),
+        }
+        self.state.replace_one({"_id": self.CONFIG_ID}, dict(config, _id=self.CONFIG_ID), upsert=True)
+        self._apply(config)
+        return config
+
+    def disable(self):
+        self.state.delete_one({"_id": self.CONFIG_ID})
+        self.flush()
+        self._apply(None)
+
+    def refresh(self):
+        """Scheduler job: follow the shared configuration and write this worker's samples."""
+        self.flush()
+        document = self.state.find_one({"_id": self.CONFIG_ID})
+        if document and document["until"] > datetime.now():
+            document.pop("_id")
+            self._apply(document)
+        else:
+            self._apply(None)
+
+    def _apply(self, config):
+        with self._lock:
+            if (config or {}).get("session") != (self.config or {}).get("session"):
+                self.stacks = {}
+                self.samples = 0
+                self.sampled_requests = 0
+            self.routes = set(config["routes"]) if config else None
+            self.config = config
+
+    def flush(self):
+        with self._lock:
+            config = self.config
+            if config is None or not self.samples:
+                return
+            stacks = [[stack, count] for stack, count in self.stacks.items()]
+            samples, sampled_requests = self.samples, self.sampled_requests
+        self.profiles.replace_one(
+            {"_id": f"{config['session']}:{self.worker_id}"},
+            {"session": config["session"], "worker_id": self.worker_id, "stacks": stacks, "samples": samples,
+             "sampled_requests": sampled_requests, "updated_at": datetime.now()},
+            upsert=True
+        )
+
+    def collapsed(self, session=None):
+        """Collapsed stacks of a session (default: the current or latest one) merged over all workers."""
+        self.flush()
+        session = session or (self.config or {}).get("session") or max(self.profiles.distinct("session"), default=None)
+        if not session:
+            return ""
+        totals = {}
+        for document in self.profiles.find({"session": session}, {"stacks": 1}):
+            for stack, count in document["stacks"]:
+                totals[stack] = totals.get(stack, 0) + count
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(totals.items()))
+
+    def status(self):
+        with self._lock:
+            config = dict(self.config) if self.config else None
+            local = {"samples": self.samples, "sampled_requests": self.sampled_requests, "stacks": len(self.stacks)}
+        sessions = sorted(self.profiles.distinct("session"), reverse=True)
+        return {"enabled": config is not None, "config": config, "worker": local, "sessions": sessions}
@@ -0,0 +1,289 @@
+from pymongo import IndexModel, ASCENDING, UpdateOne
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+from enrichment import PENDING
+
+log = logging.getLogger(__name__)
+
+# Counts are shared through MongoDB in slots of this many seconds; the last minute is
+# the sum of the last WINDOW_SLOTS slots
+SLOT_SECONDS = 10
+WINDOW_SLOTS = 60 // SLOT_SECONDS
+
+# Weight of the newest completed minute in the per-minute baseline
+EWMA_ALPHA = 0.1
+
+# Completed minutes before a stream's baseline is trusted for silence detection
+WARMUP_MINUTES = 10
+
+# Spike: the last minute is both above SPIKE_MIN_RATE and SPIKE_FACTOR times the baseline
+SPIKE_FACTOR = 5.0
+SPIKE_MIN_RATE = 100
+
+# Silence: a stream averaging at least SILENCE_MIN_BASELINE/min has sent nothing for SILENCE_MINUTES
+SILENCE_MIN_BASELINE = 1.0
+SILENCE_MINUTES = 15
+
+# Streams idle this long are forgotten
+IDLE_EXPIRY_SECONDS = 7 * 24 * 3600
+
+# Slots are only needed until their minute is folded into the baseline
+SLOT_RETENTION = timedelta(hours=2)
+# Minutes folded one by one after a long pause; older ones only decay the baseline
+MAX_FOLD_MINUTES = 24 * 60
+
+# A stream is `type` of a GET callback, which anyone holding a decoy URL can set. Each
+# user gets at most this many streams; alerts for further ones are counted under OVERFLOW_STREAM
+MAX_STREAMS_PER_USER = int(os.environ.get("RATE_MAX_STREAMS_PER_USER", 50))
+OVERFLOW_STREAM = "other"
+
+ANOMALY_TYPE = "rate_anomaly"
+
+RATE_INDEXES = {
+    "streams": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("evaluated_at", ASCENDING)], name="evaluated_at"),
+        IndexModel([("last_seen", ASCENDING)], name="last_seen"),
+    ],
+    "slots": [
+        IndexModel([("user_id", ASCENDING), ("stream", ASCENDING), ("slot", ASCENDING)], name="user_stream_slot"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+def alert_stream(alert):
+    """The honeypot an ingested alert came from: its GET `type`, else its ingest source."""
+    return alert.get("type") or alert.get("source") or "unknown"
+
+def stream_id(user_id, stream):
+    return f"{user_id}:{stream}"
+
+
+def fold_minutes(stream, minute_counts, minute):
+    """Fold the completed minutes before `minute` into the stream's EWMA baseline (in place)."""
+    folded = stream["folded_minute"]
+    if minute - 1 - folded > MAX_FOLD_MINUTES:
+        # Long gap: every minute before the last MAX_FOLD_MINUTES had no slots left
+        skipped = minute - 1 - folded - MAX_FOLD_MINUTES
+        stream["baseline"] *= (1 - EWMA_ALPHA) ** skipped
+        stream["minutes"] += skipped
+        folded += skipped
+    for completed in range(folded + 1, minute):
+        stream["baseline"] += EWMA_ALPHA * (minute_counts.get(completed, 0) - stream["baseline"])
+        stream["minutes"] += 1
+    stream["folded_minute"] = max(folded, minute - 1)
+
+
+def evaluate(stream, per_minute, now):
+    """The state a stream is in: spike, silent or normal."""
+    if per_minute >= max(SPIKE_MIN_RATE, SPIKE_FACTOR * stream["baseline"]):
+        return "spike"
+    if (stream["minutes"] >= WARMUP_MINUTES and stream["active_baseline"] >= SILENCE_MIN_BASELINE
+            and stream.get("last_seen") and now - stream["last_seen"] >= SILENCE_MINUTES * 60):
+        return "silent"
+    return "normal"
+
+
+class RateMonitor:
+    """
+    Tracks ingest rates per (user, honeypot stream) and raises rate_anomaly alerts.
+
+    observe() runs on every ingest and only bumps an in-memory counter. check() runs
+    periodically in every process (gunicorn workers and ingest services alike): it adds
+    the local counts to per-slot documents in MongoDB, then evaluates the streams no
+    other process evaluated recently against the combined counts. So /api/stats/rates
+    shows the same rates on every worker, and spikes are noticed within about one
+    check interval. Baselines and states live on one document per stream and are
+    updated with a version check, so only the process that moves a stream into
+    "spike" or "silent" raises the alert; it re-arms after returning to normal.
+    """
+
+    def __init__(self, alert_store, streams_collection, slots_collection, check_seconds=60):
+        self.alert_store = alert_store
+        self.streams = streams_collection
+        self.slots = slots_collection
+        self.check_seconds = check_seconds
+        # (user_id, stream) -> [count, last seen] since the last flush
+        self.pending = {}
+        # Streams known to have a document, so the per-user cap is only checked for new ones
+        self._known = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def ensure_indexes(self):
+        self.streams.create_indexes(RATE_INDEXES["streams"])
+        self.slots.create_indexes(RATE_INDEXES["slots"])
+
+    def observe(self, alert):
+        user_id = alert.get("user_id")
+        stream = alert_stream(alert)
+        if not user_id or stream == ANOMALY_TYPE:
+            return
+        now = time.time()
+        with self._lock:
+            counter = self.pending.get((user_id, stream))
+            if counter is None:
+                self.pending[(user_id, stream)] = [1, now]
+            else:
+                counter[0] += 1
+                counter[1] = now
+
+    # --- Shared state ---
+    def _admit(self, user_id, stream, added):
+        """The stream name the counts are stored under, applying the per-user cap; added counts new streams per user."""
+        if (user_id, stream) in self._known or stream == OVERFLOW_STREAM:
+            return stream
+        if self.streams.count_documents({"_id": stream_id(user_id, stream)}, limit=1):
+            self._known.add((user_id, stream))
+            return stream
+        existing = self.streams.count_documents({"user_id": user_id, "stream": {"$ne": OVERFLOW_STREAM}})
+        if existing + added.get(user_id, 0) >= MAX_STREAMS_PER_USER:
+            log.info("User %s has %s rate streams; counting '%s' as '%s'", user_id, MAX_STREAMS_PER_USER, stream, OVERFLOW_STREAM)
+            return OVERFLOW_STREAM
+        self._known.add((user_id, stream))
+        added[user_id] = added.get(user_id, 0) + 1
+        return stream
+
+    def flush(self):
+        """Add this process's counts since the last flush to the shared slot documents."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return 0
+            slot = int(time.time()) // SLOT_SECONDS
+            expires_at = datetime.now() + SLOT_RETENTION
+            merged = {}
+            added = {}
+            try:
+                for (user_id, stream), (count, last_seen) in pending.items():
+                    counter = merged.setdefault((user_id, self._admit(user_id, stream, added)), [0, 0.0])
+                    counter[0] += count
+                    counter[1] = max(counter[1], last_seen)
+                operations = []
+                for (user_id, stream), (count, last_seen) in merged.items():
+                    operations.append(UpdateOne(
+                        {"_id": f"{stream_id(user_id, stream)}:{slot}"},
+                        {"$inc": {"count": count},
+                         "$setOnInsert": {"user_id": user_id, "stream": stream, "slot": slot, "expires_at": expires_at}},
+                        upsert=True
+                    ))
+                self.slots.bulk_write(operations, ordered=False)
+                self.streams.bulk_write([
+                    UpdateOne(
+                        {"_id": stream_id(user_id, stream)},
+                        {"$max": {"last_seen": last_seen},
+                         "$setOnInsert": {
+                             "user_id": user_id, "stream": stream, "baseline": 0.0, "active_baseline": 0.0,
+                             "minutes": 0, "folded_minute": slot * SLOT_SECONDS // 60 - 1, "state": "normal",
+                             "version": 0, "evaluated_at": 0.0,
+                         }},
+                        upsert=True
+                    )
+                    for (user_id, stream), (count, last_seen) in merged.items()
+                ], ordered=False)
+            except Exception as e:
+                log.error("Error flushing ingest rates: %s", e)
+                # Counted again on the next flush
+                with self._lock:
+                    for key, (count, last_seen) in pending.items():
+                        counter = self.pending.setdefault(key, [0, last_seen])
+                        counter[0] += count
+                        counter[1] = max(counter[1], last_seen)
+                return 0
+            return len(merged)
+
+    def _slot_counts(self, user_ids, since_slot):
+        """{(user_id, stream): {slot: count}} for slots from since_slot on."""
+        counts = {}
+        for document in self.slots.find({"user_id": {"$in": list(user_ids)}, "slot": {"$gte": since_slot}},
+                                        {"user_id": 1, "stream": 1, "slot": 1, "count": 1}):
+            counts.setdefault((document["user_id"], document["stream"]), {})[document["slot"]] = document["count"]
+        return counts
+
+    @staticmethod
+    def _per_minute(slots, now):
+        current = int(now) // SLOT_SECONDS
+        return sum(count for slot, count in slots.items() if current - WINDOW_SLOTS < slot <= current)
+
+    def check(self):
+        """Flush local counts, then evaluate streams (raising spike and silence alerts) and forget idle ones."""
+        self.flush()
+        now = time.time()
+        minute = int(now) // 60
+        self.streams.delete_many({"last_seen": {"$lt": now - IDLE_EXPIRY_SECONDS}})
+        # Another process evaluated the rest within the last half interval
+        due = list(self.streams.find({"evaluated_at": {"$lt": now - self.check_seconds / 2}}))
+        if not due:
+            return 0
+        oldest_minute = min(stream["folded_minute"] + 1 for stream in due)
+        since_slot = max(oldest_minute, minute - MAX_FOLD_MINUTES) * 60 // SLOT_SECONDS
+        since_slot = min(since_slot, int(now) // SLOT_SECONDS - WINDOW_SLOTS)
+        counts = self._slot_counts({stream["user_id"] for stream in due}, since_slot)
+
+        raised = 0
+        for stream in due:
+            slots = counts.get((stream["user_id"], stream["stream"]), {})
+            minute_counts = {}
+            for slot, count in slots.items():
+                minute_counts[slot * SLOT_SECONDS // 60] = minute_counts.get(slot * SLOT_SECONDS // 60, 0) + count
+            version, previous_state = stream["version"], stream["state"]
+            fold_minutes(stream, minute_counts, minute)
+            if stream.get("last_seen", 0) >= stream["evaluated_at"]:
+                # Baseline as of the last hit; the live one decays towards zero while a stream is silent
+                stream["active_baseline"] = stream["baseline"]
+            per_minute = self._per_minute(slots, now)
+            state = stream["state"] = evaluate(stream, per_minute, now)
+            result = self.streams.update_one({"_id": stream["_id"], "version": version}, {"$set": {
+                "baseline": stream["baseline"], "active_baseline": stream["active_baseline"],
+                "minutes": stream["minutes"], "folded_minute": stream["folded_minute"],
+                "state": state, "evaluated_at": now, "version": version + 1,
+            }})
+            # Losing the version check means another process evaluated (and alerted for) it
+            if result.modified_count and state != previous_state and state != "normal":
+                self._raise(stream["user_id"], stream["stream"], state, self._to_dict(stream, per_minute, now))
+                raised += 1
+        return raised
+
+    def _raise(self, user_id, stream, anomaly, rates):
+        log_entry = {
+            "user_id": user_id,
+            "received_at": datetime.now(),
+            "type": ANOMALY_TYPE,
+            "source": "rate_monitor",
+            "raw_message": dict(rates, stream=stream, anomaly=anomaly),
+            "enrichment_status": PENDING
+        }
+        try:
+            self.alert_store.insert_one("generic_alerts", log_entry)
+            log.warning("Rate anomaly (%s) for user %s on %s: %s/min vs baseline %s/min",
+                        anomaly, user_id, stream, rates['per_minute'], rates['baseline_at_last_seen'])
+        except Exception as e:
+            log.error("Error storing rate anomaly for user %s on %s: %s", user_id, stream, e)
+
+    @staticmethod
+    def _to_dict(stream, per_minute, now):
+        last_seen = stream.get("last_seen")
+        return {
+            "per_minute": per_minute,
+            "baseline_per_minute": round(stream["baseline"], 2),
+            "baseline_at_last_seen": round(stream["active_baseline"], 2),
+            "minutes_observed": stream["minutes"],
+            "state": stream["state"],
+            "last_seen": datetime.fromtimestamp(last_seen).isoformat() if last_seen else None,
+            "idle_seconds": round(now - last_seen) if last_seen else None,
+        }
+
+    def rates(self, user_id):
+        """Every stream of the user, combined over all processes (up to one flush interval behind)."""
+        now = time.time()
+        counts = self._slot_counts([user_id], int(now) // SLOT_SECONDS - WINDOW_SLOTS + 1)
+        result = []
+        for stream in self.streams.find({"user_id": user_id}):
+            per_minute = self._per_minute(counts.get((user_id, stream["stream"]), {}), now)
+            result.append(dict(self._to_dict(stream, per_minute, now), stream=stream["stream"]))
+        return sorted(result, key=lambda rate: rate["per_minute"], reverse=True)
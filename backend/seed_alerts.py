@@ -0,0 +1,234 @@
+"""
+Fill a database with millions of seeded, realistically skewed alerts for read benchmarks.
+
+Users get alert volumes from a Zipf-like distribution (a few tenants own most
+alerts), timestamps cluster towards the recent end of the window, and attacker
+IPs, CloudTrail calls and user agents reuse the skewed pools of benchmark_ingest.py.
+Documents are shaped like ingest output after enrichment, including `normalized`,
+so the indexes behave as in production; alerts go through the store selected by
+ALERT_STORE, like ingest. Each chunk is seeded from (seed, collection,
+chunk number) and written by its own process with unordered bulk inserts, so the
+same arguments always give the same content regardless of --workers.
+
+Usage:
+    python seed_alerts.py --mongo-uri mongodb://localhost:27017 --db-name shakuni_bench \
+        --users 500 --cloud-alerts 2000000 --generic-alerts 1000000 --deployments 20000
+"""
+from bson.objectid import ObjectId
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import accumulate
+import argparse
+import bisect
+import logging
+import os
+import random
+import time
+
+import bcrypt
+
+from alert_store import ALERT_KINDS, TIMESERIES_COLLECTION, create_alert_store
+from benchmark_ingest import (ATTACKER_IPS, BROWSER_USER_AGENTS, USERNAMES, PASSWORDS,
+                              skewed_choice, cloudtrail_event, browser_headers)
+from normalizers import normalize_alert
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHUNK_SIZE = 20000
+INSERT_BATCH_SIZE = 5000
+USER_SKEW = 1.1
+WINDOW_DAYS = 90
+GENERIC_TYPES = [("email_deception", "email_opened", "email_viewed"), ("honeypot_deception", "honeypot_link", "link_clicked"),
+                 ("pdf_decoy", "pdf_file", "link_clicked"), ("html_decoy", "html_login_attempt", "login_button_clicked"),
+                 ("password_decoy", "password_file_opened", "file_opened"), ("kubernetes_decoy", "kubernetes_yaml_applied", "k8s_config_applied")]
+TEMPLATES = [("aws_cloud_native_honeypot", "aws"), ("web_honeypot", "aws"), ("s3_honeypot", "aws")]
+
+def user_ids(count):
+    """Stable user ids, so seeded alerts line up with seeded users across runs."""
+    return [str(ObjectId(f"5eed{i:020x}")) for i in range(count)]
+
+
+class Picker:
+    """Skewed choice of user and received_at, shared by every generator."""
+
+    def __init__(self, users, end):
+        self.users = user_ids(users)
+        self.cumulative = list(accumulate(1.0 / (rank + 1) ** USER_SKEW for rank in range(users)))
+        self.end = end
+
+    def user(self, rng):
+        return self.users[bisect.bisect(self.cumulative, rng.random() * self.cumulative[-1])]
+
+    def received_at(self, rng):
+        # Squaring the fraction piles most alerts into the recent part of the window
+        return self.end - timedelta(seconds=WINDOW_DAYS * 86400 * rng.random() ** 2)
+
+
+def cloud_alert(rng, picker):
+    if rng.random() < 0.7:
+        raw_message = cloudtrail_event(rng)
+        source = rng.choice(["api_ingest", "api_ingest_batch", "sqs_consumer"])
+    else:
+        raw_message = {"source": "aws", "raw_message": {
+            "event_type": "honeypot_login_attempt", "username": skewed_choice(rng, USERNAMES),
+            "password": skewed_choice(rng, PASSWORDS), "ip_address": skewed_choice(rng, ATTACKER_IPS),
+            "user_agent": skewed_choice(rng, BROWSER_USER_AGENTS), "timestamp": "2026-01-01 00:00:00"}}
+        source = "api_ingest_batch"
+    alert = {"user_id": picker.user(rng), "received_at": picker.received_at(rng), "source": source, "raw_message": raw_message}
+    alert["normalized"] = normalize_alert(alert)
+    return alert
+
+
+def generic_alert(rng, picker):
+    alert_type, source, event_type = skewed_choice(rng, GENERIC_TYPES)
+    headers = browser_headers(rng)
+    forwarded = headers["X-Forwarded-For"]
+    alert = {
+        "user_id": picker.user(rng),
+        "received_at": picker.received_at(rng),
+        "type": alert_type,
+        "source": "api_ingest_get",
+        "client_info": {
+            "ip_address": "10.0.0.1",
+            "x_forwarded_for": forwarded,
+            "host": "shakuni.example.com",
+            "method": "GET",
+            "path": "/api/logs/ingest",
+            "user_agent": headers["User-Agent"],
+            "accept": headers["Accept"],
+            "accept_language": headers["Accept-Language"],
+            "referer": headers["Referer"],
+            "all_headers": headers,
+        },
+        "raw_message": {"source": source, "event_type": event_type, "type": alert_type,
+                        "timestamp": f"2026-01-01T00:00:{rng.randrange(60):02d}.000Z"},
+    }
+    alert["normalized"] = normalize_alert(alert)
+    return alert
+
+
+def deployment(rng, picker):
+    template_id, provider = skewed_choice(rng, TEMPLATES)
+    status = "success" if rng.random() < 0.85 else "error"
+    return {
+        "user_id": picker.user(rng),
+        "template_id": template_id,
+        "provider": provider,
+        "action": "deploy" if rng.random() < 0.7 else "destroy",
+        "status": status,
+        "timestamp": picker.received_at(rng),
+        # Terraform output is stored verbatim and is the bulk of each document
+        "output": "\n".join(f"aws_resource.r{i}: Creation complete after {rng.randrange(1, 90)}s" for i in range(rng.randrange(5, 60))),
+    }
+
+
+GENERATORS = {"cloud_alerts": cloud_alert, "generic_alerts": generic_alert, "deployments": deployment}
+
+def generate_chunk(collection, chunk, count, seed, users, end):
+    rng = random.Random(f"{seed}:{collection}:{chunk}")
+    picker = Picker(users, end)
+    make = GENERATORS[collection]
+    return [make(rng, picker) for _ in range(count)]
+
+
+def insert_chunk(db, collection, documents):
+    alert_store = create_alert_store(db, os.environ.get("ALERT_STORE", "collections")) if collection in ALERT_KINDS else None
+    for start in range(0, len(documents), INSERT_BATCH_SIZE):
+        batch = documents[start:start + INSERT_BATCH_SIZE]
+        if alert_store:
+            alert_store.insert_many(collection, batch, ordered=False)
+        else:
+            db[collection].insert_many(batch, ordered=False)
+
+
+def write_chunk(task):
+    """Worker entry point: generate one chunk and insert it with its own client."""
+    from db import create_client
+
+    mongo_uri, db_name, collection, chunk, count, seed, users, end = task
+    client = create_client(mongo_uri)
+    try:
+        insert_chunk(client[db_name], collection, generate_chunk(collection, chunk, count, seed, users, end))
+        return count
+    finally:
+        client.close()
+
+
+def seed_users(db, users, seed):
+    """Users and settings (API keys, alert sinks) for every seeded user id."""
+    rng = random.Random(f"{seed}:users")
+    # bcrypt is deliberately slow; one hash is shared by every seeded account
+    password = bcrypt.hashpw(b"benchmark1", bcrypt.gensalt())
+    ids = user_ids(users)
+    db.users.insert_many([
+        {"_id": ObjectId(user_id), "username": f"tenant{i}", "email": f"tenant{i}@example.com",
+         "password": password, "created_at": datetime(2025, 1, 1)}
+        for i, user_id in enumerate(ids)
+    ], ordered=False)
+    db.settings.insert_many([
+        {"user_id": user_id, "terraform_provider": "aws", "terraform_s3_bucket": f"tf-state-{i}",
+         "api_keys": [{"name": f"key{k}", "key": f"{rng.getrandbits(256):064x}", "created_at": datetime(2025, 1, 1)}
+                      for k in range(rng.randrange(1, 6))],
+         "alert_sinks": [{"name": "siem", "type": "webhook", "url": f"https://siem.example.com/hook/{i}"}] if i % 3 == 0 else []}
+        for i, user_id in enumerate(ids)
+    ], ordered=False)
+    return ids
+
+
+def seed_database(db, counts, users, seed=42, end=None, mongo_uri=None, workers=1):
+    """
+    Drop and refill the seeded collections of `db`; returns the seeded user ids.
+
+    With mongo_uri set, chunks are written by `workers` processes; otherwise (e.g. a
+    mongomock database, which lives in this process) they are inserted here.
+    """
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for name in ("users", "settings", "deployments", TIMESERIES_COLLECTION, *ALERT_KINDS):
+        db.drop_collection(name)
+    ids = seed_users(db, users, seed)
+
+    tasks = []
+    for collection, count in counts.items():
+        for chunk, start in enumerate(range(0, count, CHUNK_SIZE)):
+            tasks.append((mongo_uri, db.name, collection, chunk, min(CHUNK_SIZE, count - start), seed, users, end))
+
+    started = time.monotonic()
+    written = 0
+    if mongo_uri and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for count in pool.map(write_chunk, tasks):
+                written += count
+                logging.info(f"Seeded {written:,} documents ({written / (time.monotonic() - started):,.0f}/s)")
+    else:
+        for _, _, collection, chunk, count, task_seed, task_users, task_end in tasks:
+            insert_chunk(db, collection, generate_chunk(collection, chunk, count, task_seed, task_users, task_end))
+            written += count
+            logging.info(f"Seeded {written:,} documents ({written / (time.monotonic() - started):,.0f}/s)")
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a benchmark database with skewed alerts")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="shakuni_bench", help="Database to fill; seeded collections are dropped first")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--cloud-alerts", type=int, default=2000000)
+    parser.add_argument("--generic-alerts", type=int, default=1000000)
+    parser.add_argument("--deployments", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.db_name == "shakuni":
+        parser.error("Refusing to drop and reseed the production database name 'shakuni'")
+
+    from db import create_client
+
+    client = create_client(args.mongo_uri)
+    counts = {"cloud_alerts": args.cloud_alerts, "generic_alerts": args.generic_alerts, "deployments": args.deployments}
+    seed_database(client[args.db_name], counts, args.users, args.seed, mongo_uri=args.mongo_uri, workers=args.workers)
+    logging.info(f"Seeded {args.db_name}; run benchmark_reads.py --mongo-uri {args.mongo_uri} --db-name {args.db_name} --no-seed")
+
+
+if __name__ == "__main__":
+    main()
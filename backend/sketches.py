@@ -0,0 +1,126 @@
+import hashlib
+import heapq
+import math
+
+
+class HyperLogLog:
+    """
+    Cardinality sketch with 2**precision one-byte registers (4 KiB and ~1.6% error at
+    the default precision of 12). Sketches with the same precision merge by taking the
+    register-wise maximum.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def add(self, value):
+        x = self._hash(value)
+        index = x >> (64 - self.precision)
+        remaining = x & ((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1-bit in the remaining (64 - precision) bits
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {"precision": self.precision, "registers": bytes(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["precision"], data["registers"])
+
+
+class SpaceSaving:
+    """
+    Top-k heavy hitters (Metwally et al.) tracking at most `capacity` items. Every
+    reported count overestimates the true count by at most its recorded error.
+    A lazily refreshed min-heap finds the eviction candidate without scanning.
+    """
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        # item -> [count, error]
+        self.counters = {}
+        self._heap = []
+
+    def add(self, item, count=1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+            heapq.heappush(self._heap, (count, item))
+            return
+        # Replace the current minimum; the newcomer inherits its count as error
+        min_count, min_item = self._pop_min()
+        del self.counters[min_item]
+        self.counters[item] = [min_count + count, min_count]
+        heapq.heappush(self._heap, (min_count + count, item))
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            current = self.counters.get(item)
+            if current is None:
+                continue
+            if current[0] == count:
+                return count, item
+            # Stale entry: the item was incremented after it was pushed
+            heapq.heappush(self._heap, (current[0], item))
+
+    def min_count(self):
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """Mergeable summary: counts add up, items missing on one side get that side's minimum."""
+        self_min, other_min = self.min_count(), other.min_count()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            a = self.counters.get(item, [self_min, self_min])
+            b = other.counters.get(item, [other_min, other_min])
+            merged[item] = [a[0] + b[0], a[1] + b[1]]
+        top = heapq.nlargest(self.capacity, merged.items(), key=lambda kv: kv[1][0])
+        self.counters = {item: counter for item, counter in top}
+        self._heap = [(counter[0], item) for item, counter in self.counters.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def top(self, k):
+        ranked = heapq.nlargest(k, self.counters.items(), key=lambda kv: kv[1][0])
+        return [{"value": item, "count": counter[0], "error": counter[1]} for item, counter in ranked]
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "items": [[item, c[0], c[1]] for item, c in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["capacity"])
+        sketch.counters = {item: [count, error] for item, count, error in data["items"]}
+        sketch._heap = [(count, item) for item, count, _ in data["items"]]
+        heapq.heapify(sketch._heap)
+        return sketch
@@ -0,0 +1,200 @@
+"""
+Consume cloud-native honeypot events from every queue registered in `sqsurl`.
+
+deploy_terraform saves each user's honeypot_sqs_queue_url in the sqsurl collection.
+This service keeps one long-polling worker per registered queue, re-reading the
+collection every SQS_QUEUE_REFRESH_SECONDS so queues of new deployments are picked
+up and destroyed ones are dropped. Each receive asks for up to 10 messages, the batch
+is stored with one insert_many into cloud_alerts (as pending, for the backend's
+enrichment pipeline), and only then deleted with delete_message_batch. Messages
+whose write fails become visible again after the queue's visibility timeout, so
+delivery is at least once.
+
+Usage:
+    python sqs_consumer.py
+    # against a local stand-in (moto server, ElasticMQ):
+    SQS_ENDPOINT_URL=http://localhost:9324 python sqs_consumer.py
+"""
+from botocore.config import Config
+from datetime import datetime
+import boto3
+import json
+import logging
+import os
+import random
+import threading
+
+from alert_store import create_alert_store
+from enrichment import PENDING
+from db import DB_NAME, create_client
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# SQS limits a receive to 10 messages and a long poll to 20 seconds
+MAX_MESSAGES = 10
+WAIT_TIME_SECONDS = 20
+
+QUEUE_REFRESH_SECONDS = int(os.environ.get("SQS_QUEUE_REFRESH_SECONDS", 30))
+# HTTP connections per region client; every worker's long poll holds one
+MAX_POOL_CONNECTIONS = int(os.environ.get("SQS_MAX_POOL_CONNECTIONS", 50))
+BACKOFF_MAX = 30.0
+
+def message_to_alert(user_id, message):
+    """Build the cloud_alerts document for one SQS message, as ingest_log would."""
+    body = message.get("Body", "")
+    try:
+        raw_message = json.loads(body)
+    except ValueError:
+        raw_message = body
+    return {
+        "user_id": user_id,
+        "received_at": datetime.now(),
+        "source": "sqs_consumer",
+        "raw_message": raw_message,
+        "sqs_message_id": message.get("MessageId"),
+        "enrichment_status": PENDING
+    }
+
+
+class QueueWorker:
+    """Long-polls one queue on its own thread until stopped."""
+
+    def __init__(self, consumer, user_id, queue_url, region):
+        self.consumer = consumer
+        self.user_id = user_id
+        self.queue_url = queue_url
+        self.region = region
+        self.sqs = consumer.client(region)
+        self.received = 0
+        self.stored = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"sqs-{user_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                self.errors += 1
+                delay = random.uniform(0, min(BACKOFF_MAX, 2 ** failures))
+                logging.error(f"SQS consumer for {self.queue_url} failed ({failures} in a row), retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay)
+
+    def poll_once(self):
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=MAX_MESSAGES,
+            WaitTimeSeconds=WAIT_TIME_SECONDS,
+        )
+        messages = response.get("Messages", [])
+        if not messages:
+            return 0
+        self.received += len(messages)
+
+        # A failed write raises before anything is deleted
+        self.consumer.alert_store.insert_many(
+            "cloud_alerts", [message_to_alert(self.user_id, message) for message in messages], ordered=False
+        )
+        self.stored += len(messages)
+
+        result = self.sqs.delete_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=[{"Id": str(i), "ReceiptHandle": message["ReceiptHandle"]} for i, message in enumerate(messages)],
+        )
+        for failure in result.get("Failed", []):
+            logging.warning(f"Could not delete message {failure.get('Id')} from {self.queue_url}: {failure.get('Message')}")
+        return len(messages)
+
+
+class SQSConsumer:
+    """Keeps one QueueWorker per queue in the sqsurl collection."""
+
+    def __init__(self, sqsurl_collection, alert_store, endpoint_url=None):
+        self.sqsurl = sqsurl_collection
+        self.alert_store = alert_store
+        self.endpoint_url = endpoint_url
+        # queue_url -> QueueWorker
+        self.workers = {}
+        self._clients = {}
+        self._stop = threading.Event()
+
+    def client(self, region):
+        """One SQS client per region, shared by that region's workers (boto3 clients are thread-safe)."""
+        if region not in self._clients:
+            self._clients[region] = boto3.client(
+                "sqs",
+                region_name=region,
+                endpoint_url=self.endpoint_url,
+                config=Config(max_pool_connections=MAX_POOL_CONNECTIONS, retries={"mode": "adaptive"}),
+            )
+        return self._clients[region]
+
+    def refresh(self):
+        """Start workers for newly registered queues and stop those for removed ones."""
+        registered = {
+            doc["sqs_queue_url"]: doc
+            for doc in self.sqsurl.find({"sqs_queue_url": {"$exists": True}}, {"user_id": 1, "sqs_queue_url": 1, "aws_region": 1})
+        }
+        for queue_url, worker in list(self.workers.items()):
+            doc = registered.get(queue_url)
+            if doc is None or doc.get("user_id") != worker.user_id:
+                logging.info(f"Stopping SQS consumer for {queue_url}")
+                worker.stop()
+                del self.workers[queue_url]
+        for queue_url, doc in registered.items():
+            if queue_url not in self.workers:
+                logging.info(f"Starting SQS consumer for {queue_url} (user {doc.get('user_id')})")
+                worker = QueueWorker(self, doc.get("user_id"), queue_url, doc.get("aws_region", "us-east-1"))
+                self.workers[queue_url] = worker
+                worker.start()
+        return len(self.workers)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error reading registered SQS queues: {e}")
+            self._stop.wait(QUEUE_REFRESH_SECONDS)
+
+    def stop(self, timeout=WAIT_TIME_SECONDS + 5):
+        self._stop.set()
+        for worker in self.workers.values():
+            worker.stop()
+        for worker in self.workers.values():
+            worker.join(timeout)
+
+    def status(self):
+        return {
+            queue_url: {"user_id": worker.user_id, "received": worker.received, "stored": worker.stored, "errors": worker.errors}
+            for queue_url, worker in self.workers.items()
+        }
+
+
+def main():
+    client = create_client()
+    db = client.get_database(DB_NAME)
+    alert_store = create_alert_store(db, os.environ.get("ALERT_STORE", "collections"))
+    consumer = SQSConsumer(db.sqsurl, alert_store, endpoint_url=os.environ.get("SQS_ENDPOINT_URL"))
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        logging.info(f"Stopping SQS consumer: {consumer.status()}")
+        consumer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime
+
+from alert_stats import TOP_DIMENSIONS
+from db import services
+
+# Initialize Blueprint
+stats_bp = Blueprint('stats_bp', __name__)
+
+TOP_DEFAULT_K = 50
+
+@stats_bp.route('/top', methods=['GET'])
+@jwt_required()
+def get_top_stats():
+    """
+    Top values and distinct attackers for a day, served from the ingest-time sketches.
+
+    Query parameters: deployment (honeypot type; all deployments when omitted),
+    dimension (ip|user_agent|path|country|asn), k (default 50) and day (YYYY-MM-DD, default today).
+    """
+    current_user_id = get_jwt_identity()
+    dimension = request.args.get('dimension', 'ip')
+    if dimension not in TOP_DIMENSIONS:
+        return jsonify({"error": f"Unknown dimension '{dimension}'. Use one of: {', '.join(TOP_DIMENSIONS)}."}), 400
+    try:
+        k = max(1, min(int(request.args.get('k', TOP_DEFAULT_K)), TOP_DEFAULT_K))
+        day = request.args.get('day') or datetime.now().date().isoformat()
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "Invalid k or day parameter."}), 400
+
+    deployment = request.args.get('deployment')
+    sketch = services.stats_aggregator.merged(current_user_id, day, deployment)
+    top = sketch.top.get(dimension)
+
+    return jsonify({
+        "deployment": deployment or "all",
+        "day": day,
+        "dimension": dimension,
+        "top": top.top(k) if top else [],
+        "distinct_attackers": sketch.attackers.count(),
+        "total_alerts": sketch.total,
+    }), 200
+
+@stats_bp.route('/rates', methods=['GET'])
+@jwt_required()
+def get_ingest_rates():
+    """Alerts in the last minute and the per-minute baseline for each of the user's honeypots, over all ingest processes."""
+    return jsonify(services.rate_monitor.rates(get_jwt_identity())), 200
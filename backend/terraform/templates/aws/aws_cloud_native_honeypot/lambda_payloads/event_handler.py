@@ -1,7 +1,14 @@
+import time
+
+# Measured from the first line so cold-start import cost shows up in the logs
+_IMPORT_STARTED = time.perf_counter()
+
+import gzip
 import json
 import os
-import requests
+import random
 import logging
+import urllib3
 
 # Configure logging
 logger = logging.getLogger()
@@ -10,48 +17,114 @@ logger.setLevel(logging.INFO)
 # Get API endpoint and key from environment variables
 SHAKUNI_API_ENDPOINT = os.environ.get('SHAKUNI_API_ENDPOINT_URL')
 SHAKUNI_API_KEY = os.environ.get('SHAKUNI_API_KEY') # Consider using Secrets Manager for production
+# Batches go to <ingest endpoint>/batch unless overridden
+SHAKUNI_BATCH_ENDPOINT = os.environ.get('SHAKUNI_BATCH_ENDPOINT_URL') or (
+    SHAKUNI_API_ENDPOINT.rstrip('/') + '/batch' if SHAKUNI_API_ENDPOINT else None
+)
 
-def handler(event, context):
-    logger.info(f"Received event: {json.dumps(event)}")
+MAX_ATTEMPTS = int(os.environ.get('SHAKUNI_MAX_ATTEMPTS', 4))
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 5.0
 
-    if not SHAKUNI_API_ENDPOINT:
-        logger.error("SHAKUNI_API_ENDPOINT_URL environment variable not set.")
-        # Depending on requirements, you might return an error or just log
-        return {'statusCode': 500, 'body': 'Configuration error: API endpoint URL missing'}
+# Created once per execution environment and reused by warm invocations (keep-alive pool).
+# urllib3 instead of requests roughly halves import time and shrinks the deployment package.
+HTTP = urllib3.PoolManager(
+    num_pools=2,
+    maxsize=4,
+    timeout=urllib3.Timeout(connect=3.0, read=10.0),
+    retries=False,
+)
 
-    if not SHAKUNI_API_KEY:
-        logger.error("SHAKUNI_API_KEY environment variable not set.")
-        # Depending on requirements, you might return an error or just log
-        return {'statusCode': 500, 'body': 'Configuration error: API key missing'}
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+_cold_start = True
+
+def extract_records(event):
+    """
+    Split an invocation into (record_id, event) pairs.
+
+    SQS event source mappings deliver {"Records": [...]} with the EventBridge event as
+    each message body; a direct EventBridge target delivers one event; a list is
+    treated as a batch of events.
+    """
+    if isinstance(event, dict) and isinstance(event.get('Records'), list):
+        records = []
+        for record in event['Records']:
+            body = record.get('body', '')
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = {"body": body}
+            records.append((record.get('messageId'), payload))
+        return records
+    if isinstance(event, list):
+        return [(str(i), item) for i, item in enumerate(event)]
+    return [(event.get('id') if isinstance(event, dict) else None, event)]
 
+def send_batch(events):
+    """
+    POST events as one gzip-compressed request, retrying with full-jitter backoff.
+
+    Returns the indexes the API reports as not stored; raises after MAX_ATTEMPTS.
+    """
+    body = gzip.compress(json.dumps({"events": events}).encode('utf-8'))
     headers = {
         'Content-Type': 'application/json',
+        'Content-Encoding': 'gzip',
         'X-API-Key': SHAKUNI_API_KEY
     }
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = HTTP.request('POST', SHAKUNI_BATCH_ENDPOINT, body=body, headers=headers)
+            if response.status < 300:
+                return json.loads(response.data or b'{}').get('failed', [])
+            # Client errors other than throttling will not succeed on retry
+            if 400 <= response.status < 500 and response.status != 429:
+                raise RuntimeError(f"Shakuni API rejected batch: {response.status} {response.data[:200]!r}")
+            error = f"HTTP {response.status}"
+        except urllib3.exceptions.HTTPError as e:
+            error = str(e)
+        if attempt + 1 < MAX_ATTEMPTS:
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+            logger.warning(f"Sending batch failed ({error}), attempt {attempt + 1}/{MAX_ATTEMPTS}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+    raise RuntimeError(f"Failed to forward batch after {MAX_ATTEMPTS} attempts: {error}")
+
+def handler(event, context):
+    global _cold_start
+    started = time.perf_counter()
+    if _cold_start:
+        logger.info(f"Cold start: module imports took {IMPORT_SECONDS * 1000:.1f} ms")
+        _cold_start = False
+
+    if not SHAKUNI_BATCH_ENDPOINT:
+        logger.error("SHAKUNI_API_ENDPOINT_URL environment variable not set.")
+        raise RuntimeError('Configuration error: API endpoint URL missing')
+
+    if not SHAKUNI_API_KEY:
+        logger.error("SHAKUNI_API_KEY environment variable not set.")
+        raise RuntimeError('Configuration error: API key missing')
+
+    records = extract_records(event)
+    is_sqs = isinstance(event, dict) and 'Records' in event
 
     try:
-        # The event payload from EventBridge is the 'detail' field for AWS API calls
-        log_data = event # Send the whole event for now, API can parse
-
-        response = requests.post(SHAKUNI_API_ENDPOINT, headers=headers, json=log_data, timeout=10)
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-
-        logger.info(f"Successfully sent event to Shakuni API. Status code: {response.status_code}")
-        return {
-            'statusCode': 200,
-            'body': json.dumps('Event successfully forwarded to Shakuni API')
-        }
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending event to Shakuni API: {e}")
-        # Implement retry logic or dead-letter queue if needed
-        return {
-            'statusCode': 500,
-            'body': json.dumps(f'Failed to forward event: {str(e)}')
-        }
+        failed = send_batch([payload for _, payload in records])
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps(f'An unexpected error occurred: {str(e)}')
-        }
\ No newline at end of file
+        logger.error(f"Error sending {len(records)} events to Shakuni API: {e}")
+        if is_sqs:
+            # Every message returns to the queue for another attempt
+            return {'batchItemFailures': [{'itemIdentifier': record_id} for record_id, _ in records]}
+        # Raising lets Lambda's asynchronous retries (and any configured DLQ) take over
+        raise
+
+    logger.info(f"Forwarded {len(records) - len(failed)}/{len(records)} events in "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms")
+    if is_sqs:
+        # Only the records the API could not store are retried (ReportBatchItemFailures)
+        return {'batchItemFailures': [{'itemIdentifier': records[i][0]} for i in failed if i < len(records)]}
+    if failed:
+        raise RuntimeError(f"Shakuni API failed to store {len(failed)} of {len(records)} events")
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f'{len(records)} events successfully forwarded to Shakuni API')
+    }
@@ -51,6 +51,44 @@ resource "aws_s3_object" "customer_pii_record" {
   }
 }
 
+# --- Generated Decoy Datasets ---
+# Part files written by backend/decoy_generator.py; nothing is uploaded until it has been run.
+# source_hash (not etag) because the provider uploads large parts as multipart objects.
+
+locals {
+  generated_decoy_dir = "${path.module}/dummy_data/generated"
+}
+
+resource "aws_s3_object" "generated_customer_records" {
+  for_each = var.deploy_s3_buckets ? fileset(local.generated_decoy_dir, "customers/part-*.jsonl") : toset([])
+
+  bucket       = aws_s3_bucket.customer_pii_archive[0].id
+  key          = "exports/${each.value}"
+  source       = "${local.generated_decoy_dir}/${each.value}"
+  source_hash  = filemd5("${local.generated_decoy_dir}/${each.value}")
+  content_type = "application/x-ndjson"
+}
+
+resource "aws_s3_object" "generated_backup_manifests" {
+  for_each = var.deploy_s3_buckets ? fileset(local.generated_decoy_dir, "backup_manifests/part-*.jsonl") : toset([])
+
+  bucket       = aws_s3_bucket.prod_backups_financial[0].id
+  key          = "manifests/${each.value}"
+  source       = "${local.generated_decoy_dir}/${each.value}"
+  source_hash  = filemd5("${local.generated_decoy_dir}/${each.value}")
+  content_type = "application/x-ndjson"
+}
+
+resource "aws_s3_object" "generated_access_logs" {
+  for_each = var.deploy_s3_buckets ? fileset(local.generated_decoy_dir, "access_logs/part-*.csv") : toset([])
+
+  bucket       = aws_s3_bucket.prod_backups_financial[0].id
+  key          = "logs/${each.value}"
+  source       = "${local.generated_decoy_dir}/${each.value}"
+  source_hash  = filemd5("${local.generated_decoy_dir}/${each.value}")
+  content_type = "text/csv"
+}
+
 # --- Variables --- (Defined in variables.tf)
 # Note: Ensure variable deploy_s3_buckets is defined in variables.tf
 # Note: Ensure resource random_id.suffix is defined in low_interaction_aws_honeypot_main.tf
\ No newline at end of file
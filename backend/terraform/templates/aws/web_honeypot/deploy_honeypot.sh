@@ -18,7 +18,7 @@ sudo apt-get upgrade -y
 
 # Install required packages
 echo "[+] Installing required packages..."
-sudo apt-get install -y apache2 php php-curl jq
+sudo apt-get install -y apache2 php python3
 
 # Enable required Apache modules
 sudo a2enmod ssl
@@ -164,34 +164,10 @@ if (!is_dir($log_dir)) {
     mkdir($log_dir, 0755, true);
 }
 
-// Log to file as backup
+// Append only; the shakuni-log-shipper service forwards new lines to the API
 $log_file = '/var/log/honeypot/credentials.log';
 $log_entry = json_encode($log_data) . "\n";
-file_put_contents($log_file, $log_entry, FILE_APPEND);
-
-// Send data to API endpoint
-$api_endpoint = getenv('API_ENDPOINT');
-$api_key = getenv('API_KEY');
-
-$ch = curl_init($api_endpoint);
-curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
-curl_setopt($ch, CURLOPT_POST, true);
-curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($log_data));
-curl_setopt($ch, CURLOPT_HTTPHEADER, [
-    'Content-Type: application/json',
-    'X-API-Key: ' . $api_key
-]);
-
-$response = curl_exec($ch);
-$error = curl_error($ch);
-curl_close($ch);
-
-// Log API response for debugging
-if ($error) {
-    file_put_contents($log_dir . '/api_errors.log', "[{$timestamp}] Error: {$error}\n", FILE_APPEND);
-} else {
-    file_put_contents($log_dir . '/api_responses.log', "[{$timestamp}] Response: {$response}\n", FILE_APPEND);
-}
+file_put_contents($log_file, $log_entry, FILE_APPEND | LOCK_EX);
 
 // Redirect back to login page with error to make it look realistic
 header('Location: index.html?error=1');
@@ -213,10 +189,6 @@ sudo cat > /etc/apache2/sites-available/honeypot.conf << EOL
         AllowOverride All
         Require all granted
     </Directory>
-
-    # Set environment variables for the API endpoint and key
-    SetEnv API_ENDPOINT "$API_ENDPOINT"
-    SetEnv API_KEY "$API_KEY"
 </VirtualHost>
 EOL
 
@@ -248,58 +220,35 @@ sudo cat > /etc/logrotate.d/honeypot << EOL
 }
 EOL
 
-# Set up a cron job to forward Apache logs to the API
-echo "[+] Setting up log forwarding cron job..."
-sudo cat > /usr/local/bin/forward_apache_logs.sh << 'EOL'
-#!/bin/bash
-
-API_ENDPOINT="$(grep -oP 'SetEnv API_ENDPOINT "\K[^"]+' /etc/apache2/sites-available/honeypot.conf)"
-API_KEY="$(grep -oP 'SetEnv API_KEY "\K[^"]+' /etc/apache2/sites-available/honeypot.conf)"
-LOG_FILE="/var/log/apache2/honeypot-access.log"
-LOG_DIR="/var/log/honeypot"
-LAST_POSITION_FILE="${LOG_DIR}/last_position.txt"
-
-# Ensure log directory exists
-sudo mkdir -p "${LOG_DIR}"
-sudo chown www-data:www-data "${LOG_DIR}"
-sudo touch "${LAST_POSITION_FILE}"
-sudo chown www-data:www-data "${LAST_POSITION_FILE}"
-
-# Get the last position we processed
-LAST_POSITION=$(cat "$LAST_POSITION_FILE" 2>/dev/null || echo 0)
+# Install the log shipper that forwards credentials and Apache logs to the API
+echo "[+] Installing log shipper service..."
+sudo install -m 755 "$(dirname "$0")/log_shipper.py" /usr/local/bin/shakuni-log-shipper
+sudo chmod 755 /usr/local/bin/shakuni-log-shipper
 
-# Get the current size of the log file
-CURRENT_SIZE=$(stat -c%s "$LOG_FILE")
-
-# If the file has grown, process the new lines
-if [ "$CURRENT_SIZE" -gt "$LAST_POSITION" ]; then
-    # Extract new log entries
-    NEW_LOGS=$(tail -c +$((LAST_POSITION + 1)) "$LOG_FILE")
-
-    # For each new log entry, send it to the API
-    echo "$NEW_LOGS" | while IFS= read -r line; do
-        if [ -n "$line" ]; then
-            # Prepare the JSON payload
-            JSON_PAYLOAD=$(jq -n --arg source "aws" --arg message "$line" \
-                '{source: $source, raw_message: {event_type: "apache_log", log_entry: $message}}')
-
-            # Send to API
-            curl -s -X POST "$API_ENDPOINT" \
-                -H "Content-Type: application/json" \
-                -H "X-API-Key: $API_KEY" \
-                -d "$JSON_PAYLOAD" > /dev/null
-        fi
-    done
-
-    # Update the last position
-    echo "$CURRENT_SIZE" > "$LAST_POSITION_FILE"
-fi
+sudo cat > /etc/shakuni-log-shipper.env << EOL
+API_ENDPOINT=$API_ENDPOINT
+API_KEY=$API_KEY
+EOL
+sudo chmod 600 /etc/shakuni-log-shipper.env
+
+sudo cat > /etc/systemd/system/shakuni-log-shipper.service << 'EOL'
+[Unit]
+Description=Shakuni honeypot log shipper
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+EnvironmentFile=/etc/shakuni-log-shipper.env
+ExecStart=/usr/bin/python3 /usr/local/bin/shakuni-log-shipper --file /var/log/honeypot/credentials.log:json --file /var/log/apache2/honeypot-access.log:apache
+User=www-data
+SupplementaryGroups=adm
+StateDirectory=shakuni-log-shipper
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
 EOL
-
-sudo chmod +x /usr/local/bin/forward_apache_logs.sh
-
-# Add cron job to run every 5 minutes
-(sudo crontab -l 2>/dev/null; echo "*/5 * * * * /usr/local/bin/forward_apache_logs.sh") | sudo crontab -
 
 # Correct the log directory if it exists in the wrong place
 if [ -d "/var/log/honeypot" ]; then
@@ -313,8 +262,10 @@ echo "[+] Ensuring the honeypot log directory exists..."
 sudo mkdir -p /var/log/honeypot
 sudo chown www-data:www-data /var/log/honeypot
 
+sudo systemctl daemon-reload
+sudo systemctl enable --now shakuni-log-shipper
+
 echo "[+] Honeypot web server setup complete!"
 echo "[+] Fake login page is available at http://$(curl -s http://169.254.169.254/latest/meta-data/public-ipv4)/"
 echo "[+] Credentials will be logged to /var/log/honeypot/credentials.log"
-echo "[+] API responses will be logged to /var/log/honeypot/api_responses.log"
-echo "[+] Apache logs will be forwarded to the API endpoint every 5 minutes"
\ No newline at end of file
+echo "[+] Credentials and Apache logs are forwarded to the API by the shakuni-log-shipper service"
\ No newline at end of file
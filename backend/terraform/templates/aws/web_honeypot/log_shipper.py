@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Ship web honeypot logs to the Shakuni ingest API.
+
+Installed on the honeypot by deploy_honeypot.sh as a systemd service, so login.php
+only appends a line to credentials.log and never waits on the API. Each followed
+file is polled for new lines from a checkpointed byte offset (surviving restarts
+and logrotate renames), lines are sent in gzip-compressed batches to
+/api/logs/ingest/batch, and batches that cannot be delivered are spooled to disk
+and retried with exponential backoff. Standard library only.
+
+Usage:
+    log_shipper.py --file /var/log/honeypot/credentials.log:json \
+                   --file /var/log/apache2/honeypot-access.log:apache
+    (API_ENDPOINT and API_KEY come from the environment)
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 2.0
+POLL_INTERVAL = 0.5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+# Oldest spooled batches are dropped beyond this many files
+SPOOL_MAX_FILES = 10000
+
+def parse_line(line, fmt):
+    """Turn one log line into the event posted to the API."""
+    if fmt == "json":
+        try:
+            return json.loads(line)
+        except ValueError:
+            pass
+    # Same shape the old cron forwarder used for Apache access logs
+    event_type = "apache_log" if fmt == "apache" else "log_line"
+    return {"source": "aws", "raw_message": {"event_type": event_type, "log_entry": line}}
+
+
+class FollowedFile:
+    """Reads complete new lines from a file, following it across rotation."""
+
+    def __init__(self, path, fmt, inode=None, offset=0):
+        self.path = path
+        self.fmt = fmt
+        self.inode = inode
+        self.offset = offset
+        self._handle = None
+        self._partial = b""
+
+    def _open(self):
+        try:
+            handle = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        inode = os.fstat(handle.fileno()).st_ino
+        if inode != self.inode or os.fstat(handle.fileno()).st_size < self.offset:
+            # A different (rotated-in) or truncated file starts from the beginning
+            self.inode, self.offset, self._partial = inode, 0, b""
+        handle.seek(self.offset)
+        self._handle = handle
+        return True
+
+    def read_lines(self, limit):
+        if self._handle is None and not self._open():
+            return []
+        lines = []
+        while len(lines) < limit:
+            chunk = self._handle.readline()
+            if not chunk:
+                break
+            if not chunk.endswith(b"\n"):
+                # Keep a half-written line until the writer finishes it
+                self._partial += chunk
+                self.offset += len(chunk)
+                break
+            line = (self._partial + chunk).decode('utf-8', 'replace').strip()
+            self._partial = b""
+            self.offset += len(chunk)
+            if line:
+                lines.append(line)
+        if not lines and self._rotated():
+            # Old file fully read; continue with the new one next poll
+            if self._partial.strip():
+                lines.append(self._partial.decode('utf-8', 'replace').strip())
+            self._partial = b""
+            self._handle.close()
+            self._handle = None
+        return lines
+
+    def _rotated(self):
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return False
+
+    def checkpoint(self):
+        # Offsets of a pending partial line are re-read after a restart
+        return {"inode": self.inode, "offset": self.offset - len(self._partial)}
+
+
+class Shipper:
+    def __init__(self, endpoint, api_key, files, state_dir):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.state_path = os.path.join(state_dir, "offsets.json")
+        self.spool_dir = os.path.join(state_dir, "spool")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+        self.files = [FollowedFile(path, fmt, **state.get(path, {})) for path, fmt in files]
+        self.failures = 0
+        self.retry_at = 0.0
+        self._spool_seq = 0
+
+    def save_offsets(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({followed.path: followed.checkpoint() for followed in self.files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def send(self, events):
+        """POST a batch; returns indexes the API did not store, raises when it should be retried."""
+        body = gzip.compress(json.dumps({"events": events}).encode('utf-8'))
+        request = urllib.request.Request(self.endpoint, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+            'X-API-Key': self.api_key,
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=15) as response:
+                return json.loads(response.read() or b'{}').get('failed', [])
+        except urllib.error.HTTPError as e:
+            if e.code in (400, 413):
+                logging.error(f"API rejected a batch of {len(events)} events ({e.code}); dropping it")
+                return []
+            raise
+
+    def spool(self, events):
+        self._spool_seq += 1
+        path = os.path.join(self.spool_dir, f"{time.time():.6f}-{self._spool_seq:06d}.json.gz")
+        with gzip.open(path, 'wt') as f:
+            json.dump(events, f)
+        spooled = sorted(os.listdir(self.spool_dir))
+        for name in spooled[:max(0, len(spooled) - SPOOL_MAX_FILES)]:
+            logging.warning(f"Spool full, dropping {name}")
+            os.remove(os.path.join(self.spool_dir, name))
+
+    def deliver(self, events):
+        """Send now unless backing off or older batches are spooled; anything not delivered is spooled."""
+        if time.monotonic() >= self.retry_at and not os.listdir(self.spool_dir):
+            try:
+                failed = self.send(events)
+                self._succeeded()
+                events = [events[i] for i in failed if i < len(events)]
+            except Exception as e:
+                self._failed(e)
+        if events:
+            self.spool(events)
+
+    def drain_spool(self):
+        for name in sorted(os.listdir(self.spool_dir)):
+            if time.monotonic() < self.retry_at:
+                return
+            path = os.path.join(self.spool_dir, name)
+            with gzip.open(path, 'rt') as f:
+                events = json.load(f)
+            try:
+                failed = self.send(events)
+            except Exception as e:
+                self._failed(e)
+                return
+            self._succeeded()
+            os.remove(path)
+            if failed:
+                self.spool([events[i] for i in failed if i < len(events)])
+
+    def _succeeded(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def _failed(self, error):
+        self.failures += 1
+        delay = random.uniform(BACKOFF_BASE, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** self.failures)))
+        self.retry_at = time.monotonic() + delay
+        logging.warning(f"Shipping failed ({self.failures} in a row), retrying in {delay:.0f}s: {error}")
+
+    def run(self):
+        pending = []
+        last_flush = time.monotonic()
+        while True:
+            read = 0
+            for followed in self.files:
+                lines = followed.read_lines(BATCH_SIZE - len(pending))
+                read += len(lines)
+                pending.extend(parse_line(line, followed.fmt) for line in lines)
+                if len(pending) >= BATCH_SIZE:
+                    break
+            if pending and (len(pending) >= BATCH_SIZE or time.monotonic() - last_flush >= FLUSH_INTERVAL):
+                self.deliver(pending)
+                # Offsets advance only once the batch was delivered or spooled
+                self.save_offsets()
+                pending = []
+                last_flush = time.monotonic()
+            self.drain_spool()
+            if not read:
+                time.sleep(POLL_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ship honeypot log files to the Shakuni ingest API")
+    parser.add_argument("--file", action="append", required=True, help="PATH[:json|apache|text], repeatable")
+    parser.add_argument("--state-dir", default=os.environ.get("STATE_DIRECTORY", "/var/lib/shakuni-log-shipper"))
+    args = parser.parse_args()
+
+    endpoint = os.environ.get("API_ENDPOINT", "")
+    api_key = os.environ.get("API_KEY", "")
+    if not endpoint or not api_key:
+        parser.error("API_ENDPOINT and API_KEY must be set")
+    # The single-event ingest URL is configured; batches go to its /batch sibling
+    batch_endpoint = endpoint.rstrip('/') + '/batch'
+
+    files = []
+    for spec in args.file:
+        path, _, fmt = spec.partition(':')
+        files.append((path, fmt or "text"))
+    Shipper(batch_endpoint, api_key, files, args.state_dir).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,38 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from pymongo import MongoClient
 import os
 import subprocess
 import json
 import re
 from datetime import datetime
 import logging
+import time
 
-# Assuming MongoDB connection is managed in app.py and collections are accessible
-# If not, connection logic needs to be added or passed here.
-# For simplicity, let's assume access via app context or passed instances.
-# This might require adjustments based on the actual app structure.
-# Placeholder for accessing collections - replace with actual mechanism
-# Example: from app import db
+# Collections come from the shared data-access layer (db.py), not from app.py
+from db import services
+from metrics import registry, TERRAFORM_BUCKETS
 
-# Placeholder: Get collections - replace with actual access method
-# Example: settings_collection = db.settings
-# Example: deployments_collection = db.deployments
-# Example: sqsurl_collection = db.sqsurl
+log = logging.getLogger(__name__)
 
 # Initialize Blueprint
 terraform_bp = Blueprint('terraform_bp', __name__)
 
+TERRAFORM_PHASE_SECONDS = registry.histogram(
+    "shakuni_terraform_phase_duration_seconds", "Terraform init/apply/destroy/output runs",
+    ("provider", "phase", "outcome"), buckets=TERRAFORM_BUCKETS)
+
 # --- Helper function to parse variables.tf --- 
 def parse_terraform_variables(file_path):
-    logging.debug(f"Attempting to parse Terraform variables from: {file_path}")
+    log.debug("Attempting to parse Terraform variables from: %s", file_path)
     variables = []
     try:
         with open(file_path, 'r') as f:
             content = f.read()
-        logging.debug(f"Successfully read file: {file_path}")
+        log.debug("Successfully read file: %s", file_path)
 
         # Regex to find variable blocks
         variable_blocks = re.findall(r'variable "(.*?)" {([\s\S]*?)}', content)
-        logging.debug(f"Found {len(variable_blocks)} potential variable blocks using regex.")
+        log.debug("Found %s potential variable blocks using regex.", len(variable_blocks))
 
         for name, block_content in variable_blocks:
             var_details = {'name': name}
@@ -70,14 +68,14 @@ def parse_terraform_variables(file_path):
 
             variables.append(var_details)
 
-        logging.debug(f"Finished parsing {file_path}. Found {len(variables)} variables: {variables}")
+        log.debug("Finished parsing %s. Found %s variables: %s", file_path, len(variables), variables)
         return variables
 
     except FileNotFoundError:
-        logging.warning(f"Variables file not found at {file_path}")
+        log.warning("Variables file not found at %s", file_path)
         return []
     except Exception as e:
-        logging.error(f"Error parsing {file_path}: {e}", exc_info=True)
+        log.error("Error parsing %s: %s", file_path, e, exc_info=True)
         return []
 
 # --- Helper function for Terraform operations --- 
@@ -98,7 +96,7 @@ def run_terraform_command(template_id, provider, state_config, command_type="app
         region = state_config.get('region', 'us-east-1')
         if not bucket:
             return {"status": "failure", "output": "Missing S3 bucket name in state configuration for AWS backend."}
-        logging.debug(f"Using AWS S3 bucket for backend: {bucket}")
+        log.debug("Using AWS S3 bucket for backend: %s", bucket)
         backend_config_args.append(f"-backend-config=bucket={bucket}")
         backend_config_args.append(f"-backend-config=region={region}")
     elif provider == 'azure':
@@ -128,10 +126,12 @@ def run_terraform_command(template_id, provider, state_config, command_type="app
     ]
     init_command_list.extend(backend_config_args)
 
-    logging.info(f"Running command: {' '.join(init_command_list)}")
+    log.info("Running command: %s", ' '.join(init_command_list))
+    started = time.perf_counter()
     init_process = subprocess.Popen(init_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=os.path.dirname(base_terraform_dir), text=True)
     init_stdout, init_stderr = init_process.communicate()
     init_output = init_stdout + init_stderr
+    TERRAFORM_PHASE_SECONDS.observe(time.perf_counter() - started, provider, "init", "ok" if init_process.returncode == 0 else "error")
 
     if init_process.returncode != 0:
         return {"status": "failure", "output": f"Failed to initialize Terraform for {template_id} with {provider} backend:\n{init_output}"}
@@ -161,24 +161,30 @@ def run_terraform_command(template_id, provider, state_config, command_type="app
             tf_value = str(value)
         action_command_list.append(f'-var={key}={tf_value}')
 
-    logging.info(f"Running command: {' '.join(action_command_list)}")
+    log.info("Running command: %s", ' '.join(action_command_list))
+    started = time.perf_counter()
     action_process = subprocess.Popen(action_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=os.path.dirname(base_terraform_dir), text=True)
     action_stdout, action_stderr = action_process.communicate()
     action_output = action_stdout + action_stderr
+    TERRAFORM_PHASE_SECONDS.observe(time.perf_counter() - started, provider, command_type, "ok" if action_process.returncode == 0 else "error")
 
     if action_process.returncode != 0:
         return {"status": "failure", "output": f"Terraform {command_type} failed for {template_id}:\n{action_output}"}
 
     tf_outputs = {}
     if command_type == "apply":
+        started = time.perf_counter()
+        outcome = "error"
         try:
             output_command_list = action_command_list_base + ['output', '-json']
             output_process = subprocess.run(output_command_list, capture_output=True, text=True, check=True, cwd=os.path.dirname(base_terraform_dir))
             tf_outputs = json.loads(output_process.stdout)
+            outcome = "ok"
         except subprocess.CalledProcessError as e:
-            logging.warning(f"Failed to get Terraform outputs for {template_id}: {e.stderr}")
+            log.warning("Failed to get Terraform outputs for %s: %s", template_id, e.stderr)
         except json.JSONDecodeError as e:
-            logging.warning(f"Failed to parse Terraform outputs JSON for {template_id}: {e}")
+            log.warning("Failed to parse Terraform outputs JSON for %s: %s", template_id, e)
+        TERRAFORM_PHASE_SECONDS.observe(time.perf_counter() - started, provider, "output", outcome)
 
     return {"status": "success", "output": action_output, "terraform_outputs": tf_outputs}
 
@@ -188,8 +194,6 @@ def run_terraform_command(template_id, provider, state_config, command_type="app
 @jwt_required()
 def deploy_terraform():
     # Placeholder: Access MongoDB collections (replace with actual method)
-    from app import settings_collection, deployments_collection, sqsurl_collection
-
     current_user_id = get_jwt_identity()
     data = request.get_json()
     template_id = data.get('template_id')
@@ -198,10 +202,10 @@ def deploy_terraform():
     if not provider or not template_id:
         return jsonify({"error": "Missing 'provider' or 'template_id' in request body."}), 400
 
-    settings = settings_collection.find_one({"user_id": current_user_id})
-    if not settings:
+    cached = services.user_cache.settings(current_user_id)
+    if not cached["found"]:
          return jsonify({"error": "User settings not found."}), 404
-    logging.debug(f"Fetched settings for user {current_user_id}: {settings}")
+    settings = cached["general"]
 
     state_config = {'provider': provider}
     if provider == 'aws':
@@ -239,22 +243,22 @@ def deploy_terraform():
         aws_region = state_config.get('region', 'us-east-1')
 
         if sqs_queue_url:
-            logging.info(f"Saving SQS Queue URL: {sqs_queue_url} and Region: {aws_region} for user {current_user_id}")
+            log.info("Saving SQS Queue URL: %s and Region: %s for user %s", sqs_queue_url, aws_region, current_user_id)
             try:
-                sqsurl_collection.update_one(
+                services.sqsurl_collection.update_one(
                     {"user_id": current_user_id},
                     {"$set": {"sqs_queue_url": sqs_queue_url, "aws_region": aws_region, "updated_at": datetime.now()}},
                     upsert=True
                 )
-                logging.info(f"Successfully saved SQS URL for user {current_user_id}")
+                log.info("Successfully saved SQS URL for user %s", current_user_id)
             except Exception as e:
-                logging.error(f"Error saving SQS URL to sqsurl collection: {e}")
+                log.error("Error saving SQS URL to sqsurl collection: %s", e)
         else:
-            logging.warning("AWS Cloud Native Honeypot deployed but SQS queue URL not found in Terraform outputs.")
+            log.warning("AWS Cloud Native Honeypot deployed but SQS queue URL not found in Terraform outputs.")
 
     status_code = 200 if result["status"] == "success" else 500
     try:
-        deployments_collection.insert_one({
+        services.deployments_collection.insert_one({
             "user_id": current_user_id,
             "template_id": template_id,
             "provider": provider,
@@ -264,7 +268,7 @@ def deploy_terraform():
             "output": result.get("output", "")
         })
     except Exception as e:
-        logging.error(f"Error logging deployment history: {e}")
+        log.error("Error logging deployment history: %s", e)
 
     return jsonify(result), status_code
 
@@ -272,8 +276,6 @@ def deploy_terraform():
 @jwt_required()
 def destroy_terraform():
     # Placeholder: Access MongoDB collections (replace with actual method)
-    from app import settings_collection, deployments_collection, sqsurl_collection # Assuming stop_monitoring is also in app
-
     if request.method == 'OPTIONS':
         return jsonify({}), 200
 
@@ -285,9 +287,10 @@ def destroy_terraform():
     if not provider or not template_id:
         return jsonify({"error": "Missing 'provider' or 'template_id' in request body."}), 400
 
-    settings = settings_collection.find_one({"user_id": current_user_id})
-    if not settings:
+    cached = services.user_cache.settings(current_user_id)
+    if not cached["found"]:
          return jsonify({"error": "User settings not found."}), 404
+    settings = cached["general"]
 
     state_config = {'provider': provider}
     if provider == 'aws':
@@ -314,19 +317,19 @@ def destroy_terraform():
     # AWS-specific: Clear SQS settings if honeypot destroyed
     # Note: The original code checked for 'storage_honeypot', adjusted to 'aws_cloud_native_honeypot' based on deploy logic
     if result["status"] == "success" and template_id == "aws_cloud_native_honeypot" and provider == 'aws':
-        logging.info(f"AWS Cloud Native Honeypot Destroyed. Clearing SQS settings for user {current_user_id}")
+        log.info("AWS Cloud Native Honeypot Destroyed. Clearing SQS settings for user %s", current_user_id)
         try:
-            sqsurl_collection.delete_one({"user_id": current_user_id})
-            logging.info(f"Cleared SQS URL for user {current_user_id}")
+            services.sqsurl_collection.delete_one({"user_id": current_user_id})
+            log.info("Cleared SQS URL for user %s", current_user_id)
             # If stop_monitoring was a function, call it here
             # from app import stop_monitoring # Example
             # stop_monitoring() # Placeholder call
         except Exception as e:
-            logging.error(f"Error clearing SQS URL: {e}")
+            log.error("Error clearing SQS URL: %s", e)
 
     status_code = 200 if result["status"] == "success" else 500
     try:
-        deployments_collection.insert_one({
+        services.deployments_collection.insert_one({
             "user_id": current_user_id,
             "template_id": template_id,
             "provider": provider,
@@ -336,7 +339,7 @@ def destroy_terraform():
             "output": result.get("output", "")
         })
     except Exception as e:
-        logging.error(f"Error logging deployment history: {e}")
+        log.error("Error logging deployment history: %s", e)
 
     return jsonify(result), status_code
 
@@ -345,7 +348,7 @@ def destroy_terraform():
 def get_terraform_variables(provider, template_id):
     base_template_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'terraform', 'templates'))
     variables_file_path = os.path.join(base_template_path, provider, template_id, 'variables.tf')
-    logging.debug(f"Checking for variables file at: {variables_file_path}")
+    log.debug("Checking for variables file at: %s", variables_file_path)
 
     if not os.path.exists(variables_file_path):
         return jsonify([]), 200 # No variables file means no user input needed
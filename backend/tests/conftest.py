@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Backend modules are imported by their flat names, as the app runs them from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,151 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import mongomock
+import pytest
+
+import dispatcher
+from dispatcher import AlertDispatcher, validate_sink
+
+
+class Receiver(BaseHTTPRequestHandler):
+    """Local webhook stand-in that records every batch it is sent."""
+    batches = []
+    status = 200
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        Receiver.batches.append(json.loads(body)["alerts"])
+        self.send_response(Receiver.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    # The stand-in listens on loopback, which sinks may only reach when explicitly allowed
+    monkeypatch.setattr(dispatcher, "ALLOW_PRIVATE_SINKS", True)
+    Receiver.batches = []
+    Receiver.status = 200
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/hook"
+    server.shutdown()
+    server.server_close()
+
+
+def make_dispatcher(sinks):
+    settings = mongomock.MongoClient().db.settings
+    settings.insert_one({"user_id": "u1", "alert_sinks": sinks})
+    return AlertDispatcher(settings, max_workers=2, flush_interval=0.1), settings
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def delivered():
+    return [alert["n"] for batch in Receiver.batches for alert in batch]
+
+
+def test_delivers_batches_to_webhook(webhook):
+    alert_dispatcher, _ = make_dispatcher([{"name": "siem", "type": "webhook", "url": webhook, "batch_size": 3}])
+    alert_dispatcher.start()
+    try:
+        for n in range(7):
+            alert_dispatcher.enqueue("cloud_alerts", {"user_id": "u1", "n": n, "enrichment_claim": "x"})
+        assert wait_for(lambda: len(delivered()) == 7)
+    finally:
+        alert_dispatcher.stop()
+    assert sorted(delivered()) == list(range(7))
+    assert all(len(batch) <= 3 for batch in Receiver.batches)
+    assert all("enrichment_claim" not in alert for batch in Receiver.batches for alert in batch)
+    assert alert_dispatcher.status("u1")[0]["sent"] == 7
+
+
+def test_stop_drains_queued_alerts(webhook):
+    alert_dispatcher, _ = make_dispatcher([{"name": "siem", "type": "webhook", "url": webhook}])
+    # Never started: everything is still queued when stop() is called
+    for n in range(250):
+        alert_dispatcher.enqueue("cloud_alerts", {"user_id": "u1", "n": n})
+    alert_dispatcher.stop(timeout=5)
+    assert sorted(delivered()) == list(range(250))
+    assert alert_dispatcher.queued() == 0
+
+
+def test_failed_batches_are_requeued_and_open_the_breaker(webhook, monkeypatch):
+    monkeypatch.setattr(dispatcher, "SEND_ATTEMPTS", 1)
+    Receiver.status = 500
+    alert_dispatcher, _ = make_dispatcher([{"name": "siem", "type": "webhook", "url": webhook}])
+    alert_dispatcher.enqueue("cloud_alerts", {"user_id": "u1", "n": 0})
+    for _ in range(dispatcher.BREAKER_FAILURE_THRESHOLD):
+        alert_dispatcher.flush(force=True)
+        assert wait_for(lambda: not alert_dispatcher.channels[("u1", "siem")].in_flight)
+    status = alert_dispatcher.status("u1")[0]
+    assert status["queued"] == 1
+    assert status["breaker"] == "open"
+    alert_dispatcher.stop(timeout=0)
+
+
+def test_invalidate_drops_removed_sinks(webhook):
+    alert_dispatcher, settings = make_dispatcher([{"name": "siem", "type": "webhook", "url": webhook}])
+    alert_dispatcher.enqueue("cloud_alerts", {"user_id": "u1", "n": 0})
+    settings.update_one({"user_id": "u1"}, {"$set": {"alert_sinks": []}})
+    alert_dispatcher.invalidate("u1")
+    assert alert_dispatcher.channels == {}
+    alert_dispatcher.stop(timeout=1)
+    assert Receiver.batches == []
+
+
+@pytest.mark.parametrize("sink", [
+    {"name": "local", "type": "webhook", "url": "http://127.0.0.1:8080/hook"},
+    {"name": "metadata", "type": "webhook", "url": "http://169.254.169.254/latest/meta-data/"},
+    {"name": "private", "type": "syslog", "host": "10.0.0.5"},
+    {"name": "mapped", "type": "webhook", "url": "http://[::ffff:127.0.0.1]/"},
+])
+def test_rejects_internal_sink_addresses(sink):
+    assert "non-public address" in validate_sink(sink)
+
+
+def test_delivery_rechecks_the_address(webhook, monkeypatch):
+    alert_dispatcher, _ = make_dispatcher([{"name": "siem", "type": "webhook", "url": webhook}])
+    alert_dispatcher.enqueue("cloud_alerts", {"user_id": "u1", "n": 0})
+    monkeypatch.setattr(dispatcher, "ALLOW_PRIVATE_SINKS", False)
+    monkeypatch.setattr(dispatcher, "SEND_ATTEMPTS", 1)
+    alert_dispatcher.flush(force=True)
+    assert wait_for(lambda: not alert_dispatcher.channels[("u1", "siem")].in_flight)
+    assert Receiver.batches == []
+    assert "non-public address" in alert_dispatcher.status("u1")[0]["last_error"]
+    alert_dispatcher.stop(timeout=0)
+
+
+def test_changed_sink_keeps_queue_and_closes_after_in_flight_batch(webhook):
+    alert_dispatcher, settings = make_dispatcher([{"name": "siem", "type": "webhook", "url": webhook + "?v=1"}])
+    for n in range(3):
+        alert_dispatcher.enqueue("cloud_alerts", {"user_id": "u1", "n": n})
+    old = alert_dispatcher.channels[("u1", "siem")]
+    old.in_flight = True
+    closed = []
+    old.sink.close = lambda: closed.append(True)
+
+    settings.update_one({"user_id": "u1"}, {"$set": {"alert_sinks": [{"name": "siem", "type": "webhook", "url": webhook}]}})
+    alert_dispatcher.invalidate("u1")
+    assert old.closed and closed == []
+    # The batch in flight still goes out; the old sink is closed once it returns
+    alert_dispatcher._deliver(old, [{"user_id": "u1", "n": 99}])
+    assert closed == [True]
+
+    alert_dispatcher.enqueue("cloud_alerts", {"user_id": "u1", "n": 3})
+    alert_dispatcher.stop(timeout=5)
+    assert sorted(delivered()) == [0, 1, 2, 3, 99]
+    assert alert_dispatcher.channels[("u1", "siem")].config["url"] == webhook
@@ -0,0 +1,73 @@
+import json
+
+import boto3
+import mongomock
+import pytest
+from moto import mock_aws
+
+from alert_store import create_alert_store
+from enrichment import PENDING
+import sqs_consumer
+from sqs_consumer import QueueWorker, SQSConsumer
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    # An empty receive returns at once instead of long-polling
+    monkeypatch.setattr(sqs_consumer, "WAIT_TIME_SECONDS", 0)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        yield boto3.client("sqs", region_name="us-east-1")
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().shakuni
+
+
+def queue_depth(sqs, queue_url):
+    attributes = sqs.get_queue_attributes(
+        QueueUrl=queue_url, AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"]
+    )["Attributes"]
+    return int(attributes["ApproximateNumberOfMessages"]) + int(attributes["ApproximateNumberOfMessagesNotVisible"])
+
+
+def start_worker(db, queue_url):
+    """A worker polled by the test itself rather than its thread."""
+    consumer = SQSConsumer(db.sqsurl, create_alert_store(db, "collections"))
+    return QueueWorker(consumer, "u1", queue_url, "us-east-1")
+
+
+def test_messages_are_stored_then_deleted(aws, db):
+    queue_url = aws.create_queue(QueueName="honeypot")["QueueUrl"]
+    for i in range(12):
+        aws.send_message(QueueUrl=queue_url, MessageBody=json.dumps({"detail": {"eventName": "GetObject", "n": i}}))
+    aws.send_message(QueueUrl=queue_url, MessageBody="not json")
+    worker = start_worker(db, queue_url)
+
+    while worker.poll_once():
+        pass
+
+    alerts = list(db.cloud_alerts.find({"user_id": "u1"}))
+    assert len(alerts) == 13
+    assert all(alert["source"] == "sqs_consumer" and alert["enrichment_status"] == PENDING for alert in alerts)
+    assert sorted(alert["raw_message"]["detail"]["n"] for alert in alerts if isinstance(alert["raw_message"], dict)) == list(range(12))
+    assert "not json" in [alert["raw_message"] for alert in alerts]
+    assert queue_depth(aws, queue_url) == 0
+    assert worker.received == worker.stored == 13
+
+
+def test_failed_write_leaves_messages_on_the_queue(aws, db):
+    queue_url = aws.create_queue(QueueName="honeypot")["QueueUrl"]
+    aws.send_message(QueueUrl=queue_url, MessageBody="{}")
+    worker = start_worker(db, queue_url)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("mongo down")
+    worker.consumer.alert_store.insert_many = fail
+
+    with pytest.raises(RuntimeError):
+        worker.poll_once()
+    assert db.cloud_alerts.count_documents({}) == 0
+    assert queue_depth(aws, queue_url) == 1
@@ -0,0 +1,80 @@
+from functools import lru_cache
+import re
+
+# Distinct user agents remembered; honeypot traffic repeats a small set of scanner UAs
+UA_CACHE_SIZE = 16384
+
+# (class, pattern) in priority order: when a user agent matches several classes the
+# earliest one wins, e.g. "HeadlessChrome" is headless rather than a browser. Office and
+# Outlook clients are people opening a decoy, so link_preview only lists prefetching services.
+UA_CLASSES = [
+    ("scanner", r"nmap|masscan|zgrab|nikto|sqlmap|nuclei|gobuster|dirbuster|feroxbuster|ffuf|wpscan|"
+                r"censysinspect|shodan|expanse|internet-measurement|l9explore|netcraft|odin\.io|"
+                r"zmap|acunetix|nessus|openvas|qualys|burp"),
+    ("link_preview", r"googleimageproxy|yahoomailproxy|bingpreview|facebookexternalhit|slackbot|"
+                     r"slack-imgproxy|twitterbot|linkedinbot|whatsapp|telegrambot|discordbot|"
+                     r"skypeuripreview|mimecast|proofpoint|"
+                     r"barracuda|symantec|applebot|iframely|embedly"),
+    ("headless", r"headlesschrome|phantomjs|puppeteer|playwright|selenium|slimerjs"),
+    ("aws_sdk", r"aws-cli|aws-sdk|boto3|botocore|aws-internal|signin\.amazonaws|console\.amazonaws"),
+    ("cli", r"curl|wget|python-requests|python-urllib|python-httpx|aiohttp|go-http-client|okhttp|"
+            r"libwww-perl|java/|powershell|httpie|axios|node-fetch|undici"),
+    ("crawler", r"googlebot|bingbot|yandex|baiduspider|duckduckbot|ahrefs|semrush|mj12bot|petalbot|"
+                r"crawler|spider|\bbot\b"),
+    # Teams, Slack and Discord desktop clients: people clicking links, not automation
+    ("desktop_app", r"electron"),
+    ("browser", r"edg(?:e|a|ios)?/|opr/|firefox|chrome|crios|safari"),
+]
+
+# One alternation with a named group per class, so a user agent is scanned once
+_UA_PATTERN = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in UA_CLASSES),
+    re.IGNORECASE
+)
+_UA_PRIORITY = {name: index for index, (name, _) in enumerate(UA_CLASSES)}
+
+# Product names for tokens that are not the name itself
+_UA_NAMES = {"edg/": "edge", "edge/": "edge", "edga/": "edge", "edgios/": "edge", "opr/": "opera"}
+# Chromium-based browsers append their own token after Chrome/ and Safari/, so it wins within the class
+_NAME_PRIORITY = {"edge": 0, "opera": 0}
+
+_PLATFORM_PATTERN = re.compile(r"windows|mac os x|iphone|ipad|android|\bcros\b|linux", re.IGNORECASE)
+_PLATFORM_NAMES = {"mac os x": "macos", "cros": "chromeos"}
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def classify_user_agent(user_agent):
+    """
+    Tag a user agent string with its class (scanner, link_preview, headless, aws_sdk,
+    cli, crawler, desktop_app, browser, other or empty) plus the matched product, its
+    version and the platform. Results are memoized per string and must be treated as
+    read-only.
+    """
+    if not user_agent or user_agent == 'Unknown':
+        return {"ua_class": "empty", "ua_name": None, "ua_version": None, "ua_platform": None}
+
+    best_class, best_name, best_end, best_rank = None, None, 0, None
+    for match in _UA_PATTERN.finditer(user_agent):
+        name = match.group().lower()
+        name = _UA_NAMES.get(name, name)
+        rank = (_UA_PRIORITY[match.lastgroup], _NAME_PRIORITY.get(name, 1))
+        if best_rank is None or rank < best_rank:
+            best_class, best_name, best_end, best_rank = match.lastgroup, name, match.end(), rank
+
+    version = None
+    if best_class:
+        version_match = re.match(r"[/ ]?v?(\d[\w.]*)", user_agent[best_end:])
+        if version_match:
+            version = version_match.group(1)
+
+    platform_match = _PLATFORM_PATTERN.search(user_agent)
+    platform = None
+    if platform_match:
+        platform = platform_match.group().lower()
+        platform = _PLATFORM_NAMES.get(platform, platform)
+
+    return {
+        "ua_class": best_class or "other",
+        "ua_name": best_name,
+        "ua_version": version,
+        "ua_platform": platform,
+    }
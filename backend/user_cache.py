@@ -0,0 +1,170 @@
+"""
+Per-user cache of the settings and profile views read on most page loads.
+
+Entries expire after USER_CACHE_TTL_SECONDS and are dropped directly by the routes that
+change them (settings updates and API-key changes). By default every worker keeps its own
+bounded in-process cache, so another worker may serve a changed value until its entry
+expires. With USER_CACHE_URL=redis://... (needs `pip install redis`) all workers share
+one cache and an invalidation is seen by every worker at once.
+
+Only what the views need is cached: API keys are stored as previews, never in full.
+A cache that fails is bypassed, so requests fall back to MongoDB. Returned views may be
+shared with other requests and must be treated as read-only.
+"""
+from bson.objectid import ObjectId
+from collections import OrderedDict
+import json
+import logging
+import os
+import threading
+import time
+
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+REDIS_KEY_PREFIX = "shakuni:user:"
+REDIS_TIMEOUT_SECONDS = 0.5
+
+# Settings fields used by GET /api/settings and the Terraform deploy/destroy routes
+GENERAL_FIELDS = ("terraform_provider", "terraform_s3_bucket", "terraform_gcs_bucket", "terraform_azure_container",
+                  "terraform_azure_storage_account", "terraform_azure_resource_group", "aws_region")
+WEB_HONEYPOT_FIELDS = ("web_honeypot_terraform_provider", "web_honeypot_terraform_s3_bucket",
+                       "web_honeypot_terraform_gcs_bucket", "web_honeypot_terraform_azure_container")
+
+USER_CACHE_LOOKUPS = registry.counter(
+    "shakuni_user_cache_lookups_total", "Settings and profile cache lookups", ("view", "result"))
+
+
+def key_preview(key):
+    return key[:4] + '...' + key[-4:]
+
+
+# --- Backends ---
+class LocalCacheBackend:
+    """Bounded LRU with per-entry expiry, private to this worker."""
+
+    def __init__(self, size=USER_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+
+class RedisCacheBackend:
+    """Shared by every worker; values are JSON."""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=REDIS_TIMEOUT_SECONDS,
+                                           socket_connect_timeout=REDIS_TIMEOUT_SECONDS)
+
+    def get(self, key):
+        value = self.client.get(REDIS_KEY_PREFIX + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.setex(REDIS_KEY_PREFIX + key, ttl, json.dumps(value))
+
+    def delete(self, *keys):
+        self.client.delete(*(REDIS_KEY_PREFIX + key for key in keys))
+
+
+def create_cache_backend(url=None):
+    url = url if url is not None else os.environ.get("USER_CACHE_URL")
+    if url:
+        if redis is None:
+            log.warning("USER_CACHE_URL is set but redis is not installed; using a per-worker cache")
+        else:
+            return RedisCacheBackend(url)
+    return LocalCacheBackend()
+
+
+# --- Cache ---
+class UserCache:
+    def __init__(self, users_collection, settings_collection, web_honeypot_collection, backend, ttl=USER_CACHE_TTL_SECONDS):
+        self.users = users_collection
+        self.settings_collection = settings_collection
+        self.web_honeypot = web_honeypot_collection
+        self.backend = backend
+        self.ttl = ttl
+
+    def _get(self, view, user_id, load):
+        key = f"{view}:{user_id}"
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            log.warning("User cache read failed: %s", e)
+            USER_CACHE_LOOKUPS.inc(view, "error")
+            return load(user_id)
+        if value is not None:
+            USER_CACHE_LOOKUPS.inc(view, "hit")
+            return value
+        USER_CACHE_LOOKUPS.inc(view, "miss")
+        value = load(user_id)
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            log.warning("User cache write failed: %s", e)
+        return value
+
+    def settings(self, user_id):
+        """{"found", "general", "web_honeypot", "api_keys"}; found is False when the user has no settings document."""
+        return self._get("settings", user_id, self._load_settings)
+
+    def profile(self, user_id):
+        """{"id", "username", "email"}; "id" is None for an unknown user (not-found results are cached too)."""
+        return self._get("profile", user_id, self._load_profile)
+
+    def invalidate(self, user_id):
+        """Call after writing a user's settings or API keys."""
+        try:
+            self.backend.delete(f"settings:{user_id}", f"profile:{user_id}")
+        except Exception as e:
+            log.warning("User cache invalidation failed for %s: %s", user_id, e)
+
+    def _load_settings(self, user_id):
+        projection = dict.fromkeys(GENERAL_FIELDS + ("api_keys",), 1)
+        user_settings = self.settings_collection.find_one({"user_id": user_id}, projection)
+        web_honeypot_settings = self.web_honeypot.find_one({"user_id": user_id}, dict.fromkeys(WEB_HONEYPOT_FIELDS, 1)) or {}
+        return {
+            "found": user_settings is not None,
+            "general": {field: (user_settings or {})[field] for field in GENERAL_FIELDS if field in (user_settings or {})},
+            "web_honeypot": {field: web_honeypot_settings[field] for field in WEB_HONEYPOT_FIELDS if field in web_honeypot_settings},
+            "api_keys": [{'name': key['name'], 'key_preview': key_preview(key['key'])}
+                         for key in (user_settings or {}).get('api_keys', [])],
+        }
+
+    def _load_profile(self, user_id):
+        user = self.users.find_one({"_id": ObjectId(user_id)}, {"username": 1, "email": 1})
+        if not user:
+            return {"id": None}
+        return {"id": str(user['_id']), "username": user['username'], "email": user['email']}
@@ -0,0 +1,13 @@
+"""
+Production WSGI entry point.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is created without background services. MongoDB clients and threads are
+not fork-safe, so gunicorn.conf.py resets the data-access layer and starts the
+scheduler, dispatcher, enrichment workers and index build in each worker after fork.
+"""
+from app import create_app
+
+app = create_app(start_background=False)